@@ -4,7 +4,6 @@ import os
 import traceback
 import time
 from datetime import datetime, timezone
-from typing import Optional
 
 from flask import Flask, jsonify, current_app, Blueprint, request
 from flask_cors import CORS
@@ -12,33 +11,23 @@ from flask_jwt_extended import (
     JWTManager, jwt_required, get_jwt_identity, verify_jwt_in_request
 )
 from flask_socketio import SocketIO
-from pymongo import MongoClient
 
 from config import Config
-from db import get_db, close_db, bind_request_db
+from db import get_db, close_db, bind_request_db, apply_schema_all
 from sockets import ChatNamespace
 from mailer import send_email  
 import notify_socket
-
-
-def _bg_db():
-    """
-    Standalone DB client for the background worker.
-    IMPORTANT: read from app.config first so we use the SAME DB as the API.
-    This function must be called inside an app_context.
-    """
-    uri = (
-        current_app.config.get("MONGO_URI")
-        or os.getenv("MONGO_URI")
-        or getattr(Config, "MONGO_URI", "")
-    )
-    dbname = (
-        current_app.config.get("MONGO_DBNAME")
-        or os.getenv("MONGO_DBNAME")
-        or getattr(Config, "MONGO_DBNAME", "study_group_hub")
-    )
-    client = MongoClient(uri, connectTimeoutMS=10000, serverSelectionTimeoutMS=10000)
-    return client[dbname]
+from reminders import reminder_scheduler
+from outbox import enqueue_email, outbox_stats, start_outbox_workers
+from membership import membership_stats, publish_invalidations
+from presence import presence_stats, start_presence_sweeper
+from chat_store import chat_write_stats
+from retention import retention_stats, start_retention_worker
+from file_serving import file_serving_stats
+from resource_index import resource_text_stats, start_resource_text_worker
+from notify_batch import notify_stats, notify_user, start_notify_batcher
+from fanout import make_client_manager
+import wire
 
 
 # -------------------------- blueprint registration ---------------------------
@@ -107,6 +96,14 @@ def _register_blueprints(app: Flask) -> None:
     except Exception as e:
         print("[app] failed to import resources:", e)
 
+    # resumable chunked uploads (resources + chat files)
+    try:
+        from blueprints.uploads import uploads_bp
+        app.register_blueprint(uploads_bp)
+        print("[app] registered uploads blueprint")
+    except Exception as e:
+        print("[app] failed to import uploads:", e)
+
     # gamification / study streaks
     try:
         from blueprints.streaks import streaks_bp
@@ -157,6 +154,21 @@ def _register_blueprints(app: Flask) -> None:
             app.register_blueprint(me_bp)
 
 
+# ---------------------------------- CLI --------------------------------------
+def _register_cli(app: Flask) -> None:
+    """Maintenance commands (run with `flask --app app <command>`)."""
+
+    @app.cli.command("ensure-indexes")
+    def ensure_indexes_cmd():
+        """Apply the collection/index registry to every tenant DB."""
+        workers = int(os.getenv("SCHEMA_WORKERS", "8"))
+        started = time.time()
+        results = apply_schema_all(max_workers=workers)
+        for name, res in results.items():
+            print(f"[schema] {name}: {res}")
+        print(f"[schema] {len(results)} database(s) in {time.time() - started:.2f}s")
+
+
 # ------------------------------- app factory --------------------------------
 def create_app() -> Flask:
     app = Flask(__name__)
@@ -170,8 +182,10 @@ def create_app() -> Flask:
         app,
         resources={r"/api/*": {"origins": [client_origin]}},
         methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
-        allow_headers=["Authorization", "Content-Type"],
-        expose_headers=["Authorization", "Content-Type", "Content-Disposition"],
+        allow_headers=["Authorization", "Content-Type", "Upload-Offset",
+                       "Range", "If-None-Match", "If-Modified-Since", "If-Range"],
+        expose_headers=["Authorization", "Content-Type", "Content-Disposition",
+                        "Content-Length", "Content-Range", "Accept-Ranges", "ETag", "Last-Modified"],
         supports_credentials=False,
     )
 
@@ -204,46 +218,113 @@ def create_app() -> Flask:
             if not sio:
                 return jsonify({"ok": False, "error": "socketio unavailable"}), 500
             payload = {"type": "debug", "text": "pong", "at": datetime.now(timezone.utc).isoformat()}
-            sio.emit("notify", payload, namespace="/ws/chat", to=room)
+            notify_user(sio, uid, "notify", payload)
             print(f"[ws] debug notify -> {room}: {payload}")
             return jsonify({"ok": True}), 200
         except Exception as e:
             return jsonify({"ok": False, "error": str(e)}), 500
 
-    # Debug: quick email sender to verify SMTP credentials
+    # Debug: membership cache counters
+    @app.get("/api/__debug/membership")
+    @jwt_required()
+    def debug_membership_stats():
+        return jsonify({"ok": True, "membership": membership_stats()}), 200
+
+    # Debug: presence / typing store (backend, sizes, TTLs)
+    @app.get("/api/__debug/presence")
+    @jwt_required()
+    def debug_presence_stats():
+        return jsonify({"ok": True, "presence": presence_stats()}), 200
+
+    # Debug: chat write mode / write-behind buffer (depth, batches, blocked senders)
+    @app.get("/api/__debug/chat_writes")
+    @jwt_required()
+    def debug_chat_write_stats():
+        return jsonify({"ok": True, "chatWrites": chat_write_stats()}), 200
+
+    # Debug: retention policy defaults + last run (bytes reclaimed per tenant)
+    @app.get("/api/__debug/retention")
+    @jwt_required()
+    def debug_retention_stats():
+        return jsonify({"ok": True, "retention": retention_stats()}), 200
+
+    # Debug: file downloads (offload mode, 304 / 206 counts)
+    @app.get("/api/__debug/files")
+    @jwt_required()
+    def debug_file_serving_stats():
+        return jsonify({"ok": True, "files": file_serving_stats()}), 200
+
+    # Debug: resource text extraction (pool size, outcomes)
+    @app.get("/api/__debug/resource_text")
+    @jwt_required()
+    def debug_resource_text_stats():
+        return jsonify({"ok": True, "resourceText": resource_text_stats()}), 200
+
+    # Debug: per-user notify batching (frames saved, batches)
+    @app.get("/api/__debug/notify")
+    @jwt_required()
+    def debug_notify_stats():
+        return jsonify({"ok": True, "notify": notify_stats()}), 200
+
+    # Debug: Socket.IO wire formats (msgpack clients, transcoded bytes)
+    @app.get("/api/__debug/wire")
+    @jwt_required()
+    def debug_wire_stats():
+        return jsonify({"ok": True, "wire": wire.wire_stats()}), 200
+
+    # Debug: quick email sender to verify SMTP credentials.
+    # Default: queue through the outbox and report queue depth / send latency.
+    # ?sync=1 sends inline (bypasses the outbox) to see the SMTP error directly.
     @app.get("/api/__debug/send_email")
     @jwt_required(optional=True)
     def __debug_send_email():
         to = request.args.get("to") or current_app.config.get("SMTP_USER")
-        ok, err = send_email(
-            to=to,
-            subject="SGH: Email test ✔",
-            html="""
+        subject = "SGH: Email test ✔"
+        html = """
                 <div style="font-family:system-ui,Segoe UI,Arial;">
                   <h2>Study Group Hub – Email Test</h2>
                   <p>If you can read this, SMTP is working 🎉</p>
                 </div>
-            """,
-            text="Study Group Hub – Email test. If you see this, SMTP works.",
-        )
-        if not ok:
-            return jsonify({"ok": False, "error": err}), 500
-        return jsonify({"ok": True, "sent_to": to}), 200
+            """
+        text = "Study Group Hub – Email test. If you see this, SMTP works."
+
+        if request.args.get("sync") in {"1", "true"}:
+            started = time.time()
+            ok, err = send_email(to=to, subject=subject, html=html, text=text)
+            latency_ms = int((time.time() - started) * 1000)
+            if not ok:
+                return jsonify({"ok": False, "error": err, "latencyMs": latency_ms}), 500
+            return jsonify({"ok": True, "sent_to": to, "latencyMs": latency_ms}), 200
+
+        try:
+            qid = enqueue_email(to=to, subject=subject, html=html, text=text, kind="debug")
+            return jsonify({
+                "ok": bool(qid),
+                "queued_to": to,
+                "id": str(qid) if qid else None,
+                "outbox": outbox_stats(),
+            }), 200 if qid else 400
+        except Exception as e:
+            return jsonify({"ok": False, "error": str(e)}), 500
 
     # Manual trigger to run reminders now (useful for testing)
     @app.post("/api/__debug/reminders_run")
     def __debug_reminders_run():
+        if not reminder_scheduler.started:
+            return jsonify({"ok": False, "error": "the reminder scheduler runs in the background worker process"}), 409
         try:
-            _reminders_tick()
-            return jsonify({"ok": True}), 200
+            reminder_scheduler.seed()
+            sent = reminder_scheduler.run_due()
+            return jsonify({"ok": True, "sent": sent, "pending": reminder_scheduler.pending()}), 200
         except Exception as e:
             return jsonify({"ok": False, "error": str(e)}), 500
 
     # DB lifecycle
     app.teardown_appcontext(close_db)
 
-    # Blueprints
+    # Blueprints (each one registers its collections/indexes with db.py)
     _register_blueprints(app)
+    _register_cli(app)
 
     # ---------------- Uploads (robust) ----------------
     base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -263,110 +344,83 @@ def create_app() -> Flask:
 
 
 # ---------------- App & Socket.IO bootstrap ----------------------------------
+def _async_mode() -> str:
+    """Config.ASYNC_MODE, if the stdlib was monkey-patched for it (serve.py does that)."""
+    mode = (Config.ASYNC_MODE or "threading").strip().lower()
+    if mode not in ("eventlet", "gevent"):
+        return "threading"
+    try:
+        if mode == "eventlet":
+            from eventlet import patcher
+            patched = patcher.is_monkey_patched("socket")
+        else:
+            from gevent import monkey
+            patched = monkey.is_module_patched("socket")
+    except ImportError:
+        patched = False
+    if not patched:
+        print(f"[app] ASYNC_MODE={mode} needs monkey-patching before import (use serve.py); using threading")
+        return "threading"
+    return mode
+
+
 app = create_app()
 
+# SOCKETIO_FANOUT=mongo|memory relays emits between worker processes (see fanout.py)
+_fanout = make_client_manager()
 socketio = SocketIO(
     app,
     cors_allowed_origins="*",
-    async_mode="threading",
+    async_mode=_async_mode(),
     ping_timeout=20,
     ping_interval=25,
+    **({"client_manager": _fanout} if _fanout else {}),
 )
+# clients connecting with a msgpack parser get binary, compact frames (see wire.py)
+wire.install(socketio)
 socketio.on_namespace(ChatNamespace("/ws/chat"))
+notify_socket.register_socket_handlers(socketio)  # typing indicators
 
 with app.app_context():
     current_app.extensions["socketio"] = socketio
 
 
-# -------------------------- Reminder worker ----------------------------------
-def _reminders_tick(now_utc: Optional[datetime] = None):
-    """
-    Send reminder emails for meetings whose reminderAt <= now and not yet sent.
-    meetings.py sets `reminderAt = startAt - 30 min` on ACCEPT.
-    """
-    db = _bg_db()
-    now = now_utc or datetime.now(timezone.utc)
-
-    crit = {
-        "status": "accepted",
-        "reminderSent": {"$ne": True},
-        "reminderAt": {"$ne": None, "$lte": now},
-    }
-    docs = list(db.meetings.find(crit).limit(100))
-    if not docs:
-        return
-
-    from blueprints.meetings import _format_when, _get_user_email  # lazy import
-    sio = current_app.extensions.get("socketio")
-
-    for m in docs:
-        try:
-            slot = m.get("slot") or {}
-            link = m.get("meetingLink")
-            sender_id = str(m.get("senderId"))
-            receiver_id = str(m.get("receiverId"))
-
-            when_text, when_html = _format_when(slot)
-
-            subject = "Reminder: your meeting starts soon"
-            html = f"""
-              <div style="font-family:system-ui,Segoe UI,Arial">
-                <h2>Starting soon</h2>
-                <p>Time: {when_html}</p>
-                {f"<p>Meeting link: <a href='{link}'>{link}</a></p>" if link else ""}
-              </div>
-            """
-            text = f"Starting soon: {when_text}. Link: {link or '(no link)'}"
-
-            # emails
-            try:
-                se = _get_user_email(db, sender_id)
-                re = _get_user_email(db, receiver_id)
-                if se:
-                    send_email(to=se, subject=subject, html=html, text=text)
-                if re:
-                    send_email(to=re, subject=subject, html=html, text=text)
-            except Exception as e:
-                print("[reminder] email error:", e)
-
-            # in-app notifications
-            payload = {
-                "type": "meeting_reminder",
-                "title": "Reminder: upcoming meeting",
-                "slot": slot,
-                "at": now.isoformat(),
-            }
-            try:
-                if sio:
-                    sio.emit("notify", payload, namespace="/ws/chat", to=f"user:{sender_id}")
-                    sio.emit("notify", payload, namespace="/ws/chat", to=f"user:{receiver_id}")
-            except Exception as e:
-                print("[reminder] socket emit error:", e)
-
-            # mark sent
-            db.meetings.update_one({"_id": m["_id"]}, {"$set": {"reminderSent": True}})
-        except Exception as e:
-            print("[reminder] process item error:", e)
-
-
-def _reminder_loop():
-    poll_seconds = int(os.getenv("REMINDER_POLL_SECONDS", "30"))
-    with app.app_context():
-        print("[reminder] worker started (poll =", poll_seconds, "s)")
-        while True:
-            try:
-                _reminders_tick()
-            except Exception as e:
-                print("[reminder] loop error:", e)
-            time.sleep(poll_seconds)
-
-
+# --------------------------- Background workers -----------------------------
+# Event-driven: sleeps until the next reminderAt across all tenant DBs
+# (see reminders.py); meetings.respond_meeting pushes new entries, from
+# other workers over the fan-out bus.
 def start_reminder_worker(flask_app: Flask):
-    socketio.start_background_task(_reminder_loop)
-
-
-# kick off the worker
-start_reminder_worker(app)
+    reminder_scheduler.init_app(flask_app, socketio)
+    reminder_scheduler.start()
+
+
+def start_background_workers() -> None:
+    """App-wide jobs (reminders, email outbox senders, retention, text extraction): one process is enough."""
+    start_reminder_worker(app)
+    start_outbox_workers(socketio)
+    start_retention_worker(socketio, app.config["UPLOAD_DIR"])
+    start_resource_text_worker(socketio, app.config["UPLOAD_DIR"])
+
+
+# The dev reloader imports this file in a watcher process that never serves;
+# only the serving child starts anything.
+_reloader_parent = __name__ == "__main__" and os.environ.get("WERKZEUG_RUN_MAIN") != "true"
+if not _reloader_parent:
+    if _fanout:
+        # listen on the bus from the start (python-socketio would wait for the
+        # first socket): membership invalidations matter to HTTP-only workers too
+        socketio.server.manager_initialized = True
+        _fanout.initialize()
+        publish_invalidations(_fanout.publish_invalidation)
+        # reminders accepted here go to the process that runs the scheduler
+        reminder_scheduler.forward_to(_fanout.publish_reminder)
+    # every serving process heartbeats its own sockets' presence
+    start_presence_sweeper(socketio)
+    # ...and flushes the per-user notify queues it fills
+    start_notify_batcher(socketio)
+    # serve.py sets BACKGROUND_WORKERS=false in all workers but one
+    if Config.BACKGROUND_WORKERS:
+        start_background_workers()
 
 
 # ------------------------------- main ----------------------------------------
@@ -0,0 +1,196 @@
+# backend/benchmarks/bench_async_modes.py
+"""
+Concurrent WebSocket capacity and ack latency per async mode (serve.py).
+
+For each mode a stand-in Socket.IO server is started through serve.py's
+monkey_patch()/serve_app() (one worker, the mode's default connection cap,
+no MongoDB needed). Then --sockets clients connect at once and, once all of
+them are in, every client sends --pings acked "echo" events. The handler
+waits --work-ms before acking, like a handler doing a Mongo round-trip.
+
+    cd backend && pip install -r benchmarks/requirements.txt   # websocket-client; gevent optional
+    python -m benchmarks.bench_async_modes --sockets 500
+
+Reported per mode: sockets connected within --timeout, time to connect them
+all, p50/p99 ack latency with everyone connected, and the server's RSS and
+OS thread count at that point.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+NAMESPACE = "/bench"
+
+
+# ------------------------------ server side -----------------------------------
+def _serve(mode: str, port: int, connections: int, work_ms: float) -> None:
+    import serve
+
+    serve.monkey_patch(mode)  # before flask/socketio are imported
+
+    from flask import Flask
+    from flask_socketio import SocketIO
+
+    app = Flask(__name__)
+    sio = SocketIO(app, async_mode=mode, cors_allowed_origins="*")
+
+    @sio.on("connect", namespace=NAMESPACE)
+    def on_connect(auth=None):
+        return True
+
+    @sio.on("echo", namespace=NAMESPACE)
+    def on_echo(data):
+        sio.sleep(work_ms / 1000.0)  # stand-in for a blocking I/O call
+        return data
+
+    sock = serve.listen("127.0.0.1", port)
+    cap = serve.size_connections(mode, connections)
+    print(f"ready {cap}", flush=True)
+    serve.serve_app(app, mode, sock, cap)
+
+
+def _proc_status(pid: int) -> dict:
+    out = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, val = line.partition(":")
+                if key in ("VmRSS", "Threads"):
+                    out[key] = int(val.split()[0])
+    except OSError:
+        pass
+    return out
+
+
+# ------------------------------ client side -----------------------------------
+def _client(url, timeout, pings, settled, go, results, idx):
+    import websocket
+
+    t0 = time.perf_counter()
+    try:
+        ws = websocket.create_connection(url, timeout=timeout)
+        ws.recv()  # engine.io OPEN
+        ws.send(f"40{NAMESPACE},")
+        while not ws.recv().startswith(f"40{NAMESPACE}"):
+            pass
+    except Exception:
+        settled.release()
+        return
+    connected = time.perf_counter() - t0
+    settled.release()  # connected sockets stay open until everyone is in
+    go.wait()
+
+    lat = []
+    try:
+        for n in range(pings):
+            sent = time.perf_counter()
+            ws.send(f'42{NAMESPACE},{n}["echo",{n}]')
+            while True:
+                msg = ws.recv()
+                if msg == "2":  # engine.io ping
+                    ws.send("3")
+                    continue
+                if msg.startswith(f"43{NAMESPACE},{n}["):
+                    break
+            lat.append(time.perf_counter() - sent)
+    except Exception:
+        pass
+    results[idx] = (connected, lat, ws)
+
+
+def _pct(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def _bench(mode, args, port):
+    import threading
+
+    cmd = [sys.executable, "-m", "benchmarks.bench_async_modes", "--serve", mode,
+           "--port", str(port), "--connections", str(args.connections), "--work-ms", str(args.work_ms)]
+    server = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        cap = int(server.stdout.readline().split()[1])
+        time.sleep(0.3)
+        url = f"ws://127.0.0.1:{port}/socket.io/?EIO=4&transport=websocket"
+        threading.stack_size(256 * 1024)
+        results = [None] * args.sockets
+        settled = threading.Semaphore(0)
+        go = threading.Event()
+        threads = [threading.Thread(target=_client, daemon=True,
+                                    args=(url, args.timeout, args.pings, settled, go, results, i))
+                   for i in range(args.sockets)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        deadline = started + args.timeout + 5
+        for _ in threads:  # every client either connected or gave up
+            if not settled.acquire(timeout=max(0.0, deadline - time.perf_counter())):
+                break
+        connect_s = time.perf_counter() - started
+        status = _proc_status(server.pid)
+        go.set()
+        for t in threads:
+            t.join(args.timeout + args.pings * 5)
+
+        ok = [r for r in results if r]
+        lat = [x for r in ok for x in r[1]]
+        for r in ok:
+            try:
+                r[2].close()
+            except Exception:
+                pass
+        return {
+            "mode": mode, "cap": cap, "connected": len(ok), "connect_s": connect_s,
+            "p50_ms": _pct(lat, 50) * 1000, "p99_ms": _pct(lat, 99) * 1000, "acks": len(lat),
+            "rss_mb": status.get("VmRSS", 0) / 1024, "threads": status.get("Threads", 0),
+        }
+    finally:
+        server.terminate()
+        server.wait(5)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--modes", default="threading,eventlet,gevent")
+    ap.add_argument("--sockets", type=int, default=500)
+    ap.add_argument("--pings", type=int, default=5)
+    ap.add_argument("--work-ms", type=float, default=2.0)
+    ap.add_argument("--connections", type=int, default=0, help="per-worker cap (0 = serve.py default)")
+    ap.add_argument("--timeout", type=float, default=5.0)
+    ap.add_argument("--port", type=int, default=58300)
+    ap.add_argument("--serve", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.serve:
+        _serve(args.serve, args.port, args.connections, args.work_ms)
+        return
+
+    import serve
+
+    rows = []
+    for i, mode in enumerate(m.strip() for m in args.modes.split(",") if m.strip()):
+        if not serve._installed(mode):
+            print(f"{mode}: not installed, skipped")
+            continue
+        rows.append(_bench(mode, args, args.port + i))
+
+    print(f"\n{args.sockets} sockets, {args.pings} acked echoes each, {args.work_ms:g} ms handler I/O\n")
+    print(f"{'mode':<10} {'cap':>5} {'connected':>10} {'connect s':>10} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'RSS MB':>8} {'threads':>8}")
+    for r in rows:
+        print(f"{r['mode']:<10} {r['cap']:>5} {r['connected']:>10} {r['connect_s']:>10.2f} {r['p50_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {r['rss_mb']:>8.1f} {r['threads']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# backend/benchmarks/bench_chat_search.py
+"""
+Chat search latency on one big group (chat_search.py).
+
+Seeds --messages messages (random words from a small study vocabulary, a
+few with file attachments) into one group of a scratch DB, plus --noise
+messages in other groups, applies the schema (text index included) and
+times chat_search.search for a set of queries: the first page, then the
+next two pages by cursor (reported per page).
+
+    cd backend && python -m benchmarks.bench_chat_search --uri mongodb://127.0.0.1:27017
+    python -m benchmarks.bench_chat_search --messages 200000 --rounds 50
+
+The scratch DB (--db) is dropped before and after.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+import chat_search
+from db import apply_schema
+
+VOCAB = (
+    "lecture notes exam midterm final homework assignment deadline quiz lab report project "
+    "meeting tomorrow tonight library room zoom slides chapter problem set solution question "
+    "answer review session group study recursion graph matrix integral derivative proof essay "
+    "draft outline citation reading week monday tuesday friday thanks please share upload"
+).split()
+QUERIES = ["exam", "lecture notes", "recursion proof", "midterm review session", "slides -zoom", "pdf"]
+
+
+def _seed(db, gid, n, noise, batch=5000):
+    rnd = random.Random(7)
+    start = datetime.utcnow() - timedelta(days=365)
+    step = timedelta(days=365) / max(1, n)
+    docs = []
+
+    def _flush():
+        db.group_messages.insert_many(docs, ordered=False)
+        docs.clear()
+
+    for i in range(n + noise):
+        target = gid if i < n else ObjectId()
+        doc = {
+            "groupId": target, "kind": "text", "seq": i + 1,
+            "text": " ".join(rnd.choice(VOCAB) for _ in range(rnd.randint(4, 24))),
+            "from": {"id": ObjectId(), "name": "Bench", "email": "bench@example.edu"},
+            "createdAt": start + step * (i % max(1, n)),
+        }
+        if rnd.random() < 0.03:
+            doc["kind"] = "file"
+            doc["file"] = {"name": f"{rnd.choice(VOCAB)}_{rnd.choice(VOCAB)}.pdf", "size": 1000}
+        docs.append(doc)
+        if len(docs) >= batch:
+            _flush()
+    if docs:
+        _flush()
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--uri", default=os.getenv("MONGO_URI") or "mongodb://127.0.0.1:27017")
+    ap.add_argument("--db", default="sgh_bench_chat_search")
+    ap.add_argument("--messages", type=int, default=100000)
+    ap.add_argument("--noise", type=int, default=50000)
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--limit", type=int, default=20)
+    args = ap.parse_args()
+
+    cli = MongoClient(args.uri)
+    cli.drop_database(args.db)
+    db = cli[args.db]
+    gid = ObjectId()
+    started = time.perf_counter()
+    _seed(db, gid, args.messages, args.noise)
+    apply_schema(db)
+    print(f"seeded {args.messages} + {args.noise} messages, indexed in {time.perf_counter() - started:.1f}s\n")
+
+    print(f"{'query':<24} {'hits/pg':>7} {'p50 ms':>8} {'p99 ms':>8} {'next pg ms':>10}")
+    for q in QUERIES:
+        first, third, hits = [], [], 0
+        for _ in range(args.rounds):
+            t0 = time.perf_counter()
+            rows, nxt = chat_search.search(db, gid, q, args.limit)
+            first.append(time.perf_counter() - t0)
+            hits = len(rows)
+            t0 = time.perf_counter()
+            for _page in range(2):
+                if not nxt:
+                    break
+                rows, nxt = chat_search.search(db, gid, q, args.limit, nxt)
+            third.append(time.perf_counter() - t0)
+        print(f"{q:<24} {hits:>7} {_pct(first, 50) * 1000:>8.1f} {_pct(first, 99) * 1000:>8.1f} "
+              f"{_pct(third, 50) * 1000 / 2:>10.1f}")
+    cli.drop_database(args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# backend/benchmarks/bench_chat_writes.py
+"""
+Sustained chat insert rate per CHAT_WRITE_MODE (chat_store.py).
+
+--threads senders call chat_store.insert_message (seq + insert + sender own-message
+marker, like chat_send) for --seconds into one busy group of a scratch DB,
+then the buffer is flushed and the stored count is checked.
+
+    cd backend && python -m benchmarks.bench_chat_writes --uri mongodb://127.0.0.1:27017
+    python -m benchmarks.bench_chat_writes --threads 32 --seconds 10 --modes sync,async
+
+Reported per mode: messages/second, p50/p99 insert_message latency (what
+the sender waits before it can broadcast), flushes and average batch size.
+The scratch DB (--db) is dropped before every mode.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+import chat_store
+
+
+def _pct(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def _sender(db, gid, stop_at, lat):
+    uid = ObjectId()
+    n = 0
+    while time.perf_counter() < stop_at:
+        doc = {
+            "groupId": gid, "kind": "text", "text": f"message {n}",
+            "from": {"id": uid, "name": "Bench", "email": "bench@example.edu"},
+            "createdAt": datetime.utcnow(),
+        }
+        t0 = time.perf_counter()
+        chat_store.insert_message(db, doc)
+        lat.append(time.perf_counter() - t0)
+        n += 1
+
+
+def _run(mode, cli, args):
+    cli.drop_database(args.db)
+    db = cli[args.db]
+    db.group_messages.create_index([("groupId", 1), ("seq", 1)])
+    db.group_reads.create_index([("userId", 1), ("groupId", 1)])
+    chat_store._ready.clear()
+    writer = chat_store.WriteBehind(mode, flush_ms=args.flush_ms, flush_max=args.flush_max) \
+        if mode != "sync" else None
+    chat_store._writer = writer
+
+    gid = ObjectId()
+    lats = [[] for _ in range(args.threads)]
+    stop_at = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=_sender, args=(db, gid, stop_at, lats[i]))
+               for i in range(args.threads)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    if writer:
+        writer.flush()
+    lat = [x for l in lats for x in l]
+    stored = db.group_messages.count_documents({"groupId": gid})
+    st = writer.stats() if writer else {"flushes": len(lat), "messages": len(lat)}
+    print(f"{mode:<6} {len(lat) / elapsed:>10.0f} {_pct(lat, 50) * 1000:>9.2f} {_pct(lat, 99) * 1000:>9.2f} "
+          f"{st['flushes']:>8} {st['messages'] / max(1, st['flushes']):>8.1f} {stored:>8}/{len(lat)}")
+    chat_store._writer = None
+    cli.drop_database(args.db)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--uri", default=os.getenv("MONGO_URI") or "mongodb://127.0.0.1:27017")
+    ap.add_argument("--db", default="sgh_bench_chat_writes")
+    ap.add_argument("--modes", default="sync,group,async")
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--flush-ms", type=float, default=chat_store.CHAT_FLUSH_MS)
+    ap.add_argument("--flush-max", type=int, default=chat_store.CHAT_FLUSH_MAX)
+    args = ap.parse_args()
+
+    cli = MongoClient(args.uri)
+    print(f"{args.threads} senders x {args.seconds:g}s into one group, flush {args.flush_ms:g} ms / "
+          f"{args.flush_max} msgs\n")
+    print(f"{'mode':<6} {'msg/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'flushes':>8} {'batch':>8} {'stored':>17}")
+    for mode in (m.strip() for m in args.modes.split(",") if m.strip()):
+        _run(mode, cli, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# backend/benchmarks/bench_smtp.py
+"""
+SMTP throughput: one connection per message vs pooled sessions / send_many.
+
+Runs against a local aiosmtpd stand-in server (no real mail is sent):
+
+    cd backend && pip install -r benchmarks/requirements.txt   # aiosmtpd
+    python -m benchmarks.bench_smtp --messages 200
+
+"before" = a fresh connect + LOGIN + QUIT per message (the old mailer.send_email),
+"pooled" = send_email() one at a time over a kept-alive session,
+"send_many" = the whole batch over one session.
+
+Plain SMTP on loopback is the best case for "before"; against a real relay
+every avoided connection also saves the STARTTLS handshake and network RTTs.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import logging
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.smtp import AuthResult
+except ImportError:  # pragma: no cover
+    sys.exit("aiosmtpd is required: pip install -r benchmarks/requirements.txt")
+
+from mailer import SMTPPool
+
+logging.getLogger("mail.log").setLevel(logging.ERROR)  # aiosmtpd chatter
+
+
+class _Sink:
+    def __init__(self):
+        self.count = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.count += 1
+        return "250 OK"
+
+
+def _accept_any(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=True)
+
+
+def _messages(n):
+    return [
+        {"to": f"user{i}@example.com", "subject": f"bench {i}",
+         "html": "<p>hello</p>", "text": "hello"}
+        for i in range(n)
+    ]
+
+
+def _pool(port, **kw):
+    return SMTPPool(host="127.0.0.1", port=port, user="bench", password="bench",
+                    sender="bench@example.com", use_tls=False, debuglevel=0, **kw)
+
+
+def _run(label, fn, n):
+    started = time.perf_counter()
+    results = fn()
+    elapsed = time.perf_counter() - started
+    ok = sum(1 for r, _ in results if r)
+    print(f"{label:<12} {ok:>5}/{n} sent  {elapsed:7.3f}s  {n / elapsed:9.1f} msg/s")
+    return n / elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--messages", type=int, default=200)
+    ap.add_argument("--port", type=int, default=8025)
+    args = ap.parse_args()
+
+    sink = _Sink()
+    controller = Controller(
+        sink, hostname="127.0.0.1", port=args.port,
+        authenticator=_accept_any, auth_require_tls=False,
+    )
+    controller.start()
+
+    # silence the per-message "[mailer] sent" lines
+    devnull = open(os.devnull, "w")
+    real_stdout = sys.stdout
+
+    def quiet(fn):
+        def run():
+            sys.stdout = devnull
+            try:
+                return fn()
+            finally:
+                sys.stdout = real_stdout
+        return run
+
+    msgs = _messages(args.messages)
+    try:
+        before = _pool(args.port, max_messages=1)  # reconnect after every message
+        base = _run("before", quiet(lambda: [before.send(**m) for m in msgs]), len(msgs))
+
+        pooled = _pool(args.port)
+        p = _run("pooled", quiet(lambda: [pooled.send(**m) for m in msgs]), len(msgs))
+
+        batch = _pool(args.port, max_messages=len(msgs))
+        b = _run("send_many", quiet(lambda: batch.send_many(msgs)), len(msgs))
+
+        print(f"\nconnections: before={before.connects} pooled={pooled.connects} send_many={batch.connects}")
+        print(f"speedup vs before: pooled x{p / base:.1f}, send_many x{b / base:.1f}")
+        print(f"server received {sink.count} messages")
+        pooled.close()
+        batch.close()
+    finally:
+        controller.stop()
+        devnull.close()
+
+
+if __name__ == "__main__":
+    main()
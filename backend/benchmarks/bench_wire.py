@@ -0,0 +1,139 @@
+# backend/benchmarks/bench_wire.py
+"""
+Socket.IO wire size and broadcast cost: JSON vs msgpack clients (wire.py).
+
+Runs a python-socketio server in-process with --sockets fake connections in
+one room; the engine.io layer is replaced by a sink that encodes each frame
+the way the websocket transport would and counts its bytes (no network).
+
+    pip install msgpack
+    cd backend && python -m benchmarks.bench_wire --sockets 500
+
+Reported:
+  - bytes per frame for the hot events, JSON vs msgpack + compact keys
+  - server CPU per broadcast to the room with 0%, 50% and 100% msgpack
+    clients (JSON is encoded once per emit; msgpack is transcoded once per
+    emit, not per socket)
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    sys.exit("msgpack is required: pip install msgpack")
+
+import socketio
+
+import wire
+
+NS = "/ws/chat"
+ROOM = "group:66f0c3a1e4b0a1b2c3d4e5f6"
+
+
+def _samples():
+    gid, uid, mid = "66f0c3a1e4b0a1b2c3d4e5f6", "66f0c39be4b0a1b2c3d4e001", "670112aa9f1e2d3c4b5a6978"
+    at = datetime.utcnow().isoformat() + "Z"
+    return {
+        # sockets._serialize_msg
+        "group_message": {
+            "id": mid, "groupId": gid, "userId": uid,
+            "user": {"_id": uid, "name": "Priya Raman", "email": "priya.raman@university.edu"},
+            "text": "Can someone share the notes from Tuesday's lecture?",
+            "createdAt": at, "seq": 1842,
+        },
+        "presence_delta": {
+            "groupId": gid,
+            "joined": [{"_id": uid, "name": "Priya Raman", "email": "priya.raman@university.edu", "lastSeen": at}],
+            "left": [], "typing": [{"userId": uid, "name": "Priya Raman"}], "stoppedTyping": [],
+        },
+        "notify": {"type": "meeting_reminder", "text": "Meeting with Priya starts in 15 minutes",
+                   "meetingId": mid, "at": at},
+    }
+
+
+class _Sink:
+    """Stands in for engineio.Server.send_packet: encodes frames and counts bytes."""
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    def __call__(self, eio_sid, pkt):
+        data = pkt.encode()
+        self.frames += 1
+        self.bytes += len(data.encode("utf-8") if isinstance(data, str) else data)
+
+
+def _server(sockets: int, msgpack_share: float):
+    sio = socketio.Server(async_mode="threading")
+    wire.install(sio)
+
+    @sio.on("connect", namespace=NS)
+    def on_connect(sid, environ, auth=None):
+        sio.enter_room(sid, ROOM, namespace=NS)
+
+    sink = _Sink()
+    sio.eio.send_packet = sink
+    n_msgpack = int(round(sockets * msgpack_share))
+    for i in range(sockets):
+        eio_sid = f"eio{i}"
+        sio._handle_eio_connect(eio_sid, {})
+        if i < n_msgpack:
+            sio._handle_eio_message(eio_sid, msgpack.packb({"type": 0, "nsp": NS}))
+        else:
+            sio._handle_eio_message(eio_sid, f"0{NS},")
+    sink.frames = sink.bytes = 0  # drop the CONNECT acks
+    return sio, sink
+
+
+def _frame_sizes():
+    sio, sink = _server(2, 0.5)  # eio0 = msgpack, eio1 = JSON
+    print(f"{'event':<16} {'JSON B':>8} {'msgpack B':>10} {'ratio':>6}")
+    for event, payload in _samples().items():
+        sizes = {}
+
+        def record(eio_sid, pkt, _sizes=sizes):
+            data = pkt.encode()
+            _sizes[eio_sid] = len(data.encode("utf-8") if isinstance(data, str) else data)
+
+        sio.eio.send_packet = record
+        sio.emit(event, payload, to=ROOM, namespace=NS)
+        print(f"{event:<16} {sizes['eio1']:>8} {sizes['eio0']:>10} {sizes['eio0'] / sizes['eio1']:>6.2f}")
+
+
+def _broadcasts(label, sockets, share, rounds, payload):
+    sio, sink = _server(sockets, share)
+    started = time.process_time()
+    for _ in range(rounds):
+        sio.emit("group_message", payload, to=ROOM, namespace=NS)
+    cpu = time.process_time() - started
+    print(f"{label:<10} {cpu / rounds * 1000:>10.2f} {cpu / rounds / sockets * 1e6:>10.2f} "
+          f"{sink.bytes / sink.frames:>10.1f} {sink.bytes / rounds / 1024:>10.1f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sockets", type=int, default=500)
+    ap.add_argument("--rounds", type=int, default=200)
+    args = ap.parse_args()
+
+    _frame_sizes()
+
+    payload = _samples()["group_message"]
+    print(f"\ngroup_message broadcast to {args.sockets} sockets, {args.rounds} rounds\n")
+    print(f"{'clients':<10} {'ms/bcast':>10} {'us/socket':>10} {'B/frame':>10} {'KiB/bcast':>10}")
+    _broadcasts("json", args.sockets, 0.0, args.rounds, payload)
+    _broadcasts("mixed", args.sockets, 0.5, args.rounds, payload)
+    _broadcasts("msgpack", args.sockets, 1.0, args.rounds, payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+# backend/blob_store.py
+"""
+Content-addressed store for uploaded files.
+
+Every file is kept once, under its SHA-256:
+
+    UPLOAD_DIR/blobs/<h[0:2]>/<h[2:4]>/<h>
+
+(two shard levels keep each directory small however many files there
+are). The hash is computed while the upload is copied to a staging file
+(save_stream), or by upload_sessions.verify for resumable uploads, and
+adopt() then renames the staging file into place, or drops it when the
+same bytes are already stored.
+
+References live in each tenant DB:
+
+    resources    {type: "file", sha256, size}
+    blob_names   {_id: "<gid>/<stored_name>", groupId, sha256, size}
+                 one per chat file; /api/groups/file/<gid>/<stored_name>
+                 keeps its URL and resolves through it
+    blobs        {_id: sha256, size, refs}   refs = references above
+
+ref()/unref() keep `refs` in step (recount() rebuilds it). gc() deletes a
+blob only when no tenant references it and it has not been touched for
+BLOB_GC_GRACE_HOURS; adopt() touches an existing blob when it dedups onto
+it, so an upload whose reference is not recorded yet keeps its bytes.
+
+Files stored before the blob store (UPLOAD_DIR/<oid>.<ext> for resources,
+UPLOAD_DIR/<gid>/<uuid>_<name> for chat) are served from there until
+
+    cd backend && python -m blob_store migrate [--db NAME] [--uploads DIR]
+
+rehashes them, moves them into the store (collapsing duplicates) and
+reports the bytes saved per tenant. `stats` and `gc` are the other commands.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING
+
+import upload_sessions
+from db import all_db_names, client, ensure_schema, register_collection
+
+BLOB_GC_GRACE_HOURS = float(os.getenv("BLOB_GC_GRACE_HOURS", "24"))
+
+BLOB_DIR = "blobs"
+_IO_BLOCK = 1024 * 1024
+
+register_collection("blobs", [("refs", ASCENDING)])
+register_collection("blob_names", [("groupId", ASCENDING)], [("sha256", ASCENDING)])
+
+
+def path_for(upload_dir: str, sha256: str) -> str:
+    return os.path.join(upload_dir, BLOB_DIR, sha256[:2], sha256[2:4], sha256)
+
+
+def exists(upload_dir: str, sha256: str) -> bool:
+    return bool(sha256) and os.path.isfile(path_for(upload_dir, sha256))
+
+
+def resource_path(upload_dir: str, r: dict) -> str:
+    """Where a file resource's bytes are: the store, or UPLOAD_DIR/<diskName> until migrated."""
+    if not r.get("diskName") and r.get("sha256"):
+        return path_for(upload_dir, r["sha256"])
+    return os.path.join(upload_dir, r.get("diskName") or "")
+
+
+# -------------------------------- writing -------------------------------------
+def adopt(upload_dir: str, src: str, sha256: str) -> bool:
+    """Move src (whose SHA-256 is sha256) into the store. False if it was already there."""
+    dst = path_for(upload_dir, sha256)
+    try:
+        os.utime(dst)  # dedup: keep gc() off the blob until our reference is recorded
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        os.replace(src, dst)
+        return True
+    os.remove(src)
+    return False
+
+
+def save_stream(upload_dir: str, stream) -> Tuple[str, int]:
+    """Copy stream into the store, hashing on the way. Returns (sha256, size)."""
+    tmp = upload_sessions.staging_path(upload_dir, uuid.uuid4().hex)
+    h = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp, "wb") as fh:
+            for block in iter(lambda: stream.read(_IO_BLOCK), b""):
+                h.update(block)
+                fh.write(block)
+                size += len(block)
+        sha256 = h.hexdigest()
+        adopt(upload_dir, tmp, sha256)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return sha256, size
+
+
+# ------------------------------- references -----------------------------------
+def ref(db, sha256: str, size: int, n: int = 1) -> None:
+    now = datetime.utcnow()
+    db.blobs.update_one(
+        {"_id": sha256},
+        {"$inc": {"refs": n}, "$set": {"size": size, "lastRefAt": now}, "$setOnInsert": {"createdAt": now}},
+        upsert=True,
+    )
+
+
+def unref(db, sha256: str, n: int = 1) -> None:
+    db.blobs.update_one({"_id": sha256}, {"$inc": {"refs": -n}})
+
+
+def _name_id(gid, stored_name: str) -> str:
+    return f"{gid}/{stored_name}"
+
+
+def name_ref(db, gid_oid, stored_name: str, sha256: str, size: int) -> None:
+    """Point the chat file UPLOAD_DIR/<gid>/<stored_name> at a blob."""
+    db.blob_names.insert_one({
+        "_id": _name_id(gid_oid, stored_name),
+        "groupId": gid_oid,
+        "sha256": sha256,
+        "size": size,
+        "createdAt": datetime.utcnow(),
+    })
+    ref(db, sha256, size)
+
+
+def resolve_name(db, gid_oid, stored_name: str) -> Optional[str]:
+    doc = db.blob_names.find_one({"_id": _name_id(gid_oid, stored_name)}, {"sha256": 1})
+    return doc["sha256"] if doc else None
+
+
+def drop_groups(db, gids: Iterable) -> int:
+    """Release the chat-file references of deleted groups. Returns #names dropped."""
+    q = {"groupId": {"$in": list(gids)}}
+    counts: Dict[str, int] = {}
+    for doc in db.blob_names.find(q, {"sha256": 1}):
+        counts[doc["sha256"]] = counts.get(doc["sha256"], 0) + 1
+    for sha256, n in counts.items():
+        unref(db, sha256, n)
+    return db.blob_names.delete_many(q).deleted_count if counts else 0
+
+
+def recount(db) -> int:
+    """Rebuild blobs.refs from resources + blob_names. Returns #blobs whose count changed."""
+    counts: Dict[str, list] = {}
+    sources = (
+        (db.resources, {"type": "file", "sha256": {"$exists": True}, "diskName": {"$exists": False}}),
+        (db.blob_names, {}),
+    )
+    for coll, q in sources:
+        for row in coll.aggregate([
+            {"$match": q},
+            {"$group": {"_id": "$sha256", "n": {"$sum": 1}, "size": {"$max": "$size"}}},
+        ]):
+            c = counts.setdefault(row["_id"], [0, row.get("size") or 0])
+            c[0] += row["n"]
+    changed = 0
+    for doc in db.blobs.find({}, {"refs": 1}):
+        n = counts.get(doc["_id"], [0])[0]
+        if doc.get("refs") != n:
+            db.blobs.update_one({"_id": doc["_id"]}, {"$set": {"refs": n}})
+            changed += 1
+    known = set(db.blobs.distinct("_id"))
+    for sha256, (n, size) in counts.items():
+        if sha256 not in known:
+            ref(db, sha256, size, n)
+            changed += 1
+    return changed
+
+
+def stats(db) -> dict:
+    """Bytes the tenant's references point at vs bytes its distinct blobs take."""
+    rows = list(db.blobs.aggregate([
+        {"$match": {"refs": {"$gt": 0}}},
+        {"$group": {
+            "_id": None,
+            "blobs": {"$sum": 1},
+            "refs": {"$sum": "$refs"},
+            "logicalBytes": {"$sum": {"$multiply": ["$refs", "$size"]}},
+            "storedBytes": {"$sum": "$size"},
+        }},
+    ]))
+    out = {"blobs": 0, "refs": 0, "logicalBytes": 0, "storedBytes": 0}
+    if rows:
+        out.update({k: int(rows[0][k]) for k in out})
+    out["savedBytes"] = out["logicalBytes"] - out["storedBytes"]
+    return out
+
+
+# ------------------------------ collection ------------------------------------
+def gc(upload_dir: str, grace_hours: float = BLOB_GC_GRACE_HOURS) -> dict:
+    """Delete blobs no tenant references. Only meaningful after looking at every DB."""
+    out = {"files": 0, "bytes": 0}
+    root = os.path.join(upload_dir or "", BLOB_DIR)
+    if not upload_dir or not os.path.isdir(root):
+        return out
+    live = set()
+    for name in all_db_names():
+        db = client()[name]
+        live.update(db.blobs.distinct("_id", {"refs": {"$gt": 0}}))
+        db.blobs.delete_many({"refs": {"$lte": 0}})
+    cutoff = time.time() - grace_hours * 3600
+    for folder, _dirs, files in os.walk(root):
+        for name in files:
+            if name in live:
+                continue
+            path = os.path.join(folder, name)
+            try:
+                st = os.stat(path)
+                if st.st_mtime < cutoff:
+                    os.remove(path)
+                    out["files"] += 1
+                    out["bytes"] += st.st_size
+            except OSError:
+                pass
+    return out
+
+
+# ------------------------------- migration ------------------------------------
+def _migrate_file(upload_dir: str, path: str, report: dict) -> Tuple[str, int]:
+    sha256 = upload_sessions.sha256_file(path)
+    size = os.path.getsize(path)
+    if adopt(upload_dir, path, sha256):
+        report["storedBytes"] += size
+    report["files"] += 1
+    report["bytes"] += size
+    return sha256, size
+
+
+def migrate_tenant(db, upload_dir: str) -> dict:
+    """Move this tenant's pre-blob-store files into the store."""
+    report = {"files": 0, "bytes": 0, "storedBytes": 0, "missing": 0}
+
+    for r in db.resources.find({"type": "file", "diskName": {"$exists": True}}, {"diskName": 1}):
+        path = os.path.join(upload_dir, r["diskName"] or "")
+        if not r["diskName"] or not os.path.isfile(path):
+            report["missing"] += 1
+            continue
+        sha256, size = _migrate_file(upload_dir, path, report)
+        db.resources.update_one({"_id": r["_id"]}, {"$set": {"sha256": sha256, "size": size},
+                                                   "$unset": {"diskName": ""}})
+        ref(db, sha256, size)
+
+    for gid in db.study_groups.distinct("_id"):
+        folder = os.path.join(upload_dir, str(gid))
+        if not isinstance(gid, ObjectId) or not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if name.startswith(".") or not os.path.isfile(path) or resolve_name(db, gid, name):
+                continue
+            sha256, size = _migrate_file(upload_dir, path, report)
+            name_ref(db, gid, name, sha256, size)
+        try:
+            os.rmdir(folder)  # only succeeds once it is empty
+        except OSError:
+            pass
+
+    recount(db)
+    report["savedBytes"] = report["bytes"] - report["storedBytes"]
+    report["store"] = stats(db)
+    return report
+
+
+def migrate(db_names=None, upload_dir: Optional[str] = None) -> dict:
+    tenants: Dict[str, dict] = {}
+    for name in db_names or all_db_names():
+        try:
+            rep = migrate_tenant(ensure_schema(client()[name]), upload_dir)
+            tenants[name] = rep
+            print(f"[blobs] {name}: {rep['files']} files ({rep['bytes']} bytes) moved, "
+                  f"{rep['savedBytes']} bytes saved by dedup, {rep['missing']} missing")
+        except Exception as e:
+            tenants[name] = {"error": str(e)}
+            print(f"[blobs] {name} failed:", e)
+    return {
+        "tenants": tenants,
+        "savedBytes": sum(t.get("savedBytes", 0) for t in tenants.values()),
+    }
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("command", choices=["migrate", "stats", "gc"])
+    ap.add_argument("--db", action="append", help="database name (repeatable; default: every tenant DB)")
+    ap.add_argument("--uploads", default=os.getenv("UPLOAD_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "uploads"))
+    args = ap.parse_args(argv)
+
+    if args.command == "migrate":
+        out = migrate(args.db, args.uploads)
+        print(f"[blobs] {out['savedBytes']} bytes saved in total")
+    elif args.command == "gc":
+        out = gc(args.uploads)
+        print(f"[blobs] {out['files']} unreferenced blobs deleted, {out['bytes']} bytes")
+    else:
+        for name in args.db or all_db_names():
+            print(f"[blobs] {name}: {stats(ensure_schema(client()[name]))}")
+
+
+if __name__ == "__main__":
+    main()
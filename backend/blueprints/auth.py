@@ -8,7 +8,7 @@ from flask_jwt_extended import create_access_token
 from werkzeug.security import generate_password_hash, check_password_hash
 from pymongo.errors import DuplicateKeyError, PyMongoError
 
-from db import get_db, db_for_email, ensure_user_indexes
+from db import get_db, db_for_email
 from helpers import university_from_email
 from mailer import send_email
 
@@ -20,11 +20,6 @@ STRONG_PASS_RE = re.compile(
 )
 
 
-def ensure_indexes(db):
-    """Idempotent index creation (kept for local use)."""
-    db.users.create_index("email", unique=True)
-
-
 def send_password_reset_email(to_email: str, code: str):
     """
     Helper that uses mailer.send_email() to send a reset-code email.
@@ -105,9 +100,7 @@ def signup():
             return jsonify({"ok": False, "error": "Current semester is required"}), 400
 
         # ---- Use tenant-specific DB ----
-        db = db_for_email(email)
-        ensure_indexes(db)
-        ensure_user_indexes(db)  # keep your global helper too
+        db = db_for_email(email)  # users.email unique index applied by db.ensure_schema
 
         doc = {
             "fullName": fullName,
@@ -144,7 +144,7 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
-from db import get_db
+from db import get_db, register_collection
 from datetime import datetime, date as D
 from zoneinfo import ZoneInfo
 
@@ -172,13 +172,13 @@ def _normalize_hhmm(s: str) -> str | None:
     except Exception:
         return None
 
-def _ensure_indexes(db):
-    if "availabilities" not in db.list_collection_names():
-        db.create_collection("availabilities")
-    db.availabilities.create_index([("userId", 1)], background=True)
-    db.availabilities.create_index([("userId_oid", 1)], background=True)
-    db.availabilities.create_index([("slot.date", 1)], background=True)
-    db.availabilities.create_index([("createdAt", -1)], background=True)
+register_collection(
+    "availabilities",
+    [("userId", 1)],
+    [("userId_oid", 1)],
+    [("slot.date", 1)],
+    [("createdAt", -1)],
+)
 
 def _validate_slot(payload):
     """
@@ -224,7 +224,6 @@ def _validate_slot(payload):
 @jwt_required()
 def add_availability():
     db = get_db()
-    _ensure_indexes(db)
 
     uid_raw = get_jwt_identity()
     data = request.get_json() or {}
@@ -275,7 +274,6 @@ def _filter_future(items, include_past: bool):
 @jwt_required()
 def list_availability():
     db = get_db()
-    _ensure_indexes(db)
 
     include_past = request.args.get("include_past") == "1"
     uid_raw = get_jwt_identity()
@@ -302,7 +300,6 @@ def list_availability():
 @jwt_required()
 def list_availability_of_user(user_id):
     db = get_db()
-    _ensure_indexes(db)
 
     include_past = request.args.get("include_past") == "1"
     oid = _as_oid(user_id)
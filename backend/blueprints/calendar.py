@@ -9,7 +9,7 @@ from flask import Blueprint, jsonify, request, Response, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
 
-from db import get_db
+from db import get_db, register_collection
 
 calendar_bp = Blueprint("calendar_bp", __name__, url_prefix="/api/calendar")
 
@@ -32,15 +32,7 @@ def _abs_base_url() -> str:
         return "http://localhost:5050"
 
 
-def _ensure_users(db):
-    if "users" not in db.list_collection_names():
-        db.create_collection("users")
-    # indexes are optional; harmless if dup
-    try:
-        db.users.create_index([("id", 1)], background=True)
-        db.users.create_index([("calendarToken", 1)], background=True, unique=False)
-    except Exception:
-        pass
+register_collection("users", [("id", 1)], [("calendarToken", 1)])
 
 
 @calendar_bp.get("/token")
@@ -52,7 +44,6 @@ def get_or_create_token():
     """
     try:
         db = get_db()
-        _ensure_users(db)
 
         uid = str(get_jwt_identity())
         uoid = _as_oid(uid)
@@ -102,9 +93,6 @@ def calendar_feed(token: str):
     """
     try:
         db = get_db()
-        if "users" not in db.list_collection_names():
-            return Response("Not configured", status=404)
-
         user = db.users.find_one({"calendarToken": token})
         if not user:
             return Response("Not found", status=404)
@@ -6,7 +6,8 @@ from bson import ObjectId
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
-from db import get_db
+from db import get_db, register_collection
+from helpers import current_user
 
 discussions_bp = Blueprint("discussions", __name__, url_prefix="/api/discussions")
 
@@ -22,8 +23,7 @@ def _get_me():
     uid = get_jwt_identity()
     if not uid:
         return None, None, None
-    db = get_db()
-    user = db.users.find_one({"_id": _oid(uid)}, {"name": 1, "email": 1})
+    user = current_user(get_db())
     name = (user or {}).get("name") or ""
     email = (user or {}).get("email") or ""
     return str(uid), name, email
@@ -45,18 +45,11 @@ def _thread_projection():
     }
 
 
-def _ensure_indexes(db):
-    """Indexes for faster lookups."""
-    try:
-        db.discussion_threads.create_index([("groupId", 1), ("updatedAt", -1)])
-    except Exception:
-        pass
-    try:
-        db.discussion_seen.create_index(
-            [("userId", 1), ("groupId", 1)], unique=True
-        )
-    except Exception:
-        pass
+# Indexes for faster lookups (applied once per tenant DB by db.ensure_schema).
+register_collection("discussion_threads", [("groupId", 1), ("updatedAt", -1)])
+register_collection(
+    "discussion_seen", ([("userId", 1), ("groupId", 1)], {"unique": True})
+)
 
 
 def _build_tree(flat: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -102,7 +95,6 @@ def _build_tree(flat: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
 @jwt_required()
 def list_threads():
     db = get_db()
-    _ensure_indexes(db)
     gid = request.args.get("group_id", "").strip()
     if not _oid(gid):
         return jsonify([]), 200
@@ -158,7 +150,6 @@ def list_threads():
 @jwt_required()
 def create_thread():
     db = get_db()
-    _ensure_indexes(db)
 
     uid, name, email = _get_me()
     data = request.get_json(silent=True) or {}
@@ -381,7 +372,6 @@ def replies_summary_for_me():
       { userId, groupId, lastSeenAt }
     """
     db = get_db()
-    _ensure_indexes(db)
     uid = str(get_jwt_identity() or "")
     if not uid:
         return jsonify([]), 200
@@ -476,7 +466,6 @@ def mark_replies_seen():
     /replies/unread will ignore older replies.
     """
     db = get_db()
-    _ensure_indexes(db)
     uid = str(get_jwt_identity() or "")
     if not uid:
         return jsonify({"ok": False, "error": "no_user"}), 401
@@ -514,7 +503,6 @@ def points_summary_for_me():
       +1 point per upvote on the user's threads
     """
     db = get_db()
-    _ensure_indexes(db)
     uid = str(get_jwt_identity() or "")
     if not uid:
         return jsonify({"ok": False, "error": "no_user"}), 401
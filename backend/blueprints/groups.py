@@ -1,16 +1,27 @@
 from datetime import datetime, timezone
+import mimetypes
 import os
 import uuid
 
-from flask import Blueprint, jsonify, request, current_app, send_from_directory
+from flask import Blueprint, Response, jsonify, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
-from pymongo import ASCENDING, DESCENDING, TEXT
-from pymongo.errors import OperationFailure, PyMongoError
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
-from db import get_db
+from db import get_db, register_collection
 from helpers import current_user  # <-- shared helper (tenant-safe)
+from membership import group_members as member_ids, invalidate_group  # group_members is also a route below
+import blob_store
+import chat_archive
+import chat_buckets
+import chat_export
+import chat_search
+from chat_store import CHAT_STORAGE, insert_message, mark_read, seq_of, unread_counts
+from file_serving import send_stored
+from notify_batch import notify_user
 
 groups_bp = Blueprint("groups", __name__, url_prefix="/api/groups")
 
@@ -32,43 +43,29 @@ def get_socketio():
 
 
 # ---------- collections + indexes -------------------------------------------
-def _safe_create_index(coll, keys, **opts):
-    """Create an index; ignore IndexOptionsConflict (code 85)."""
-    try:
-        coll.create_index(keys, **opts)
-    except OperationFailure as e:
-        if getattr(e, "code", None) == 85:
-            return
-        raise
-
-
-def ensure_group_collection(db):
-    """Create study_groups if missing; ensure indexes (and chat indexes)."""
-    if "study_groups" not in db.list_collection_names():
-        db.create_collection("study_groups")
-    coll = db.study_groups
-    _safe_create_index(coll, [("ownerId", ASCENDING)])
-    _safe_create_index(coll, [("members._id", ASCENDING)])
-    _safe_create_index(coll, [("isOpen", ASCENDING), ("createdAt", DESCENDING)])
-    _safe_create_index(coll, [("department", ASCENDING)])  # department scoping
-    try:
-        _safe_create_index(coll, [("title", TEXT), ("course", TEXT)])
-    except Exception:
-        pass
-
-    # --- chat collection + indexes
-    if "group_messages" not in db.list_collection_names():
-        db.create_collection("group_messages")
-    _safe_create_index(db.group_messages, [("groupId", ASCENDING), ("createdAt", ASCENDING)], background=True)
-
-
-def ensure_notifications_collection(db):
-    """Create notifications if missing; ensure indexes."""
-    if "notifications" not in db.list_collection_names():
-        db.create_collection("notifications")
-    coll = db.notifications
-    _safe_create_index(coll, [("userId", ASCENDING), ("createdAt", DESCENDING)])
-    _safe_create_index(coll, [("userId", ASCENDING), ("read", ASCENDING)])
+# Applied once per tenant DB by db.ensure_schema (see db.register_collection).
+register_collection(
+    "group_messages",
+    # keyset pagination: (createdAt, _id) sort served straight from the index;
+    # also serves {groupId, createdAt} lookups and sorts in either direction
+    [("groupId", ASCENDING), ("createdAt", ASCENDING), ("_id", ASCENDING)],
+)
+register_collection(
+    "group_reads",
+    ([("userId", ASCENDING), ("groupId", ASCENDING)], {"unique": True}),
+    [("updatedAt", DESCENDING)],
+)
+register_collection(
+    "notifications",
+    [("userId", ASCENDING), ("createdAt", DESCENDING)],
+    [("userId", ASCENDING), ("read", ASCENDING)],
+    [("read", ASCENDING)],
+)
+register_collection(
+    "meeting_polls",
+    [("groupId", ASCENDING), ("createdAt", DESCENDING)],
+    [("slots.id", ASCENDING)],
+)
 
 
 # ---------- helpers ----------------------------------------------------------
@@ -115,22 +112,17 @@ def serialize_notification(doc):
     }
 
 
-def _is_member_or_owner(group_doc, uid):
+def _membership_error(db, gid, uid, forbidden_msg):
     """
-    True if uid is owner or in members. Accepts ObjectId or string.
+    Cached membership guard (see membership.py).
+    Returns a (response, status) tuple to send back, or None if uid may proceed.
     """
-    if not group_doc or not uid:
-        return False
-    uid_str = str(uid)
-    if str(group_doc.get("ownerId")) == uid_str:
-        return True
-    for m in group_doc.get("members", []) or []:
-        if str(m.get("_id")) == uid_str:
-            return True
-    for mid in group_doc.get("memberIds", []) or []:
-        if str(mid) == uid_str:
-            return True
-    return False
+    ids = member_ids(db, gid)
+    if ids is None:
+        return jsonify({"ok": False, "error": "Group not found"}), 404
+    if str(uid) not in ids:
+        return jsonify({"ok": False, "error": forbidden_msg}), 403
+    return None
 
 
 # ---------- MY GROUPS --------------------------------------------------------
@@ -139,7 +131,6 @@ def _is_member_or_owner(group_doc, uid):
 def list_groups():
     try:
         db = get_db()
-        ensure_group_collection(db)
 
         uid = oid(get_jwt_identity())
         if not uid:
@@ -203,7 +194,6 @@ def list_groups():
 def create_group():
     try:
         db = get_db()
-        ensure_group_collection(db)
 
         user = current_user(db)
         if not user:
@@ -232,6 +222,7 @@ def create_group():
         }
 
         ins = db.study_groups.insert_one(doc)
+        invalidate_group(db, ins.inserted_id)
         created = db.study_groups.find_one({"_id": ins.inserted_id})
         ser = serialize_group(created)
         ser["isOwner"] = True
@@ -250,7 +241,6 @@ def browse_groups():
     """Return public info for open groups in the viewer's department."""
     try:
         db = get_db()
-        ensure_group_collection(db)
 
         viewer = current_user(db)
         if not viewer:
@@ -303,7 +293,6 @@ def get_group(gid):
     """Full details for members/owners; counts only for non-members."""
     try:
         db = get_db()
-        ensure_group_collection(db)
 
         uid_str = get_jwt_identity()
         uid = oid(uid_str)
@@ -347,7 +336,6 @@ def get_group(gid):
 def request_join(gid):
     try:
         db = get_db()
-        ensure_group_collection(db)
 
         user = current_user(db)
         if not user:
@@ -380,7 +368,6 @@ def request_join(gid):
 
         db.study_groups.update_one({"_id": _gid}, {"$addToSet": {"joinRequests": req}})
 
-        ensure_notifications_collection(db)
         db.notifications.insert_one(
             {
                 "userId": group["ownerId"],
@@ -413,7 +400,7 @@ def request_join(gid):
                     },
                     "requestedAt": datetime.utcnow().isoformat() + "Z",
                 }
-                sio.emit("notify", payload, namespace="/ws/chat", to=room)
+                notify_user(sio, owner_id, "notify", payload)
                 print(f"[ws] notify → {room}: {payload}")
         except Exception as e:
             print("[ws] notify error (request_join):", e)
@@ -429,7 +416,6 @@ def request_join(gid):
 def list_requests(gid):
     try:
         db = get_db()
-        ensure_group_collection(db)
 
         user = current_user(db)
         if not user:
@@ -466,8 +452,6 @@ def list_requests(gid):
 def approve_request(gid, uid):
     try:
         db = get_db()
-        ensure_group_collection(db)
-        ensure_notifications_collection(db)
 
         owner = current_user(db)
         if not owner:
@@ -495,6 +479,7 @@ def approve_request(gid, uid):
             {"$addToSet": {"members": member_doc}, "$set": {"joinRequests.$[r].status": "approved"}},
             array_filters=[{"r.userId": _uid, "r.status": "pending"}],
         )
+        invalidate_group(db, _gid)
         print(
             f"[api] approve DB: matched={result.matched_count} modified={result.modified_count} gid={_gid} uid={_uid}"
         )
@@ -510,7 +495,7 @@ def approve_request(gid, uid):
                     "title": group.get("title") or "Study group",
                     "approvedAt": datetime.utcnow().isoformat() + "Z",
                 }
-                sio.emit("notify", payload, namespace="/ws/chat", to=room)
+                notify_user(sio, _uid, "notify", payload)
                 print(f"[ws] notify → {room}: {payload}")
         except Exception as e:
             print("[ws] notify error (approve):", e)
@@ -538,8 +523,6 @@ def approve_request(gid, uid):
 def reject_request(gid, uid):
     try:
         db = get_db()
-        ensure_group_collection(db)
-        ensure_notifications_collection(db)
 
         owner = current_user(db)
         if not owner:
@@ -573,7 +556,7 @@ def reject_request(gid, uid):
                     "title": group.get("title") or "Study Group",
                     "rejectedAt": datetime.utcnow().isoformat() + "Z",
                 }
-                sio.emit("notify", payload, namespace="/ws/chat", to=room)
+                notify_user(sio, _uid, "notify", payload)
                 print(f"[ws] notify → {room}: {payload}")
         except Exception as e:
             print("[ws] notify error (reject):", e)
@@ -602,7 +585,6 @@ def reject_request(gid, uid):
 def leave_group(gid):
     try:
         db = get_db()
-        ensure_group_collection(db)
         user = current_user(db)
         if not user:
             return jsonify({"ok": False, "error": "Unauthorized"}), 401
@@ -610,6 +592,7 @@ def leave_group(gid):
         if not _gid:
             return jsonify({"ok": False, "error": "Invalid group id"}), 400
         db.study_groups.update_one({"_id": _gid}, {"$pull": {"members": {"_id": user["_id"]}}})
+        invalidate_group(db, _gid)
         return jsonify({"ok": True}), 200
     except Exception as e:
         return jsonify({"ok": False, "error": f"Leave failed: {e}"}), 500
@@ -620,7 +603,6 @@ def leave_group(gid):
 def delete_group(gid):
     try:
         db = get_db()
-        ensure_group_collection(db)
         user = current_user(db)
         if not user:
             return jsonify({"ok": False, "error": "Unauthorized"}), 401
@@ -633,6 +615,7 @@ def delete_group(gid):
         if str(group.get("ownerId")) != str(user["_id"]):
             return jsonify({"ok": False, "error": "Only the owner can delete this group"}), 403
         db.study_groups.delete_one({"_id": _gid})
+        invalidate_group(db, _gid)
         return jsonify({"ok": True, "message": "Group deleted"}), 200
     except Exception as e:
         return jsonify({"ok": False, "error": f"Delete failed: {e}"}), 500
@@ -666,7 +649,8 @@ def get_my_availability():
         user = current_user(db)
         if not user:
             return jsonify({"ok": False, "error": "Unauthorized"}), 401
-        out = user.get("availability") or {k: [] for k in WEEK_KEYS}
+        doc = db.users.find_one({"_id": user["_id"]}, {"availability": 1}) or {}
+        out = doc.get("availability") or {k: [] for k in WEEK_KEYS}
         return jsonify(out), 200
     except Exception as e:
         return jsonify({"ok": False, "error": f"Load failed: {e}"}), 500
@@ -691,12 +675,6 @@ def _user_id_variants(uid_raw):
         out.append(o)
     return out
 
-def ensure_notifications_collection(db):
-    if "notifications" not in db.list_collection_names():
-        db.create_collection("notifications")
-    db.notifications.create_index([("userId", 1), ("createdAt", -1)], background=True)
-    db.notifications.create_index([("read", 1)], background=True)
-
 def _scrub_ids(x):
     """Recursively convert ObjectId -> str in nested dicts/lists."""
     if isinstance(x, ObjectId):
@@ -728,7 +706,6 @@ def list_my_notifications():
     try:
         from db import get_db
         db = get_db()
-        ensure_notifications_collection(db)
 
         uid_raw = get_jwt_identity()
         if not uid_raw:
@@ -751,7 +728,6 @@ def mark_notifications_read():
     try:
         from db import get_db
         db = get_db()
-        ensure_notifications_collection(db)
 
         uid_raw = get_jwt_identity()
         if not uid_raw:
@@ -777,7 +753,6 @@ def clear_notifications():
     try:
         from db import get_db
         db = get_db()
-        ensure_notifications_collection(db)
 
         uid_raw = get_jwt_identity()
         if not uid_raw:
@@ -794,20 +769,6 @@ def clear_notifications():
 
 
 # ===================== CHAT =====================
-def ensure_chat_collection(db):
-    if "group_messages" not in db.list_collection_names():
-        db.create_collection("group_messages")
-    db.group_messages.create_index(
-        [("groupId", ASCENDING), ("createdAt", DESCENDING)],
-        background=True,
-    )
-
-def ensure_chat_reads_collection(db):
-    if "group_reads" not in db.list_collection_names():
-        db.create_collection("group_reads")
-    db.group_reads.create_index([("userId", 1), ("groupId", 1)], unique=True)
-    db.group_reads.create_index([("updatedAt", -1)])
-
 def _serialize_chat(doc):
     fr = doc.get("from", {})
     out = {
@@ -822,6 +783,7 @@ def _serialize_chat(doc):
             "email": fr.get("email"),
         },
         "at": doc.get("createdAt").isoformat() + "Z" if doc.get("createdAt") else None,
+        "seq": doc.get("seq"),
     }
     f = doc.get("file")
     if f:
@@ -839,63 +801,348 @@ ALLOWED_EXTS = {"pdf", "doc", "docx"}
 def _allowed_ext(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTS
 
-def _uploads_dir_for_gid(gid_oid):
-    base = current_app.config.get("UPLOAD_DIR") or os.path.join(current_app.root_path, "uploads")
-    folder = os.path.join(base, str(gid_oid))
-    os.makedirs(folder, exist_ok=True)
-    return folder
+def _upload_base():
+    return current_app.config.get("UPLOAD_DIR") or os.path.join(current_app.root_path, "uploads")
+
+# ---- chat history pagination ------------------------------------------------
+CHAT_PAGE_DEFAULT = 50
+CHAT_PAGE_MAX = 200
+
+
+def _parse_ts(raw):
+    """ISO-8601 string or epoch (s / ms) → naive UTC datetime, else None."""
+    raw = (raw or "").strip()
+    if not raw:
+        return None
+    try:
+        n = float(raw)
+        return datetime.utcfromtimestamp(n / 1000.0 if n > 1e11 else n)
+    except ValueError:
+        pass
+    try:
+        dt = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _ts_key(db, gid_oid, ts):
+    """Key sitting just before every message at `ts` (chat_buckets: a seq pivot)."""
+    if CHAT_STORAGE == "buckets":
+        # a time before the oldest hot message resolves inside the archive
+        return max(chat_buckets.ts_pivot(db, gid_oid, ts), chat_archive.ts_pivot(db, gid_oid, ts))
+    return (ts, None)
+
+
+def _chat_cursor(db, gid_oid, raw):
+    """
+    Resolve a cursor (message id or timestamp) to a (createdAt, _id) key.
+    A bare timestamp gets _id=None: it sits between all messages of that instant.
+    With CHAT_STORAGE=buckets keys are seq pivots instead. Ids of archived
+    messages are looked up in chat_archive.
+    """
+    if not raw:
+        return None
+    if CHAT_STORAGE == "buckets":
+        if ObjectId.is_valid(raw):
+            mid = ObjectId(raw)
+            return seq_of(db, gid_oid, mid) or chat_archive.seq_of(db, gid_oid, mid)
+        ts = _parse_ts(raw)
+        return _ts_key(db, gid_oid, ts) if ts else None
+    if ObjectId.is_valid(raw):
+        doc = db.group_messages.find_one(
+            {"_id": ObjectId(raw), "groupId": gid_oid}, {"createdAt": 1}
+        ) or chat_archive.find(db, gid_oid, ObjectId(raw))
+        if doc and doc.get("createdAt"):
+            return (doc["createdAt"], doc["_id"])
+        return None
+    ts = _parse_ts(raw)
+    return _ts_key(db, gid_oid, ts) if ts else None
+
+
+def _keyset(gid_oid, key, direction):
+    """Filter for messages strictly older ("before") / newer ("after") than key."""
+    ts, mid = key
+    op, op_eq = ("$lt", "$lte") if direction == "before" else ("$gt", "$gte")
+    if mid is None:
+        # timestamp cursors: "after" is inclusive so around=<t> starts at t
+        return {"groupId": gid_oid, "createdAt": {op if direction == "before" else op_eq: ts}}
+    # bounded range scan on (groupId, createdAt, _id); the $or only breaks ties
+    return {
+        "groupId": gid_oid,
+        "createdAt": {op_eq: ts},
+        "$or": [{"createdAt": {op: ts}}, {"_id": {op: mid}}],
+    }
+
+
+def _hot_page(db, gid_oid, key, direction, limit):
+    """_chat_page over group_messages / chat_buckets only."""
+    if CHAT_STORAGE == "buckets":
+        return chat_buckets.page(db, gid_oid, chat_buckets.INF if key is None else key, direction, limit)
+    order = DESCENDING if direction == "before" else ASCENDING
+    q = _keyset(gid_oid, key, direction) if key else {"groupId": gid_oid}
+    rows = list(
+        db.group_messages
+          .find(q)
+          .sort([("createdAt", order), ("_id", order)])
+          .limit(limit + 1)
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == "before":
+        rows.reverse()  # oldest → newest
+    return rows, has_more
+
+
+def _archive_pivot(db, gid_oid, key):
+    """`key` as a seq pivot into chat_archive (None if it cannot be placed)."""
+    if CHAT_STORAGE == "buckets":
+        return key
+    ts, mid = key
+    if mid is None:
+        return chat_archive.ts_pivot(db, gid_oid, ts)
+    return seq_of(db, gid_oid, mid) or chat_archive.seq_of(db, gid_oid, mid)
+
+
+def _chat_page(db, gid_oid, key, direction, limit):
+    """One page walking away from `key` (None = from the newest). Returns (rows, has_more)."""
+    rows, has_more = _hot_page(db, gid_oid, key, direction, limit)
+    if direction == "before" and has_more:
+        return rows, has_more
+    if not chat_archive.has(db, gid_oid):
+        return rows, has_more
+    # slow path: the page reaches past the hot storage into retention's archive
+    if direction == "before":
+        if rows:
+            pivot = rows[0].get("seq")
+        else:
+            pivot = chat_archive.INF if key is None else _archive_pivot(db, gid_oid, key)
+        if pivot is None:
+            return rows, has_more
+        older, more = chat_archive.page(db, gid_oid, pivot, "before", limit - len(rows))
+        return older + rows, more
+    pivot = _archive_pivot(db, gid_oid, key)
+    if pivot is None:
+        return rows, has_more
+    newer, more = chat_archive.page(db, gid_oid, pivot, "after", limit)
+    if not newer:
+        return rows, has_more
+    seen = {r["_id"] for r in newer}
+    rows = [r for r in rows if r["_id"] not in seen]
+    return (newer + rows)[:limit], more or has_more or len(newer) + len(rows) > limit
+
+
+def _chat_exists(db, gid_oid, key, direction):
+    if CHAT_STORAGE == "buckets":
+        hot = chat_buckets.exists(db, gid_oid, key, direction)
+    else:
+        hot = db.group_messages.find_one(_keyset(gid_oid, key, direction), {"_id": 1}) is not None
+    if hot or not chat_archive.has(db, gid_oid):
+        return hot
+    pivot = _archive_pivot(db, gid_oid, key)
+    return pivot is not None and chat_archive.exists(db, gid_oid, pivot, direction)
+
 
 # --- GET /api/groups/<gid>/chat  — history (members/owner only) ---------------
 @groups_bp.get("/<gid>/chat", endpoint="chat_history")
 @jwt_required()
 def chat_history(gid):
+    """
+    Keyset-paginated history, oldest → newest within a page.
+
+      ?limit=50                 newest page
+      ?before=<id|ts>&limit=    older page (scroll back)
+      ?after=<id|ts>&limit=     newer page (catch up)
+      ?around=<ts>&limit=       page centred on a point in time (jump-to-time)
+
+    With any of these params the response is
+      {items, hasMoreBefore, hasMoreAfter, before, after}
+    where before/after are the cursors for the next page in each direction.
+    Without params it keeps the old shape: a plain list of the newest 200.
+    """
     try:
         db = get_db()
-        ensure_group_collection(db)
-        ensure_chat_collection(db)
 
         uid = oid(get_jwt_identity())
         _gid = oid(gid)
         if not uid or not _gid:
             return jsonify({"ok": False, "error": "Unauthorized"}), 401
 
-        grp = db.study_groups.find_one({"_id": _gid}, {"members._id": 1, "ownerId": 1})
-        if not grp:
-            return jsonify({"ok": False, "error": "Group not found"}), 404
-        if not _is_member_or_owner(grp, uid):
-            return jsonify({"ok": False, "error": "Only members can view chat"}), 403
+        denied = _membership_error(db, _gid, uid, "Only members can view chat")
+        if denied:
+            return denied
 
-        rows = list(
-            db.group_messages
-              .find({"groupId": _gid})
-              .sort("createdAt", DESCENDING)
-              .limit(200)
-        )
-        rows.reverse()  # oldest → newest
-        return jsonify([_serialize_chat(r) for r in rows]), 200
+        args = request.args
+        paged = any(args.get(k) for k in ("before", "after", "around", "limit"))
+        if not paged:
+            rows, _ = _chat_page(db, _gid, None, "before", CHAT_PAGE_MAX)
+            return jsonify([_serialize_chat(r) for r in rows]), 200
+
+        try:
+            limit = int(args.get("limit") or CHAT_PAGE_DEFAULT)
+        except ValueError:
+            return jsonify({"ok": False, "error": "limit must be an integer"}), 400
+        limit = max(1, min(limit, CHAT_PAGE_MAX))
+
+        cursors = [k for k in ("before", "after", "around") if args.get(k)]
+        if len(cursors) > 1:
+            return jsonify({"ok": False, "error": "Use only one of before/after/around"}), 400
+        mode = cursors[0] if cursors else None
+
+        if mode == "around":
+            ts = _parse_ts(args.get("around"))
+            if not ts:
+                return jsonify({"ok": False, "error": "around must be a timestamp"}), 400
+            key = _ts_key(db, _gid, ts)
+            older, more_before = _chat_page(db, _gid, key, "before", limit // 2)
+            newer, more_after = _chat_page(db, _gid, key, "after", limit - len(older))
+            rows = older + newer
+        elif mode:
+            key = _chat_cursor(db, _gid, args.get(mode))
+            if not key:
+                return jsonify({"ok": False, "error": f"Invalid {mode} cursor"}), 400
+            rows, more = _chat_page(db, _gid, key, mode, limit)
+            if mode == "before":
+                more_before, more_after = more, _chat_exists(db, _gid, key, "after")
+            else:
+                more_before, more_after = _chat_exists(db, _gid, key, "before"), more
+        else:
+            rows, more_before = _chat_page(db, _gid, None, "before", limit)
+            more_after = False
+
+        items = [_serialize_chat(r) for r in rows]
+        return jsonify({
+            "items": items,
+            "hasMoreBefore": bool(more_before),
+            "hasMoreAfter": bool(more_after),
+            "before": items[0]["id"] if items else None,
+            "after": items[-1]["id"] if items else None,
+        }), 200
     except Exception as e:
         return jsonify({"ok": False, "error": f"Chat load failed: {e}"}), 500
 
+# --- GET /api/groups/<gid>/chat/search — full-text search (members/owner only)
+CHAT_SEARCH_DEFAULT = 20
+CHAT_SEARCH_MAX = 50
+
+
+@groups_bp.get("/<gid>/chat/search", endpoint="chat_search")
+@jwt_required()
+def chat_search_route(gid):
+    """
+    ?q=<terms>&limit=20&cursor=<next>  →  {items, next, hasMore}
+
+    Best matches first (relevance tier, then newest); see chat_search.py.
+    Each item is a chat message plus `score` and `snippet: {text, highlights}`.
+    """
+    try:
+        db = get_db()
+
+        uid = oid(get_jwt_identity())
+        _gid = oid(gid)
+        if not uid or not _gid:
+            return jsonify({"ok": False, "error": "Unauthorized"}), 401
+
+        denied = _membership_error(db, _gid, uid, "Only members can search chat")
+        if denied:
+            return denied
+
+        q = (request.args.get("q") or "").strip()
+        if not q:
+            return jsonify({"ok": False, "error": "q is required"}), 400
+        if len(q) > chat_search.CHAT_SEARCH_QUERY_MAX:
+            return jsonify({"ok": False, "error": "q is too long"}), 400
+        try:
+            limit = int(request.args.get("limit") or CHAT_SEARCH_DEFAULT)
+        except ValueError:
+            return jsonify({"ok": False, "error": "limit must be an integer"}), 400
+        limit = max(1, min(limit, CHAT_SEARCH_MAX))
+
+        try:
+            rows, nxt = chat_search.search(db, _gid, q, limit, request.args.get("cursor") or None)
+        except ValueError:
+            return jsonify({"ok": False, "error": "Invalid cursor"}), 400
+
+        items = [
+            {**_serialize_chat(r), "score": round(float(r["_score"]), 3), "snippet": r["snippet"]}
+            for r in rows
+        ]
+        return jsonify({"items": items, "next": nxt, "hasMore": nxt is not None}), 200
+    except Exception as e:
+        return jsonify({"ok": False, "error": f"Chat search failed: {e}"}), 500
+
+# --- GET /api/groups/<gid>/chat/export — streamed NDJSON / CSV (members/owner only)
+@groups_bp.get("/<gid>/chat/export", endpoint="chat_export")
+@jwt_required()
+def chat_export_route(gid):
+    """
+    ?format=ndjson|csv&from=<ts>&to=<ts>&batch=1000
+
+    The whole history (retention archive included) in [from, to), oldest
+    first, streamed as it is read; gzip-encoded when the client accepts it.
+    """
+    try:
+        db = get_db()
+
+        uid = oid(get_jwt_identity())
+        _gid = oid(gid)
+        if not uid or not _gid:
+            return jsonify({"ok": False, "error": "Unauthorized"}), 401
+
+        denied = _membership_error(db, _gid, uid, "Only members can export chat")
+        if denied:
+            return denied
+
+        args = request.args
+        fmt = (args.get("format") or "ndjson").strip().lower()
+        if fmt not in chat_export.FORMATS:
+            return jsonify({"ok": False, "error": "format must be ndjson or csv"}), 400
+        bounds = {}
+        for k in ("from", "to"):
+            if args.get(k):
+                bounds[k] = _parse_ts(args.get(k))
+                if not bounds[k]:
+                    return jsonify({"ok": False, "error": f"{k} must be a timestamp"}), 400
+        try:
+            batch = int(args.get("batch") or chat_export.CHAT_EXPORT_BATCH)
+        except ValueError:
+            return jsonify({"ok": False, "error": "batch must be an integer"}), 400
+        batch = max(1, min(batch, chat_export.CHAT_EXPORT_BATCH_MAX))
+
+        gzip = "gzip" in request.accept_encodings
+        rows = chat_export.iter_rows(db, _gid, bounds.get("from"), bounds.get("to"), batch)
+        body = chat_export.stream(rows, fmt, _serialize_chat, batch=batch, gzip=gzip)
+
+        name = f"chat-{_gid}-{datetime.utcnow():%Y%m%d}.{fmt}"
+        headers = {
+            "Content-Disposition": f'attachment; filename="{name}"',
+            "Cache-Control": "no-store",
+            "X-Accel-Buffering": "no",  # let nginx pass chunks through as they come
+            "Vary": "Accept-Encoding",
+        }
+        if gzip:
+            headers["Content-Encoding"] = "gzip"
+        return Response(body, status=200, mimetype=chat_export.FORMATS[fmt], headers=headers)
+    except Exception as e:
+        return jsonify({"ok": False, "error": f"Chat export failed: {e}"}), 500
+
 # --- POST /api/groups/<gid>/chat — send (members/owner only) ------------------
 @groups_bp.post("/<gid>/chat", endpoint="chat_send")
 @jwt_required()
 def chat_send(gid):
     try:
         db = get_db()
-        ensure_group_collection(db)
-        ensure_chat_collection(db)
-        ensure_chat_reads_collection(db)
 
         me = current_user(db)
         _gid = oid(gid)
         if not me or not _gid:
             return jsonify({"ok": False, "error": "Unauthorized"}), 401
 
-        grp = db.study_groups.find_one({"_id": _gid}, {"members._id": 1, "ownerId": 1, "title": 1})
-        if not grp:
-            return jsonify({"ok": False, "error": "Group not found"}), 404
-        if not _is_member_or_owner(grp, me["_id"]):
-            return jsonify({"ok": False, "error": "Only members can send chat"}), 403
+        denied = _membership_error(db, _gid, me["_id"], "Only members can send chat")
+        if denied:
+            return denied
 
         body = request.get_json(silent=True) or {}
         text = (body.get("text") or "").strip()
@@ -912,16 +1159,10 @@ def chat_send(gid):
             "from": {"id": me["_id"], "name": display_name, "email": me.get("email")},
             "createdAt": now,
         }
-        ins = db.group_messages.insert_one(doc)
+        # stamps seq + records it as the sender's own (never unread for them)
+        msg_id = insert_message(db, doc)
 
-        # mark sender as read up to now
-        db.group_reads.update_one(
-            {"userId": me["_id"], "groupId": _gid},
-            {"$set": {"lastReadAt": now, "updatedAt": now}},
-            upsert=True,
-        )
-
-        payload = _serialize_chat({**doc, "_id": ins.inserted_id})
+        payload = _serialize_chat({**doc, "_id": msg_id})
 
         # realtime: broadcast to room group:<gid>
         try:
@@ -941,20 +1182,18 @@ def chat_send(gid):
 def chat_upload(gid):
     """
     Multipart/form-data with field 'file'.
-    Saves into UPLOAD_DIR/<gid>/ and creates a 'file' chat message.
+    Saves into the blob store (blob_store.py) and creates a 'file' chat message.
     """
     try:
         db = get_db()
-        ensure_group_collection(db)
-        ensure_chat_collection(db)
 
         me = current_user(db)
         _gid = oid(gid)
         if not me or not _gid:
             return jsonify({"ok": False, "error": "Unauthorized"}), 401
 
-        grp = db.study_groups.find_one({"_id": _gid}, {"members._id": 1, "ownerId": 1})
-        if not grp or not _is_member_or_owner(grp, me["_id"]):
+        ids = member_ids(db, _gid)
+        if not ids or str(me["_id"]) not in ids:
             return jsonify({"ok": False, "error": "Only members can upload"}), 403
 
         if "file" not in request.files:
@@ -966,39 +1205,39 @@ def chat_upload(gid):
             return jsonify({"ok": False, "error": "Only PDF/DOC/DOCX allowed"}), 415
 
         safe_name = secure_filename(f.filename)
-        stored_name = f"{uuid.uuid4().hex}_{safe_name}"
-        folder = _uploads_dir_for_gid(_gid)
-        full_path = os.path.join(folder, stored_name)
-        f.save(full_path)
+        sha256, size = blob_store.save_stream(_upload_base(), f.stream)
+        payload = post_file_message(db, me, _gid, safe_name, sha256, f.mimetype, size)
+        return jsonify(payload), 201
+    except Exception as e:
+        return jsonify({"ok": False, "error": f"Upload failed: {e}"}), 500
 
-        size = os.path.getsize(full_path)
-        file_url = f"{request.host_url.rstrip('/')}/api/groups/file/{str(_gid)}/{stored_name}"
 
-        display_name = me.get("fullName") or me.get("name") or me.get("email") or "Member"
-        now = datetime.utcnow()
+def post_file_message(db, me, gid_oid, safe_name, sha256, mime, size):
+    """Create + broadcast the 'file' chat message for a file in the blob store."""
+    stored_name = f"{uuid.uuid4().hex}_{safe_name}"
+    blob_store.name_ref(db, gid_oid, stored_name, sha256, size)
+    file_url = f"{request.host_url.rstrip('/')}/api/groups/file/{str(gid_oid)}/{stored_name}"
+    display_name = me.get("fullName") or me.get("name") or me.get("email") or "Member"
 
-        doc = {
-            "groupId": _gid,
-            "kind": "file",
-            "text": "",
-            "file": {"name": safe_name, "url": file_url, "mime": f.mimetype, "size": size},
-            "from": {"id": me["_id"], "name": display_name, "email": me.get("email")},
-            "createdAt": now,
-        }
-        ins = db.group_messages.insert_one(doc)
-        payload = _serialize_chat({**doc, "_id": ins.inserted_id})
-
-        # broadcast
-        try:
-            sio = get_socketio()
-            if sio:
-                sio.emit("group_message", payload, namespace="/ws/chat", to=f"group:{gid}")
-        except Exception as e:
-            print("[ws] broadcast error (chat_upload):", e)
+    doc = {
+        "groupId": gid_oid,
+        "kind": "file",
+        "text": "",
+        "file": {"name": safe_name, "url": file_url, "mime": mime, "size": size, "sha256": sha256},
+        "from": {"id": me["_id"], "name": display_name, "email": me.get("email")},
+        "createdAt": datetime.utcnow(),
+    }
+    msg_id = insert_message(db, doc)
+    payload = _serialize_chat({**doc, "_id": msg_id})
 
-        return jsonify(payload), 201
+    # broadcast
+    try:
+        sio = get_socketio()
+        if sio:
+            sio.emit("group_message", payload, namespace="/ws/chat", to=f"group:{gid_oid}")
     except Exception as e:
-        return jsonify({"ok": False, "error": f"Upload failed: {e}"}), 500
+        print("[ws] broadcast error (chat_upload):", e)
+    return payload
 
 # --- GET /api/groups/file/<gid>/<filename> — secure serve ---------------------
 @groups_bp.get("/file/<gid>/<filename>", endpoint="chat_file")
@@ -1014,44 +1253,65 @@ def serve_group_file(gid, filename):
         if not uid or not _gid:
             return jsonify({"ok": False, "error": "Unauthorized"}), 401
 
-        grp = db.study_groups.find_one({"_id": _gid}, {"members._id": 1, "ownerId": 1})
-        if not grp or not _is_member_or_owner(grp, uid):
+        ids = member_ids(db, _gid)
+        if not ids or str(uid) not in ids:
             return jsonify({"ok": False, "error": "Forbidden"}), 403
 
-        folder = _uploads_dir_for_gid(_gid)
-        return send_from_directory(folder, filename, as_attachment=False)
+        base = _upload_base()
+        sha256 = blob_store.resolve_name(db, _gid, filename)
+        if sha256:
+            path = blob_store.path_for(base, sha256)
+        else:  # stored before the blob store and not migrated yet
+            path = safe_join(os.path.join(base, str(_gid)), filename)
+        if not path or not os.path.isfile(path):
+            return jsonify({"ok": False, "error": "Not found"}), 404
     except Exception as e:
         return jsonify({"ok": False, "error": f"File fetch failed: {e}"}), 500
 
+    # outside the try: a bad Range has to reach the client as 416
+    mime = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    return send_stored(path, base, mime, sha256=sha256)
+
+# --- GET /api/groups/chat/unread → {"counts": {gid: int}, "total": int} --------
+@groups_bp.get("/chat/unread", endpoint="chat_unread_all")
+@jwt_required()
+def chat_unread_all():
+    """Unread chat counts for every group the caller belongs to, in one call."""
+    try:
+        db = get_db()
+
+        uid = oid(get_jwt_identity())
+        if not uid:
+            return jsonify({"ok": False, "error": "Unauthorized"}), 401
+
+        gids = [
+            d["_id"]
+            for d in db.study_groups.find(
+                {"$or": [{"members._id": uid}, {"ownerId": uid}]}, {"_id": 1}
+            )
+        ]
+        counts = unread_counts(db, uid, gids)
+        return jsonify({"counts": counts, "total": sum(counts.values())}), 200
+    except Exception as e:
+        return jsonify({"ok": False, "error": f"Unread failed: {e}"}), 500
+
 # --- GET /api/groups/<gid>/chat/unread → {"count": int} -----------------------
 @groups_bp.get("/<gid>/chat/unread", endpoint="chat_unread_count")
 @jwt_required()
 def chat_unread(gid):
     try:
         db = get_db()
-        ensure_group_collection(db)
-        ensure_chat_collection(db)
-        ensure_chat_reads_collection(db)
 
         uid = oid(get_jwt_identity())
         _gid = oid(gid)
         if not uid or not _gid:
             return jsonify({"ok": False, "error": "Unauthorized"}), 401
 
-        grp = db.study_groups.find_one({"_id": _gid}, {"members._id": 1, "ownerId": 1})
-        if not grp:
-            return jsonify({"ok": False, "error": "Group not found"}), 404
-        if not _is_member_or_owner(grp, uid):
-            return jsonify({"ok": False, "error": "Join this group to view chat"}), 403
-
-        read = db.group_reads.find_one({"userId": uid, "groupId": _gid}) or {}
-        since = read.get("lastReadAt")
-
-        q = {"groupId": _gid, "from.id": {"$ne": uid}}  # exclude my own messages
-        if since:
-            q["createdAt"] = {"$gt": since}
+        denied = _membership_error(db, _gid, uid, "Join this group to view chat")
+        if denied:
+            return denied
 
-        cnt = db.group_messages.count_documents(q)
+        cnt = unread_counts(db, uid, [_gid]).get(str(_gid), 0)
         return jsonify({"count": int(cnt)}), 200
     except Exception as e:
         return jsonify({"ok": False, "error": f"Unread failed: {e}"}), 500
@@ -1062,27 +1322,17 @@ def chat_unread(gid):
 def chat_mark_read(gid):
     try:
         db = get_db()
-        ensure_group_collection(db)
-        ensure_chat_collection(db)
-        ensure_chat_reads_collection(db)
 
         uid = oid(get_jwt_identity())
         _gid = oid(gid)
         if not uid or not _gid:
             return jsonify({"ok": False, "error": "Unauthorized"}), 401
 
-        grp = db.study_groups.find_one({"_id": _gid}, {"members._id": 1, "ownerId": 1})
-        if not grp:
-            return jsonify({"ok": False, "error": "Group not found"}), 404
-        if not _is_member_or_owner(grp, uid):
-            return jsonify({"ok": False, "error": "Join this group to view chat"}), 403
+        denied = _membership_error(db, _gid, uid, "Join this group to view chat")
+        if denied:
+            return denied
 
-        now = datetime.utcnow()
-        db.group_reads.update_one(
-            {"userId": uid, "groupId": _gid},
-            {"$set": {"lastReadAt": now, "updatedAt": now}},
-            upsert=True,
-        )
+        mark_read(db, uid, _gid)
         return jsonify({"ok": True}), 200
     except Exception as e:
         return jsonify({"ok": False, "error": f"Mark-read failed: {e}"}), 500
@@ -1091,12 +1341,6 @@ def chat_mark_read(gid):
 # ===================== MEETING POLLS =====================
 VALID_MODES = {"online", "oncampus", "either"}  # "on-campus" is normalized to "oncampus"
 
-def ensure_meeting_polls_collection(db):
-    if "meeting_polls" not in db.list_collection_names():
-        db.create_collection("meeting_polls")
-    db.meeting_polls.create_index([("groupId", 1), ("createdAt", -1)], background=True)
-    db.meeting_polls.create_index([("slots.id", 1)], background=True)
-
 def _iso(dt):
     return dt.isoformat() + "Z" if isinstance(dt, datetime) else None
 
@@ -1144,20 +1388,14 @@ def _parse_iso_to_utc_naive(s: str):
         return None
 
 def _is_member(db, gid_oid, uid_oid):
-    grp = db.study_groups.find_one({"_id": gid_oid}, {"members._id": 1, "ownerId": 1})
-    if not grp:
-        return False
-    if str(grp.get("ownerId")) == str(uid_oid):
-        return True
-    return any(m.get("_id") == uid_oid for m in grp.get("members", []))
+    ids = member_ids(db, gid_oid)
+    return bool(ids) and str(uid_oid) in ids
 
 # -------- List polls for a group --------
 @groups_bp.get("/<gid>/meeting-polls")
 @jwt_required()
 def list_meeting_polls(gid):
     db = get_db()
-    ensure_group_collection(db)
-    ensure_meeting_polls_collection(db)
 
     uid = oid(get_jwt_identity())
     _gid = oid(gid)
@@ -1178,8 +1416,6 @@ def list_meeting_polls(gid):
 @jwt_required()
 def create_meeting_poll(gid):
     db = get_db()
-    ensure_group_collection(db)
-    ensure_meeting_polls_collection(db)
 
     me = current_user(db)
     _gid = oid(gid)
@@ -1235,8 +1471,6 @@ def create_meeting_poll(gid):
 @jwt_required()
 def vote_meeting_poll(gid, pid):
     db = get_db()
-    ensure_group_collection(db)
-    ensure_meeting_polls_collection(db)
 
     uid = oid(get_jwt_identity())
     _gid = oid(gid)
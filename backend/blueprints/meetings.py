@@ -430,7 +430,11 @@ from bson import ObjectId
 from pymongo import ReturnDocument
 from flask import Response
 
-from db import get_db
+from db import get_db, register_collection
+from helpers import load_user
+from outbox import enqueue_email
+from notify_batch import notify_user
+from reminders import reminder_at_for, reminder_scheduler
 
 meetings_bp = Blueprint("meetings_bp", __name__, url_prefix="/api/meetings")
 
@@ -538,31 +542,29 @@ def _validate_slot(slot):
     return clean, start_utc, end_utc, None
 
 
-def _ensure_meeting_indexes(db):
-    if "meetings" not in db.list_collection_names():
-        db.create_collection("meetings")
-    db.meetings.create_index([("receiverId", 1), ("status", 1), ("createdAt", -1)], background=True)
-    db.meetings.create_index([("senderId", 1), ("createdAt", -1)], background=True)
-    db.meetings.create_index([("receiverId_oid", 1)], background=True)
-    db.meetings.create_index([("senderId_oid", 1)], background=True)
-    db.meetings.create_index([("deletedFor", 1)], background=True)
-    db.meetings.create_index([("startAt", 1)], background=True)
-    db.meetings.create_index([("status", 1), ("startAt", 1)], background=True)
-
-
-def _ensure_notifications_collection(db):
-    if "notifications" not in db.list_collection_names():
-        db.create_collection("notifications")
-    db.notifications.create_index([("userId", 1), ("createdAt", -1)], background=True)
-    db.notifications.create_index([("read", 1)], background=True)
+register_collection(
+    "meetings",
+    [("receiverId", 1), ("status", 1), ("createdAt", -1)],
+    [("senderId", 1), ("createdAt", -1)],
+    [("receiverId_oid", 1)],
+    [("senderId_oid", 1)],
+    [("deletedFor", 1)],
+    [("startAt", 1)],
+    [("status", 1), ("startAt", 1)],
+)
+register_collection(
+    "notifications",
+    [("userId", 1), ("createdAt", -1)],
+    [("read", 1)],
+)
 
 
 def _emit(user_id_str: str, event: str, payload: dict):
     try:
         sio = current_app.extensions.get("socketio")
         if sio:
-            room = f"user:{str(user_id_str)}"
-            sio.emit(event, payload, namespace="/ws/chat", to=room)
+            # batched per user room: notify + meeting_updated go out as one frame
+            notify_user(sio, user_id_str, event, payload)
     except Exception as e:
         print("[meetings] socket emit error:", e)
 
@@ -577,12 +579,8 @@ def generate_video_link():
 
 
 def _get_user_email(db, uid_str: str) -> str | None:
-    """Best-effort email lookup; adjust to your schema as needed."""
-    if "users" not in db.list_collection_names():
-        return None
-    users = db["users"]  # don't use `if users:`; Collection has no truthiness
-    doc = users.find_one({"_id": _as_oid(uid_str)}) or users.find_one({"id": uid_str})
-    return (doc or {}).get("email")
+    """Best-effort email lookup (cached; matches _id or legacy `id`)."""
+    return (load_user(db, uid_str) or {}).get("email")
 
 
 # ----------------------- routes ------------------------
@@ -598,8 +596,6 @@ def request_meeting():
     if not receiver_id or err:
         return jsonify({"ok": False, "error": err or "Missing receiver_id"}), 400
 
-    _ensure_meeting_indexes(db)
-
     # Do NOT create link yet — only after acceptance.
     doc = {
         "senderId": sender_raw,
@@ -622,7 +618,6 @@ def request_meeting():
     ins = db.meetings.insert_one(doc)
 
     # in-app notification
-    _ensure_notifications_collection(db)
     db.notifications.insert_one({
         "userId": r_oid if r_oid else receiver_id,
         "type": "meeting_request",
@@ -640,16 +635,15 @@ def request_meeting():
         "at": datetime.utcnow().isoformat() + "Z",
     })
 
-    # emails (both people) – request created (no link)
+    # emails (both people) – request created (no link); queued, sent in background
     try:
-        from mailer import send_email
         when_text, when_html = _format_when(slot)
 
         sender_email = _get_user_email(db, sender_raw)
         receiver_email = _get_user_email(db, receiver_id)
 
         if sender_email:
-            send_email(
+            enqueue_email(
                 to=sender_email,
                 subject="Study Group Hub: Request sent",
                 html=f"""
@@ -663,7 +657,7 @@ def request_meeting():
             )
 
         if receiver_email:
-            send_email(
+            enqueue_email(
                 to=receiver_email,
                 subject="Study Group Hub: New meeting request",
                 html=f"""
@@ -719,9 +713,20 @@ def respond_meeting():
             db.meetings.update_one({"_id": upd["_id"]}, {"$set": {"meetingLink": link}})
             upd["meetingLink"] = link
 
+    # Schedule the "starting soon" reminder (startAt - REMINDER_LEAD_MINUTES)
+    if action == "accepted":
+        remind_at = reminder_at_for(upd.get("startAt"))
+        if remind_at:
+            db.meetings.update_one(
+                {"_id": upd["_id"]},
+                {"$set": {"reminderAt": remind_at, "reminderSent": False}},
+            )
+            reminder_scheduler.schedule(db.name, upd["_id"], remind_at)
+    else:
+        reminder_scheduler.cancel(db.name, upd["_id"])
+
     # notify sender
     sender_id = upd.get("senderId")
-    _ensure_notifications_collection(db)
     notif_type = "meeting_accepted" if action == "accepted" else "meeting_rejected"
     title = "Meeting accepted" if action == "accepted" else "Meeting rejected"
     db.notifications.insert_one({
@@ -750,7 +755,6 @@ def respond_meeting():
 
     # acceptance emails with link; rejection email without link
     try:
-        from mailer import send_email
         slot = upd.get("slot") or {}
         when_text, when_html = _format_when(slot)
         link = upd.get("meetingLink")
@@ -760,7 +764,7 @@ def respond_meeting():
 
         if action == "accepted":
             if sender_email:
-                send_email(
+                enqueue_email(
                     to=sender_email,
                     subject="Study Group Hub: Your meeting request was accepted",
                     html=f"""
@@ -773,7 +777,7 @@ def respond_meeting():
                     text=f"Accepted: {when_text}. Link: {link or '(no link)'}",
                 )
             if receiver_email:
-                send_email(
+                enqueue_email(
                     to=receiver_email,
                     subject="Study Group Hub: You accepted the meeting",
                     html=f"""
@@ -788,7 +792,7 @@ def respond_meeting():
                 )
         else:  # rejected
             if sender_email:
-                send_email(
+                enqueue_email(
                     to=sender_email,
                     subject="Study Group Hub: Meeting request was rejected",
                     html=f"""
@@ -800,7 +804,7 @@ def respond_meeting():
                     text=f"Your request was rejected. Time proposed: {when_text}.",
                 )
             if receiver_email:
-                send_email(
+                enqueue_email(
                     to=receiver_email,
                     subject="Study Group Hub: You rejected the meeting",
                     html=f"""
@@ -99,7 +99,7 @@ from bson import ObjectId
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
-from db import get_db
+from db import get_db, register_collection
 
 notifications_bp = Blueprint(
     "notifications_bp",
@@ -122,20 +122,12 @@ def _utcnow() -> datetime:
     return datetime.utcnow()
 
 
-def _ensure_indexes(db):
-    """Make sure the notifications collection + indexes exist."""
-    try:
-        db.notifications.create_index(
-            [("userId", 1), ("createdAt", -1)],
-            background=True,
-        )
-        db.notifications.create_index(
-            [("read", 1), ("userId", 1)],
-            background=True,
-        )
-    except Exception:
-        # Indexes might already exist, ignore errors here
-        pass
+# notifications collection + indexes (applied once per tenant DB by db.ensure_schema)
+register_collection(
+    "notifications",
+    [("userId", 1), ("createdAt", -1)],
+    [("read", 1), ("userId", 1)],
+)
 
 
 def _user_match(uid_str: str) -> Dict[str, Any]:
@@ -193,7 +185,6 @@ def create_notification(
         return
 
     db = get_db()
-    _ensure_indexes(db)
 
     doc: Dict[str, Any] = {
         "userId": str(user_id),
@@ -226,7 +217,6 @@ def list_my_notifications():
       - limit=20    -> max number to return (default 20, max 100)
     """
     db = get_db()
-    _ensure_indexes(db)
     uid = str(get_jwt_identity())
 
     include_all = request.args.get("all") in {"1", "true", "True"}
@@ -282,7 +272,6 @@ def unread_count():
     -> { "count": <number> }
     """
     db = get_db()
-    _ensure_indexes(db)
     uid = str(get_jwt_identity())
 
     query = {**_user_match(uid), "read": {"$ne": True}}
@@ -301,7 +290,6 @@ def mark_read():
       { "ids": ["id1", "id2", ...] }     # multiple
     """
     db = get_db()
-    _ensure_indexes(db)
     uid = str(get_jwt_identity())
     data = request.get_json() or {}
 
@@ -344,7 +332,6 @@ def clear_all_my_notifications():
     (Kept for backward compatibility.)
     """
     db = get_db()
-    _ensure_indexes(db)
     uid = str(get_jwt_identity())
     _mark_all_read_for_user(db, uid)
     return jsonify({"ok": True}), 200
@@ -358,7 +345,6 @@ def mark_all_read():
     Same as /clear, but with a more explicit name.
     """
     db = get_db()
-    _ensure_indexes(db)
     uid = str(get_jwt_identity())
     _mark_all_read_for_user(db, uid)
     return jsonify({"ok": True}), 200
@@ -4,13 +4,18 @@ from __future__ import annotations
 import os
 import mimetypes
 from datetime import datetime
-from typing import Any, Iterable, Dict, Tuple, Set
+from typing import Any, Dict, Tuple, Set
 
-from flask import Blueprint, jsonify, request, current_app, send_file
+from flask import Blueprint, jsonify, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
 
+import blob_store
+import resource_index
 from db import get_db
+from file_serving import send_stored
+from helpers import load_user
+from membership import is_member
 
 resources_bp = Blueprint("resources_bp", __name__, url_prefix="/api/resources")
 
@@ -30,36 +35,6 @@ def _stringy(v: Any) -> str | None:
     return s or None
 
 
-def _collect_ids(members: Any) -> Tuple[Set[str], Set[ObjectId]]:
-    sset: Set[str] = set()
-    oset: Set[ObjectId] = set()
-    if not isinstance(members, Iterable):
-        return sset, oset
-
-    for m in members:
-        if isinstance(m, (str, int)):
-            sid = _stringy(m)
-            if sid:
-                sset.add(sid)
-            oid = _as_oid(m)
-            if oid:
-                oset.add(oid)
-        elif isinstance(m, ObjectId):
-            oset.add(m)
-            sset.add(str(m))
-        elif isinstance(m, dict):
-            mid = m.get("_id") or m.get("id") or m.get("userId")
-            if mid is not None:
-                sid = _stringy(mid)
-                if sid:
-                    sset.add(sid)
-                oid = _as_oid(mid)
-                if oid:
-                    oset.add(oid)
-
-    return sset, oset
-
-
 def _user_name_email_from_doc(u: dict) -> Tuple[str | None, str | None]:
     if not u:
         return None, None
@@ -104,65 +79,15 @@ def _lookup_user_map(db, ids_str: Set[str], ids_oid: Set[ObjectId]) -> Dict[str,
 
 
 def _current_user_name_email(db, uid: str) -> Tuple[str | None, str | None]:
-    doc = None
-    oid = _as_oid(uid)
-    if oid:
-        doc = db.users.find_one({"_id": oid})
-    if not doc:
-        doc = db.users.find_one({"_id": uid})
-    return _user_name_email_from_doc(doc)
-
-
-# ---- robust group lookup (works across collections & id types) ---------------
-def _get_group(db, group_id: str):
-    """Try both collections and both id representations."""
-    gid_oid = _as_oid(group_id)
-    id_clauses = []
-    if gid_oid:
-        id_clauses.append({"_id": gid_oid})
-    id_clauses.append({"_id": group_id})
-
-    for coll_name in ("groups", "study_groups"):
-        try:
-            g = db[coll_name].find_one({"$or": id_clauses})
-            if g:
-                return g
-        except Exception:
-            pass
-    return None
+    return _user_name_email_from_doc(load_user(db, uid))
 
 
+# ---- membership (schema-tolerant, cached; see membership.py) -----------------
 def _is_member(db, group_id: str, user_id: str) -> bool:
     """Return True if user is owner or member of the group (schema-tolerant)."""
     if not group_id or not user_id:
         return False
-
-    g = _get_group(db, group_id)
-    if not g:
-        return False
-
-    uid_str = _stringy(user_id)
-    uid_oid = _as_oid(user_id)
-
-    # owners
-    owner_strs = {x for x in [_stringy(g.get("ownerId")), _stringy(g.get("owner"))] if x}
-    owner_oids = {o for o in [_as_oid(g.get("ownerId")), _as_oid(g.get("ownerId_oid"))] if o}
-
-    # simple member arrays
-    m_strs, m_oids = _collect_ids(g.get("members") or [])
-    # optional dedicated arrays
-    m_strs2, m_oids2 = set(), set()
-    for key in ("members_str", "memberIds", "member_ids"):
-        s, _ = _collect_ids(g.get(key) or [])
-        m_strs2 |= s
-    for key in ("members_oid", "memberOids"):
-        _, o = _collect_ids(g.get(key) or [])
-        m_oids2 |= o
-
-    all_strs = owner_strs | m_strs | m_strs2
-    all_oids = owner_oids | m_oids | m_oids2
-
-    return (uid_str in all_strs) or (uid_oid in all_oids)
+    return is_member(db, group_id, _stringy(user_id))
 
 
 def _require_member(db, group_id: str, user_id: str):
@@ -171,6 +96,37 @@ def _require_member(db, group_id: str, user_id: str):
     return None
 
 
+# ----------------------------- file resources --------------------------------
+def _upload_dir() -> str:
+    upload_dir = current_app.config.get("UPLOAD_DIR") or os.path.join(os.path.dirname(__file__), "..", "uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+    return upload_dir
+
+
+def create_file_resource(db, uid: str, group_id: str, filename: str, sha256: str, size: int,
+                         title: str = "", description: str = ""):
+    """Insert the `resources` record for a file already in the blob store."""
+    uploader_name, uploader_email = _current_user_name_email(db, uid)
+    doc = {
+        "groupId": group_id,
+        "type": "file",
+        "title": title or filename,
+        "description": description or None,
+        "filename": filename,
+        "sha256": sha256,
+        "size": size,
+        "textStatus": "pending",  # picked up by the extraction worker (resource_index.py)
+        "textAttempts": 0,
+        "createdBy": uid,
+        "createdByName": uploader_name,
+        "createdByEmail": uploader_email,
+        "createdAt": datetime.utcnow(),
+    }
+    rid = db.resources.insert_one(doc).inserted_id
+    blob_store.ref(db, sha256, size)
+    return rid
+
+
 # --------------------------------- routes ------------------------------------
 @resources_bp.get("/list")
 @jwt_required()
@@ -228,6 +184,64 @@ def list_resources():
     return jsonify(out), 200
 
 
+RESOURCE_SEARCH_DEFAULT = 20
+RESOURCE_SEARCH_MAX = 50
+
+
+@resources_bp.get("/search")
+@jwt_required()
+def search_resources():
+    """
+    ?group_id=<gid>&q=<terms>&limit=20  →  {items}
+
+    File resources whose title, name or extracted text matches (see
+    resource_index.py), best first, each with `score` and
+    `snippet: {text, highlights}`.
+    """
+    db = get_db()
+    uid = str(get_jwt_identity())
+    group_id = (request.args.get("group_id") or "").strip()
+    if not group_id:
+        return jsonify({"ok": False, "error": "group_id required"}), 400
+
+    guard = _require_member(db, group_id, uid)
+    if guard:
+        return guard
+
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"ok": False, "error": "q required"}), 400
+    if len(q) > resource_index.RESOURCE_SEARCH_QUERY_MAX:
+        return jsonify({"ok": False, "error": "q is too long"}), 400
+    try:
+        limit = int(request.args.get("limit") or RESOURCE_SEARCH_DEFAULT)
+    except ValueError:
+        return jsonify({"ok": False, "error": "limit must be an integer"}), 400
+    limit = max(1, min(limit, RESOURCE_SEARCH_MAX))
+
+    hits = resource_index.search(db, group_id, q, limit)
+    by_id = {r["_id"]: r for r in db.resources.find({"_id": {"$in": [h["_id"] for h in hits]}})}
+    out = []
+    for h in hits:
+        r = by_id.get(h["_id"])
+        if not r:
+            continue
+        out.append({
+            "_id": str(r["_id"]),
+            "type": r.get("type", "file"),
+            "title": r.get("title"),
+            "description": r.get("description"),
+            "filename": r.get("filename"),
+            "size": r.get("size"),
+            "createdAt": (r.get("createdAt") or datetime.utcnow()).isoformat() + "Z",
+            "createdBy": _stringy(r.get("createdBy")) or "",
+            "createdByName": r.get("createdByName"),
+            "score": round(float(h["score"]), 3),
+            "snippet": h["snippet"],
+        })
+    return jsonify({"items": out}), 200
+
+
 @resources_bp.post("/upload")
 @jwt_required()
 def upload_resource():
@@ -252,32 +266,9 @@ def upload_resource():
     title = (request.form.get("title") or "").strip()
     description = (request.form.get("description") or "").strip()
 
-    upload_dir = current_app.config.get("UPLOAD_DIR") or os.path.join(os.path.dirname(__file__), "..", "uploads")
-    os.makedirs(upload_dir, exist_ok=True)
-
-    name_on_disk = f"{ObjectId()}.{(f.filename or 'file').split('.')[-1]}"
-    dst = os.path.join(upload_dir, name_on_disk)
-    f.save(dst)
-
-    size = os.path.getsize(dst)
-
-    uploader_name, uploader_email = _current_user_name_email(db, uid)
-
-    doc = {
-        "groupId": group_id,
-        "type": "file",
-        "title": title or f.filename,
-        "description": description or None,
-        "filename": f.filename,
-        "diskName": name_on_disk,
-        "size": size,
-        "createdBy": uid,
-        "createdByName": uploader_name,
-        "createdByEmail": uploader_email,
-        "createdAt": datetime.utcnow(),
-    }
-    ins = db.resources.insert_one(doc)
-    return jsonify({"ok": True, "id": str(ins.inserted_id)}), 200
+    sha256, size = blob_store.save_stream(_upload_dir(), f.stream)
+    rid = create_file_resource(db, uid, group_id, f.filename, sha256, size, title, description)
+    return jsonify({"ok": True, "id": str(rid)}), 200
 
 
 @resources_bp.post("/link")
@@ -331,10 +322,10 @@ def download_file(rid: str):
     if r.get("type") != "file":
         return jsonify({"ok": False, "error": "not a file"}), 400
 
-    upload_dir = current_app.config.get("UPLOAD_DIR") or os.path.join(os.path.dirname(__file__), "..", "uploads")
-    path = os.path.join(upload_dir, r["diskName"])
-    if not os.path.exists(path):
+    path = blob_store.resource_path(_upload_dir(), r)
+    if not os.path.isfile(path):
         return jsonify({"ok": False, "error": "file missing"}), 404
 
     mime = mimetypes.guess_type(r.get("filename") or "")[0] or "application/octet-stream"
-    return send_file(path, mimetype=mime, as_attachment=True, download_name=r.get("filename") or "file")
+    return send_stored(path, _upload_dir(), mime, as_attachment=True,
+                       download_name=r.get("filename") or "file", sha256=r.get("sha256"))
@@ -39,6 +39,12 @@ def _init_gamification() -> Dict[str, Any]:
     }
 
 
+def _load_gamification(db, uid) -> Dict[str, Any]:
+    # not part of the cached user (helpers.USER_PROJECTION): read it fresh
+    doc = db.users.find_one({"_id": uid}, {"gamification": 1}) or {}
+    return doc.get("gamification") or _init_gamification()
+
+
 def _update_streak(stats: Dict[str, Any]) -> None:
     """Update currentStreak / longestStreak based on lastActiveDate vs today."""
     today = _today_utc_date()
@@ -108,7 +114,7 @@ def activity_ping():
     if group_id:
         group_id = str(group_id)
 
-    stats = user.get("gamification") or _init_gamification()
+    stats = _load_gamification(db, user["_id"])
 
     _update_streak(stats)
     _award_xp(stats, kind, group_id)
@@ -130,7 +136,7 @@ def streaks_me():
     if not user:
         return jsonify({"ok": False, "error": "user not found"}), 404
 
-    stats = user.get("gamification") or _init_gamification()
+    stats = _load_gamification(db, user["_id"])
     return jsonify(
         {
             "ok": True,
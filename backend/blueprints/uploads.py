@@ -0,0 +1,171 @@
+# backend/blueprints/uploads.py
+"""Resumable chunked uploads for resources and chat files (protocol: upload_sessions.py)."""
+from __future__ import annotations
+
+import mimetypes
+import os
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import get_jwt_identity, jwt_required
+from werkzeug.utils import secure_filename
+
+import blob_store
+import upload_sessions as us
+from db import get_db
+from helpers import current_user, oid
+from membership import is_member
+
+uploads_bp = Blueprint("uploads_bp", __name__, url_prefix="/api/uploads")
+
+
+def _upload_dir() -> str:
+    return current_app.config.get("UPLOAD_DIR") or os.path.join(os.path.dirname(__file__), "..", "uploads")
+
+
+def _error(e: us.UploadError):
+    return jsonify({"ok": False, "error": str(e), **e.extra}), e.status
+
+
+def _authorize(db, uid: str, group_id: str):
+    """Owners and members only, like resources.upload_resource / groups.chat_upload."""
+    if not is_member(db, group_id, uid):
+        return jsonify({"ok": False, "error": "not a member of this group"}), 403
+    return None
+
+
+# ------------------------------------------------------------------------------
+@uploads_bp.post("")
+@jwt_required()
+def init_upload():
+    db = get_db()
+    uid = str(get_jwt_identity())
+    body = request.get_json(silent=True) or {}
+
+    kind = (body.get("kind") or "").strip()
+    group_id = (body.get("groupId") or body.get("group_id") or "").strip()
+    filename = (body.get("filename") or "").strip()
+    if not group_id or not filename:
+        return jsonify({"ok": False, "error": "groupId and filename required"}), 400
+    if kind == "chat":
+        from blueprints.groups import _allowed_ext
+        if not oid(group_id):
+            return jsonify({"ok": False, "error": "Invalid group id"}), 400
+        if not _allowed_ext(filename):
+            return jsonify({"ok": False, "error": "Only PDF/DOC/DOCX allowed"}), 415
+        filename = secure_filename(filename)
+
+    denied = _authorize(db, uid, group_id)
+    if denied:
+        return denied
+
+    meta = {k: (body.get(k) or "").strip() for k in ("title", "description") if body.get(k)}
+    try:
+        session = us.create(db, uid, kind, group_id, filename, body.get("size"),
+                            sha256=body.get("sha256"),
+                            mime=body.get("mime") or mimetypes.guess_type(filename)[0], meta=meta)
+    except us.UploadError as e:
+        return _error(e)
+    return jsonify({"ok": True, **us.status(session)}), 201
+
+
+@uploads_bp.get("/<sid>")
+@jwt_required()
+def upload_status(sid):
+    try:
+        session = us.get(get_db(), sid, str(get_jwt_identity()))
+    except us.UploadError as e:
+        return _error(e)
+    return jsonify({"ok": True, **us.status(session)}), 200
+
+
+@uploads_bp.put("/<sid>")
+@jwt_required()
+def upload_chunk(sid):
+    db = get_db()
+    raw_offset = request.headers.get("Upload-Offset", request.args.get("offset"))
+    try:
+        offset = int(raw_offset)
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Upload-Offset header required"}), 400
+    try:
+        session = us.get(db, sid, str(get_jwt_identity()))
+        new_offset = us.write_chunk(db, session, _upload_dir(), offset, request.stream, request.content_length)
+    except us.UploadError as e:
+        return _error(e)
+    return jsonify({"ok": True, "offset": new_offset, "size": session["size"]}), 200
+
+
+@uploads_bp.post("/<sid>/finalize")
+@jwt_required()
+def finalize_upload(sid):
+    db = get_db()
+    uid = str(get_jwt_identity())
+    upload_dir = _upload_dir()
+    try:
+        session = us.get(db, sid, uid)
+        if session["status"] == "done":
+            return jsonify(session["result"]), 200
+        session = us.claim(db, session)
+    except us.UploadError as e:
+        return _error(e)
+
+    known = session.get("sha256Verified")
+    if known and blob_store.exists(upload_dir, known):
+        digest = known  # retry after the record could not be created
+    else:
+        known = None
+        try:
+            digest = us.verify(session, upload_dir)
+        except us.UploadError as e:
+            us.abort(db, session, upload_dir)  # bytes are bad: the client starts over
+            return _error(e)
+
+    # hashing a large file may outlast UPLOAD_FINALIZE_STALE_SECONDS: if another
+    # finalize took over meanwhile, leave the staged file and the record to it
+    session = us.renew(db, session)
+    if not session:
+        return jsonify({"ok": False, "error": "upload is being finalized"}), 409
+    if not known:
+        # same filesystem (both under UPLOAD_DIR): a rename, or a delete when deduped
+        blob_store.adopt(upload_dir, us.staging_path(upload_dir, session["_id"]), digest)
+        us.stored(db, session, digest)
+
+    try:
+        if session["kind"] == "resource":
+            from blueprints.resources import create_file_resource
+
+            meta = session.get("meta") or {}
+            rid = create_file_resource(db, uid, session["groupId"], session["filename"], digest,
+                                       session["size"], meta.get("title", ""), meta.get("description", ""))
+            result = {"ok": True, "id": str(rid)}
+        else:
+            from blueprints.groups import post_file_message
+
+            me = current_user(db)
+            if not me:
+                us.reopen(db, session)
+                return jsonify({"ok": False, "error": "Unauthorized"}), 401
+            result = post_file_message(db, me, oid(session["groupId"]), session["filename"], digest,
+                                       session.get("mime"), session["size"])
+    except Exception as e:
+        us.reopen(db, session)  # finalize can be retried: the blob stays put
+        return jsonify({"ok": False, "error": f"Upload failed: {e}"}), 500
+
+    if not us.complete(db, session, result):
+        print(f"[uploads] {session['_id']} changed hands after its record was created")
+    return jsonify(result), 201 if session["kind"] == "chat" else 200
+
+
+@uploads_bp.delete("/<sid>")
+@jwt_required()
+def abort_upload(sid):
+    db = get_db()
+    try:
+        session = us.get(db, sid, str(get_jwt_identity()))
+    except us.UploadError as e:
+        return _error(e)
+    if session["status"] == "finalizing" and not us.is_stuck(session):
+        return jsonify({"ok": False, "error": "upload is being finalized"}), 409
+    if session["status"] in ("open", "finalizing") and not us.abort(db, session, _upload_dir()):
+        return jsonify({"ok": False, "error": "upload is being finalized"}), 409
+    return jsonify({"ok": True}), 200
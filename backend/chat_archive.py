@@ -0,0 +1,281 @@
+# backend/chat_archive.py
+"""
+Cold tier for group chat (filled by retention.py).
+
+Messages older than a tenant's retention window are moved out of the hot
+storage (group_messages or chat_buckets, see chat_store.CHAT_STORAGE) into
+`chat_archive`, one document per run of up to CHAT_ARCHIVE_BLOB_MAX
+messages of a group:
+
+    { _id: "<gid>:<firstSeq>", groupId, firstSeq, lastSeq, firstAt, lastAt,
+      count, codec, rawBytes, bytes, blob, archivedAt }
+
+`blob` is the BSON of {m: [messages]} compressed with zstd (if the
+`zstandard` package is installed) or zlib; `codec` says which, so both can
+coexist. The _id is derived from the first seq, so re-running a batch that
+was interrupted between the archive write and the hot delete overwrites
+the same document instead of duplicating it.
+
+chat_history keeps working across the boundary: once a page runs past the
+oldest hot message, groups._chat_page continues here by seq (the slow path:
+metadata query, then a blob fetch + inflate, kept in a small LRU).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import bson
+from bson import Binary
+from pymongo import ASCENDING, DESCENDING
+
+import chat_buckets
+from chat_store import ensure_seq
+from db import register_collection
+
+try:
+    import zstandard
+except ImportError:  # optional: zlib is always there
+    zstandard = None
+
+CHAT_ARCHIVE_BLOB_MAX = int(os.getenv("CHAT_ARCHIVE_BLOB_MAX", "500"))
+CHAT_ARCHIVE_CODEC = os.getenv("CHAT_ARCHIVE_CODEC", "zstd" if zstandard else "zlib").strip().lower()
+CHAT_ARCHIVE_CACHE = int(os.getenv("CHAT_ARCHIVE_CACHE", "64"))  # inflated blobs kept per process
+
+if CHAT_ARCHIVE_CODEC == "zstd" and zstandard is None:
+    print("[chat_archive] zstandard is not installed; using zlib")
+    CHAT_ARCHIVE_CODEC = "zlib"
+
+register_collection(
+    "chat_archive",
+    [("groupId", ASCENDING), ("firstSeq", ASCENDING)],
+    [("groupId", ASCENDING), ("lastSeq", ASCENDING)],
+    [("groupId", ASCENDING), ("firstAt", ASCENDING)],
+)
+
+INF = chat_buckets.INF
+
+# seconds around an ObjectId's timestamp searched for its message
+_ID_SLACK = timedelta(minutes=5)
+
+
+# ------------------------------- codec ----------------------------------------
+def _compress(raw: bytes) -> Tuple[str, bytes]:
+    if CHAT_ARCHIVE_CODEC == "zstd":
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(raw)
+    return "zlib", zlib.compress(raw, 6)
+
+
+def _inflate(codec: str, blob: bytes) -> List[dict]:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("chat_archive blob is zstd-compressed; pip install zstandard")
+        raw = zstandard.ZstdDecompressor().decompress(blob)
+    else:
+        raw = zlib.decompress(blob)
+    return bson.decode(raw)["m"]
+
+
+_cache: "OrderedDict[Tuple[str, str], List[dict]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _messages(db, doc: dict) -> List[dict]:
+    """Messages of one archive doc (fetched without its blob), inflated once per process."""
+    key = (db.name, doc["_id"])
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            return hit
+    full = db.chat_archive.find_one({"_id": doc["_id"]}, {"codec": 1, "blob": 1})
+    msgs = _inflate(full.get("codec", "zlib"), bytes(full["blob"])) if full else []
+    with _cache_lock:
+        _cache[key] = msgs
+        while len(_cache) > max(0, CHAT_ARCHIVE_CACHE):
+            _cache.popitem(last=False)
+    return msgs
+
+
+def _expanded(db, cur):
+    """Archive docs from `cur` shaped like chat_buckets documents (for chat_buckets._collect)."""
+    for doc in cur:
+        yield {**doc, "messages": _messages(db, doc)}
+
+
+# ------------------------------- writes ---------------------------------------
+def store(db, gid, msgs: List[dict]) -> int:
+    """Archive one run of gid's messages (each with seq + createdAt). Returns stored bytes."""
+    msgs = sorted(({k: v for k, v in m.items() if k != "groupId"} for m in msgs),
+                  key=lambda m: m["seq"])
+    raw = bson.encode({"m": msgs})
+    codec, blob = _compress(raw)
+    ats = [m["createdAt"] for m in msgs]
+    db.chat_archive.replace_one(
+        {"_id": f"{gid}:{msgs[0]['seq']}"},
+        {
+            "groupId": gid,
+            "firstSeq": msgs[0]["seq"],
+            "lastSeq": msgs[-1]["seq"],
+            "firstAt": min(ats),
+            "lastAt": max(ats),
+            "count": len(msgs),
+            "codec": codec,
+            "rawBytes": len(raw),
+            "bytes": len(blob),
+            "blob": Binary(blob),
+            "archivedAt": datetime.utcnow(),
+        },
+        upsert=True,
+    )
+    return len(blob)
+
+
+def _archive_messages(db, gid, cutoff: datetime, batch: int) -> Dict[str, int]:
+    ensure_seq(db, gid)  # archive keys are seqs
+    out = {"messages": 0, "rawBytes": 0, "archiveBytes": 0}
+    while True:
+        docs = list(db.group_messages.find({"groupId": gid, "createdAt": {"$lt": cutoff}})
+                      .sort("seq", ASCENDING).limit(batch))
+        if not docs:
+            return out
+        out["archiveBytes"] += store(db, gid, docs)
+        db.group_messages.delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+        out["messages"] += len(docs)
+        out["rawBytes"] += sum(len(bson.encode(d)) for d in docs)
+
+
+def _archive_buckets(db, gid, cutoff: datetime, batch: int) -> Dict[str, int]:
+    out = {"messages": 0, "rawBytes": 0, "archiveBytes": 0}
+    msgs: List[dict] = []
+    taken: List[dict] = []
+
+    def _flush():
+        out["archiveBytes"] += store(db, gid, msgs)
+        db.chat_buckets.delete_many({"_id": {"$in": [b["_id"] for b in taken]}})
+        out["messages"] += len(msgs)
+        out["rawBytes"] += sum(len(bson.encode(b)) for b in taken)
+        msgs.clear()
+        taken.clear()
+
+    cur = db.chat_buckets.find({"groupId": gid, "lastAt": {"$lt": cutoff}}).sort("firstSeq", ASCENDING)
+    for bucket in cur:
+        taken.append(bucket)
+        msgs.extend(bucket.get("messages", ()))
+        if len(msgs) >= batch:
+            _flush()
+    if taken:
+        _flush()
+    return out
+
+
+def archive_older_than(db, cutoff: datetime, storage: str,
+                       batch: int = CHAT_ARCHIVE_BLOB_MAX) -> Dict[str, int]:
+    """Move every group's messages older than `cutoff` from the hot `storage` into the archive."""
+    if storage == "buckets":
+        gids, one = db.chat_buckets.distinct("groupId", {"lastAt": {"$lt": cutoff}}), _archive_buckets
+    else:
+        gids, one = db.group_messages.distinct("groupId", {"createdAt": {"$lt": cutoff}}), _archive_messages
+    out = {"groups": 0, "messages": 0, "rawBytes": 0, "archiveBytes": 0}
+    for gid in gids:
+        moved = one(db, gid, cutoff, max(1, batch))
+        if moved["messages"]:
+            out["groups"] += 1
+            for k, v in moved.items():
+                out[k] += v
+    return out
+
+
+def drop_groups(db, gids) -> int:
+    """Delete the archive of groups that no longer exist. Returns docs removed."""
+    return db.chat_archive.delete_many({"groupId": {"$in": list(gids)}}).deleted_count
+
+
+# ------------------------------- reads ----------------------------------------
+def has(db, gid) -> bool:
+    return db.chat_archive.find_one({"groupId": gid}, {"_id": 1}) is not None
+
+
+def page(db, gid, pivot: float, direction: str, limit: int):
+    """Archived messages older / newer than the seq pivot, oldest → newest; (rows, has_more)."""
+    meta = {"blob": 0}
+    if direction == "before":
+        cur = (db.chat_archive.find({"groupId": gid, "firstSeq": {"$lt": pivot}}, meta)
+                 .sort("lastSeq", DESCENDING))
+        rows = chat_buckets._collect(_expanded(db, cur), lambda s: s < pivot, limit + 1,
+                                     "lastSeq", newest_first=True)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        rows.reverse()
+        return rows, has_more
+    cur = (db.chat_archive.find({"groupId": gid, "lastSeq": {"$gt": pivot}}, meta)
+             .sort("firstSeq", ASCENDING))
+    rows = chat_buckets._collect(_expanded(db, cur), lambda s: s > pivot, limit + 1,
+                                 "firstSeq", newest_first=False)
+    return rows[:limit], len(rows) > limit
+
+
+def exists(db, gid, pivot: float, direction: str) -> bool:
+    q = {"firstSeq": {"$lt": pivot}} if direction == "before" else {"lastSeq": {"$gt": pivot}}
+    return db.chat_archive.find_one({"groupId": gid, **q}, {"_id": 1}) is not None
+
+
+def find(db, gid, msg_id) -> Optional[dict]:
+    """One archived message by id (looked up in the runs around its ObjectId time)."""
+    at = msg_id.generation_time.replace(tzinfo=None)
+    cur = db.chat_archive.find(
+        {"groupId": gid, "firstAt": {"$lte": at + _ID_SLACK}, "lastAt": {"$gte": at - _ID_SLACK}},
+        {"blob": 0},
+    )
+    for doc in cur:
+        for m in _messages(db, doc):
+            if m["_id"] == msg_id:
+                return {**m, "groupId": gid}
+    return None
+
+
+def seq_of(db, gid, msg_id) -> Optional[int]:
+    row = find(db, gid, msg_id)
+    return int(row["seq"]) if row else None
+
+
+def ts_pivot(db, gid, at: datetime) -> float:
+    """Seq pivot between archived messages before `at` and those at/after it."""
+    best = 0
+    cur = (db.chat_archive.find({"groupId": gid, "firstAt": {"$lt": at}}, {"blob": 0})
+             .sort("firstAt", DESCENDING).limit(2))  # runs may straddle each other's edges
+    for doc in _expanded(db, cur):
+        for m in doc["messages"]:
+            if m["createdAt"] < at and m["seq"] > best:
+                best = int(m["seq"])
+    return best + 0.5
+
+
+def iter_range(db, gid, start: Optional[datetime], end: Optional[datetime]):
+    """Archived messages of gid with start <= createdAt < end, in seq order (no LRU: bulk reads)."""
+    q: dict = {"groupId": gid}
+    if start:
+        q["lastAt"] = {"$gte": start}
+    if end:
+        q["firstAt"] = {"$lt": end}
+    for doc in db.chat_archive.find(q).sort("firstSeq", ASCENDING).batch_size(4):
+        for m in _inflate(doc.get("codec", "zlib"), bytes(doc["blob"])):
+            at = m.get("createdAt")
+            if (start and at < start) or (end and at >= end):
+                continue
+            yield {**m, "groupId": gid}
+
+
+def stats(db) -> dict:
+    rows = list(db.chat_archive.aggregate([
+        {"$group": {"_id": None, "docs": {"$sum": 1}, "messages": {"$sum": "$count"},
+                    "rawBytes": {"$sum": "$rawBytes"}, "bytes": {"$sum": "$bytes"}}},
+    ]))
+    out = rows[0] if rows else {"docs": 0, "messages": 0, "rawBytes": 0, "bytes": 0}
+    out.pop("_id", None)
+    out["ratio"] = round(out["rawBytes"] / out["bytes"], 2) if out["bytes"] else 0
+    return out
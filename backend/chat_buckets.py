@@ -0,0 +1,226 @@
+# backend/chat_buckets.py
+"""
+Bucketed group chat storage (CHAT_STORAGE=buckets, see chat_store.py).
+
+Instead of one group_messages document (and index entry) per message,
+messages are packed into `chat_buckets` documents per group per hour,
+at most CHAT_BUCKET_MAX messages each:
+
+    { groupId, hour, count, firstSeq, lastSeq, firstAt, lastAt,
+      messages: [ {_id, seq, createdAt, ...message fields but groupId} ] }
+
+A full bucket simply gets a sibling for the same hour. Readers page by
+`seq` and only look at the few buckets whose [firstSeq, lastSeq] range can
+hold the page; rows come back shaped like group_messages documents, so
+chat_history / gap fill serialize them unchanged. Unread counts never read
+messages (counters + group_reads).
+
+Existing group_messages are converted with
+
+    cd backend && python -m chat_buckets migrate [--db NAME] [--batch 1000] [--delete]
+
+per group in seq order, in batches; progress is kept as `migratedSeq` on the
+group's counter doc, so the tool can be stopped and re-run. Run it, switch
+CHAT_STORAGE to buckets, then run it once more to pick up messages written
+in between.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+
+from db import register_collection
+
+CHAT_BUCKET_MAX = int(os.getenv("CHAT_BUCKET_MAX", "200"))
+
+register_collection(
+    "chat_buckets",
+    [("groupId", ASCENDING), ("hour", ASCENDING)],
+    [("groupId", ASCENDING), ("firstSeq", ASCENDING)],
+    [("groupId", ASCENDING), ("lastSeq", ASCENDING)],
+    [("groupId", ASCENDING), ("firstAt", ASCENDING)],
+)
+
+INF = float("inf")
+
+# seconds around an ObjectId's timestamp searched for its message
+_ID_SLACK = timedelta(minutes=5)
+
+
+def _hour(at: datetime) -> datetime:
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+# ------------------------------- writes ---------------------------------------
+def _push(db, gid, hour: datetime, msgs: List[dict]) -> None:
+    """Append msgs (one hour, <= CHAT_BUCKET_MAX) to a bucket with room, or a new one."""
+    seqs = [m["seq"] for m in msgs]
+    ats = [m["createdAt"] for m in msgs]
+    db.chat_buckets.update_one(
+        {"groupId": gid, "hour": hour, "count": {"$lte": CHAT_BUCKET_MAX - len(msgs)}},
+        {
+            "$push": {"messages": {"$each": msgs}},
+            "$inc": {"count": len(msgs)},
+            "$min": {"firstSeq": min(seqs), "firstAt": min(ats)},
+            "$max": {"lastSeq": max(seqs), "lastAt": max(ats)},
+        },
+        upsert=True,
+    )
+
+
+def append(db, docs: Iterable[dict]) -> None:
+    """Store message docs (with _id, seq, createdAt); one update per (group, hour) chunk."""
+    chunks: Dict[Tuple, List[dict]] = {}
+    for doc in docs:
+        msg = {k: v for k, v in doc.items() if k != "groupId"}
+        chunks.setdefault((doc["groupId"], _hour(doc["createdAt"])), []).append(msg)
+    for (gid, hour), msgs in chunks.items():
+        for i in range(0, len(msgs), CHAT_BUCKET_MAX):
+            _push(db, gid, hour, msgs[i:i + CHAT_BUCKET_MAX])
+
+
+# ------------------------------- reads ----------------------------------------
+def _rows(bucket: dict, keep) -> List[dict]:
+    gid = bucket["groupId"]
+    return [{**m, "groupId": gid} for m in bucket.get("messages", ()) if keep(m["seq"])]
+
+
+def _collect(cur, keep, limit: int, edge, newest_first: bool) -> List[dict]:
+    """
+    Walk buckets from `cur` (ordered by the edge they are sorted on) and keep
+    the `limit` messages nearest to the pivot; stop once the next bucket
+    cannot hold anything nearer than what we already have.
+    """
+    rows: Dict[object, dict] = {}
+    for bucket in cur:
+        if len(rows) >= limit:
+            ranked = sorted(rows.values(), key=lambda r: r["seq"], reverse=newest_first)
+            worst = ranked[limit - 1]["seq"]
+            if (bucket[edge] < worst) if newest_first else (bucket[edge] > worst):
+                break
+        for row in _rows(bucket, keep):
+            rows.setdefault(row["_id"], row)  # a retried flush may have pushed twice
+    ranked = sorted(rows.values(), key=lambda r: r["seq"], reverse=newest_first)
+    return ranked[:limit]
+
+
+def page(db, gid, pivot: float, direction: str, limit: int):
+    """
+    Messages strictly older ("before") / newer ("after") than the seq pivot,
+    oldest → newest. Returns (rows, has_more) like groups._chat_page.
+    """
+    if direction == "before":
+        cur = (db.chat_buckets.find({"groupId": gid, "firstSeq": {"$lt": pivot}})
+                 .sort("lastSeq", DESCENDING))
+        rows = _collect(cur, lambda s: s < pivot, limit + 1, "lastSeq", newest_first=True)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        rows.reverse()
+        return rows, has_more
+    cur = (db.chat_buckets.find({"groupId": gid, "lastSeq": {"$gt": pivot}})
+             .sort("firstSeq", ASCENDING))
+    rows = _collect(cur, lambda s: s > pivot, limit + 1, "firstSeq", newest_first=False)
+    return rows[:limit], len(rows) > limit
+
+
+def exists(db, gid, pivot: float, direction: str) -> bool:
+    q = {"firstSeq": {"$lt": pivot}} if direction == "before" else {"lastSeq": {"$gt": pivot}}
+    return db.chat_buckets.find_one({"groupId": gid, **q}, {"_id": 1}) is not None
+
+
+def seq_of(db, gid, msg_id) -> Optional[int]:
+    """seq of one message: the buckets around its ObjectId time, else any bucket of gid."""
+    at = msg_id.generation_time.replace(tzinfo=None)
+    near = {"firstAt": {"$lte": at + _ID_SLACK}, "lastAt": {"$gte": at - _ID_SLACK}}
+    for q in (near, {}):
+        for bucket in db.chat_buckets.find({"groupId": gid, "messages._id": msg_id, **q},
+                                           {"messages": {"$elemMatch": {"_id": msg_id}}}).limit(1):
+            return int(bucket["messages"][0]["seq"])
+    return None
+
+
+def seq_at(db, gid, at: datetime) -> int:
+    """seq of the newest message at or before `at` (0 if none)."""
+    best = 0
+    cur = (db.chat_buckets.find({"groupId": gid, "firstAt": {"$lte": at}})
+             .sort("firstAt", DESCENDING).limit(3))  # siblings of the same hour
+    for bucket in cur:
+        for m in bucket.get("messages", ()):
+            if m["createdAt"] <= at and m["seq"] > best:
+                best = int(m["seq"])
+    return best
+
+
+def ts_pivot(db, gid, at: datetime) -> float:
+    """Pivot between messages before `at` and those at/after it (around=<ts>)."""
+    return seq_at(db, gid, at - timedelta(microseconds=1)) + 0.5
+
+
+def stats(db) -> dict:
+    rows = list(db.chat_buckets.aggregate([
+        {"$group": {"_id": None, "buckets": {"$sum": 1}, "messages": {"$sum": "$count"}}},
+    ]))
+    out = rows[0] if rows else {"buckets": 0, "messages": 0}
+    out.pop("_id", None)
+    out["avgFill"] = round(out["messages"] / out["buckets"], 1) if out["buckets"] else 0
+    return out
+
+
+# ------------------------------ migration -------------------------------------
+def migrate_group(db, gid, batch: int = 1000, delete: bool = False) -> int:
+    """Move gid's group_messages into buckets, resuming after counters.migratedSeq."""
+    from chat_store import _counter_id, ensure_seq  # lazy: chat_store imports this module
+
+    ensure_seq(db, gid)  # number legacy messages first
+    cid = _counter_id(gid)
+    counter = db.counters.find_one({"_id": cid}, {"migratedSeq": 1}) or {}
+    done = int(counter.get("migratedSeq") or 0)
+    moved = 0
+    while True:
+        docs = list(db.group_messages.find({"groupId": gid, "seq": {"$gt": done}})
+                      .sort("seq", ASCENDING).limit(batch))
+        if not docs:
+            return moved
+        append(db, docs)
+        done = docs[-1]["seq"]
+        db.counters.update_one({"_id": cid}, {"$max": {"migratedSeq": done}})
+        if delete:
+            db.group_messages.delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+        moved += len(docs)
+
+
+def migrate(db, batch: int = 1000, delete: bool = False) -> Dict[str, int]:
+    out = {}
+    for gid in db.group_messages.distinct("groupId"):
+        n = migrate_group(db, gid, batch=batch, delete=delete)
+        if n:
+            out[str(gid)] = n
+            print(f"[chat_buckets] {db.name} group {gid}: {n} messages")
+    return out
+
+
+def main(argv=None) -> None:
+    from db import all_db_names, client, ensure_schema
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("command", choices=["migrate", "stats"])
+    ap.add_argument("--db", action="append", help="database name (repeatable; default: every tenant DB)")
+    ap.add_argument("--batch", type=int, default=1000)
+    ap.add_argument("--delete", action="store_true", help="delete group_messages once they are in buckets")
+    args = ap.parse_args(argv)
+
+    for name in args.db or all_db_names():
+        db = ensure_schema(client()[name])
+        if args.command == "migrate":
+            moved = migrate(db, batch=args.batch, delete=args.delete)
+            print(f"[chat_buckets] {name}: {sum(moved.values())} messages in {len(moved)} groups")
+        else:
+            print(f"[chat_buckets] {name}: {stats(db)}")
+
+
+if __name__ == "__main__":
+    main()
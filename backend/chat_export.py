@@ -0,0 +1,128 @@
+# backend/chat_export.py
+"""
+Streaming chat export (GET /api/groups/<gid>/chat/export).
+
+Rows come straight off Mongo cursors, oldest first: the group's runs in
+chat_archive (retention), then the hot storage (group_messages or
+chat_buckets, per CHAT_STORAGE), restricted to from <= createdAt < to.
+Every `batch` rows are encoded (NDJSON lines or CSV records) into one
+chunk and, when the client accepts it, pushed through a single gzip
+stream, so memory stays at one batch however long the history is.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, Optional
+
+from pymongo import ASCENDING
+
+import chat_archive
+from chat_store import CHAT_STORAGE
+
+CHAT_EXPORT_BATCH = int(os.getenv("CHAT_EXPORT_BATCH", "1000"))
+CHAT_EXPORT_BATCH_MAX = 10000
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",  # Flask appends charset=utf-8 to text/*
+}
+
+CSV_COLUMNS = ("id", "seq", "at", "fromName", "fromEmail", "kind", "text", "fileName", "fileUrl")
+
+# spreadsheet apps evaluate cells starting with these
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _hot_rows(db, gid, start, end, batch: int) -> Iterator[dict]:
+    if CHAT_STORAGE == "buckets":
+        q: dict = {"groupId": gid}
+        if start:
+            q["lastAt"] = {"$gte": start}
+        if end:
+            q["firstAt"] = {"$lt": end}
+        cur = db.chat_buckets.find(q).sort("firstSeq", ASCENDING).batch_size(max(1, batch // 100))
+        for bucket in cur:
+            for m in sorted(bucket.get("messages", ()), key=lambda m: m["seq"]):
+                at = m.get("createdAt")
+                if (start and at < start) or (end and at >= end):
+                    continue
+                yield {**m, "groupId": gid}
+        return
+    q = {"groupId": gid}
+    if start or end:
+        q["createdAt"] = {**({"$gte": start} if start else {}), **({"$lt": end} if end else {})}
+    yield from (db.group_messages.find(q)
+                  .sort([("createdAt", ASCENDING), ("_id", ASCENDING)])
+                  .batch_size(batch))
+
+
+def iter_rows(db, gid, start: Optional[datetime] = None, end: Optional[datetime] = None,
+              batch: int = CHAT_EXPORT_BATCH) -> Iterator[dict]:
+    """Every stored message of gid in [start, end), archive first."""
+    last_archived = 0
+    for row in chat_archive.iter_range(db, gid, start, end):
+        last_archived = row["seq"]
+        yield row
+    for row in _hot_rows(db, gid, start, end, batch):
+        # a retention batch interrupted before its hot delete leaves copies behind
+        if last_archived and (row.get("seq") or 0) <= last_archived:
+            continue
+        yield row
+
+
+def _cell(value) -> str:
+    text = "" if value is None else str(value)
+    return "'" + text if text.startswith(_FORMULA_PREFIXES) else text
+
+
+def _csv_record(item: dict) -> list:
+    fr = item.get("from") or {}
+    f = item.get("file") or {}
+    return [_cell(v) for v in (
+        item.get("id"), item.get("seq"), item.get("at"), fr.get("name"), fr.get("email"),
+        item.get("kind"), item.get("text"), f.get("name"), f.get("url"),
+    )]
+
+
+def _chunks(rows: Iterable[dict], fmt: str, serialize: Callable[[dict], dict], batch: int) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf) if fmt == "csv" else None
+    if writer:
+        writer.writerow(CSV_COLUMNS)
+    n = 0
+    for row in rows:
+        item = serialize(row)
+        if writer:
+            writer.writerow(_csv_record(item))
+        else:
+            buf.write(json.dumps(item, ensure_ascii=False))
+            buf.write("\n")
+        n += 1
+        if n % batch == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def stream(rows: Iterable[dict], fmt: str, serialize: Callable[[dict], dict],
+           batch: int = CHAT_EXPORT_BATCH, gzip: bool = False) -> Iterator[bytes]:
+    """Encoded export body, one chunk per `batch` rows (gzip-framed if asked)."""
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    for text in _chunks(rows, fmt, serialize, batch):
+        data = text.encode("utf-8")
+        if gz is None:
+            yield data
+            continue
+        # sync flush: the client gets each batch as soon as it is encoded
+        out = gz.compress(data) + gz.flush(zlib.Z_SYNC_FLUSH)
+        if out:
+            yield out
+    if gz is not None:
+        yield gz.flush()
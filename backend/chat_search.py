@@ -0,0 +1,326 @@
+# backend/chat_search.py
+"""
+Full-text search over one group's chat (GET /api/groups/<gid>/chat/search).
+
+group_messages carries a compound text index
+
+    { groupId: 1, text: "text", file.name: "text" }     (file names weigh 2x)
+
+so a search is an equality on groupId plus $text: mongod walks only the
+index entries of that group for the query's terms, never the group's
+history, which keeps a search in the tens of milliseconds on groups with
+100k+ messages.
+
+Ranking: textScore cut into CHAT_SEARCH_RANK_STEP tiers, newest first
+within a tier, so equally relevant hits come back by recency. Pages are
+keyset on (tier, createdAt, _id), handed to the client as an opaque `next`
+cursor. Each hit carries a snippet around the first matching term plus
+[start, end) offsets of every match in it, for the client to highlight.
+
+With CHAT_STORAGE=buckets the equivalent index is kept on chat_buckets'
+message arrays. $text can only pick buckets, so it is given the positive
+words alone (a negated word or a phrase would accept or drop a whole bucket)
+and the query proper (negations, phrases, terms) is applied here to each
+message, with a light stemmer standing in for mongod's. Matching buckets are
+opened newest first (by lastSeq) in windows of CHAT_SEARCH_BUCKETS_MAX and
+their messages scored on the same tiers; ranking is per window, and the
+cursor also carries the window's upper lastSeq so the next page resumes
+there and older windows are reached.
+Messages moved to chat_archive by retention are not searched.
+"""
+from __future__ import annotations
+
+import base64
+import math
+import os
+import re
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT
+
+from chat_store import CHAT_STORAGE
+from db import register_collection
+
+CHAT_SEARCH_RANK_STEP = float(os.getenv("CHAT_SEARCH_RANK_STEP", "0.5"))
+CHAT_SEARCH_BUCKETS_MAX = int(os.getenv("CHAT_SEARCH_BUCKETS_MAX", "200"))
+CHAT_SEARCH_SNIPPET = 160
+CHAT_SEARCH_QUERY_MAX = 200
+
+register_collection(
+    "group_messages",
+    ([("groupId", ASCENDING), ("text", TEXT), ("file.name", TEXT)],
+     {"name": "chat_search", "weights": {"text": 1, "file.name": 2}}),
+)
+if CHAT_STORAGE == "buckets":
+    # only when buckets are the live storage: every $push re-tokenizes the bucket
+    register_collection(
+        "chat_buckets",
+        ([("groupId", ASCENDING), ("messages.text", TEXT), ("messages.file.name", TEXT)],
+         {"name": "chat_search", "weights": {"messages.text": 1, "messages.file.name": 2}}),
+    )
+
+_WORD = re.compile(r"[\w']+", re.UNICODE)
+# a $search string: -"negated phrase", "phrase", -negated and plain terms
+_TOKEN = re.compile(r'(-?)"([^"]*)"?|(\S+)')
+_VOWEL = re.compile(r"[aeiouy]")
+
+
+# ------------------------------ query terms -----------------------------------
+def _stem(word: str) -> str:
+    """
+    Light stand-in for mongod's (Snowball) stemmer. Applied to both the query
+    and the message words, so study / studies / studying / studied all meet
+    at "studi" the way they do in the text index.
+    """
+    word = word.split("'")[0].lower()
+    if len(word) <= 3:
+        return word
+    if word.endswith("sses"):
+        word = word[:-2]
+    elif word.endswith(("ies", "ied")):
+        word = word[:-3] + "i"
+    elif word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        word = word[:-1]
+    for suf in ("ingly", "edly", "ing", "ed"):
+        base = word[: -len(suf)]
+        if word.endswith(suf) and len(base) >= 3 and _VOWEL.search(base):
+            word = base
+            if len(word) > 3 and word[-1] == word[-2] and word[-1] not in "lsz":
+                word = word[:-1]  # running -> run
+            break
+    if len(word) > 3 and word.endswith("y") and word[-2] not in "aeiou":
+        word = word[:-1] + "i"
+    if len(word) > 3 and word.endswith("e"):
+        word = word[:-1]
+    return word
+
+
+def _stems(text: str) -> List[str]:
+    out: List[str] = []
+    for word in _WORD.findall(text):
+        stem = _stem(word)
+        if stem and stem not in out:
+            out.append(stem)
+    return out
+
+
+def parse(q: str) -> Tuple[List[str], List[str], List[str], List[str]]:
+    """
+    (terms, negated terms, phrases, negated phrases) of a $search string.
+    Terms are stemmed (phrase words count as terms too, as in mongod's
+    scoring); phrases are lower-cased.
+    """
+    pos: List[str] = []
+    neg: List[str] = []
+    phrases: List[str] = []
+    neg_phrases: List[str] = []
+    for m in _TOKEN.finditer(q):
+        minus, phrase, word = m.group(1), m.group(2), m.group(3)
+        if word is None:
+            phrase = " ".join(phrase.lower().split())
+            if phrase:
+                (neg_phrases if minus else phrases).append(phrase)
+                if not minus:
+                    pos += [t for t in _stems(phrase) if t not in pos]
+        elif word.startswith("-"):
+            neg += [t for t in _stems(word[1:]) if t not in neg]
+        else:
+            pos += [t for t in _stems(word) if t not in pos]
+    return pos, neg, phrases, neg_phrases
+
+
+def positive_words(q: str) -> str:
+    """The words of a $search string that are not negated, phrase words included, unquoted."""
+    words = []
+    for m in _TOKEN.finditer(q):
+        minus, phrase, word = m.group(1), m.group(2), m.group(3)
+        if word is None and not minus:
+            words.append(phrase)
+        elif word is not None and not word.startswith("-"):
+            words.append(word)
+    return " ".join(" ".join(words).split())
+
+
+def terms(q: str) -> List[str]:
+    """Positive words of a $search string (negated -words dropped), stemmed, deduplicated."""
+    return parse(q)[0]
+
+
+class _Matcher:
+    """Finds the words of a text whose stem is one of `stems` (re.Pattern-like)."""
+
+    def __init__(self, stems: List[str]):
+        self.stems = frozenset(stems)
+
+    def finditer(self, text: str):
+        return (m for m in _WORD.finditer(text or "") if _stem(m.group()) in self.stems)
+
+    def search(self, text: str):
+        return next(self.finditer(text), None)
+
+    def findall(self, text: str) -> List[str]:
+        return [m.group() for m in self.finditer(text)]
+
+
+def matcher(stems: List[str]) -> Optional[_Matcher]:
+    if not stems:
+        return None
+    return _Matcher(stems)
+
+
+def snippet(text: str, rx, width: int = CHAT_SEARCH_SNIPPET) -> dict:
+    """Up to `width` chars of text around the first match, with match offsets in it."""
+    text = text or ""
+    first = rx.search(text) if rx else None
+    start = 0
+    if first and len(text) > width:
+        start = max(0, min(first.start() - width // 3, len(text) - width))
+        if start:
+            space = text.find(" ", start, first.start())
+            start = space + 1 if space != -1 else start
+    end = min(len(text), start + width)
+    frag = text[start:end]
+    lead = "…" if start else ""
+    highlights = [[m.start() + len(lead), m.end() + len(lead)] for m in rx.finditer(frag)] if rx else []
+    return {"text": lead + frag + ("…" if end < len(text) else ""), "highlights": highlights}
+
+
+# -------------------------------- cursors -------------------------------------
+def _tier(score: float) -> int:
+    return int(math.floor(score / CHAT_SEARCH_RANK_STEP))
+
+
+def encode_cursor(tier: int, at: datetime, mid, window: int = 0) -> str:
+    """`window`: bucket mode only, the lastSeq the row's bucket window lies below (0 = newest)."""
+    ms = int((at - datetime(1970, 1, 1)).total_seconds() * 1000)
+    raw = f"{tier}:{ms}:{mid}:{window}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(raw: str) -> Tuple[int, datetime, ObjectId, int]:
+    """Inverse of encode_cursor; ValueError on anything malformed."""
+    try:
+        text = base64.urlsafe_b64decode(raw + "=" * (-len(raw) % 4)).decode()
+        tier, ms, mid, *rest = text.split(":")
+        window = int(rest[0]) if rest else 0
+        if len(rest) > 1 or window < 0:
+            raise ValueError(text)
+        return int(tier), datetime.utcfromtimestamp(int(ms) / 1000.0), ObjectId(mid), window
+    except Exception:
+        raise ValueError("bad search cursor")
+
+
+def _after(cursor) -> dict:
+    """Keyset filter: everything ranked below the cursor's (tier, createdAt, _id)."""
+    tier, at, mid = cursor[:3]
+    return {"$or": [
+        {"_tier": {"$lt": tier}},
+        {"_tier": tier, "createdAt": {"$lt": at}},
+        {"_tier": tier, "createdAt": at, "_id": {"$lt": mid}},
+    ]}
+
+
+# -------------------------------- search --------------------------------------
+def _search_messages(db, gid, q: str, cursor, limit: int) -> List[dict]:
+    pipeline = [
+        {"$match": {"groupId": gid, "$text": {"$search": q}}},
+        {"$addFields": {"_score": {"$meta": "textScore"}}},
+        {"$addFields": {"_tier": {"$floor": {"$divide": ["$_score", CHAT_SEARCH_RANK_STEP]}}}},
+    ]
+    if cursor:
+        pipeline.append({"$match": _after(cursor)})
+    pipeline += [
+        {"$sort": {"_tier": DESCENDING, "createdAt": DESCENDING, "_id": DESCENDING}},
+        {"$limit": limit + 1},
+    ]
+    return list(db.group_messages.aggregate(pipeline))
+
+
+def _phrase_in(phrase: str, *fields: str) -> bool:
+    return any(phrase in " ".join(f.lower().split()) for f in fields)
+
+
+def _score(msg: dict, query, rx) -> float:
+    """
+    Bucket mode: $text only says that some message of the bucket matches, so
+    the query is applied to each message here the way mongod applies it to a
+    document: negated terms and phrases exclude it, every phrase must occur,
+    and without phrases one term must. Returns 0 for no match, otherwise a
+    score on roughly textScore's scale (file names 2x).
+    """
+    _terms, neg, phrases, neg_phrases = query
+    text = msg.get("text") or ""
+    name = (msg.get("file") or {}).get("name") or ""
+    if neg and any(_stem(w) in neg for w in _WORD.findall(f"{text} {name}")):
+        return 0.0
+    if any(_phrase_in(p, text, name) for p in neg_phrases):
+        return 0.0
+    if not all(_phrase_in(p, text, name) for p in phrases):
+        return 0.0
+    hits = 0
+    if rx is not None:
+        hits = len(rx.findall(text)) + 2 * len(rx.findall(name))
+    if phrases:
+        return float(max(hits, 1))
+    return float(hits)
+
+
+def _search_buckets(db, gid, q: str, query, rx, cursor, limit: int) -> List[dict]:
+    """
+    Windows of CHAT_SEARCH_BUCKETS_MAX matching buckets, newest first, until
+    limit + 1 hits are found or the buckets run out. Each hit keeps `_window`
+    (the lastSeq its window lies below, 0 for the newest) for the cursor.
+    """
+    words = positive_words(q)
+    if not words:
+        return []
+    key = lambda h: (h["_tier"], h["createdAt"], h["_id"])  # noqa: E731
+    window = cursor[3] if cursor else 0
+    out: List[dict] = []
+    while len(out) <= limit:
+        spec = {"groupId": gid, "$text": {"$search": words}}
+        if window:
+            spec["lastSeq"] = {"$lt": window}
+        buckets = list(db.chat_buckets.find(spec, {"messages": 1, "lastSeq": 1})
+                         .sort("lastSeq", DESCENDING).limit(CHAT_SEARCH_BUCKETS_MAX))
+        hits = []
+        for bucket in buckets:
+            for m in bucket.get("messages", ()):
+                score = _score(m, query, rx)
+                if score:
+                    hits.append({**m, "groupId": gid, "_score": score, "_tier": _tier(score),
+                                 "_window": window})
+        if cursor and window == cursor[3]:
+            hits = [h for h in hits if key(h) < cursor[:3]]
+        hits.sort(key=key, reverse=True)
+        out += hits[: limit + 1 - len(out)]
+        if len(buckets) < CHAT_SEARCH_BUCKETS_MAX:
+            break
+        window = buckets[-1]["lastSeq"]
+    return out
+
+
+def search(db, gid, q: str, limit: int, cursor: Optional[str] = None):
+    """
+    One page of gid's messages matching q, best first.
+    Returns (rows, next_cursor); each row is a stored message plus
+    `_score` and `snippet`. Raises ValueError for a bad cursor.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    query = parse(q)
+    rx = matcher(query[0])
+    if CHAT_STORAGE == "buckets":
+        rows = _search_buckets(db, gid, q, query, rx, after, limit)
+    else:
+        rows = _search_messages(db, gid, q, after, limit)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    for row in rows:
+        row["snippet"] = snippet(row.get("text") or (row.get("file") or {}).get("name") or "", rx)
+    nxt = None
+    if more and rows:
+        last = rows[-1]
+        nxt = encode_cursor(int(last["_tier"]), last["createdAt"], last["_id"], last.get("_window", 0))
+    return rows, nxt
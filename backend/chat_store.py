@@ -0,0 +1,466 @@
+# backend/chat_store.py
+"""
+Group chat writes + O(1) unread counters.
+
+Every message gets a per-group, monotonically increasing `seq`, allocated
+atomically from the `counters` collection ({_id: "chat:<gid>", seq}), so the
+counter doc doubles as the group's lastSeq. `group_reads.lastReadSeq` records
+how far a user has read and `group_reads.ownSeqs` the seqs of the user's
+own messages after that point, so
+
+    unread = lastSeq - lastReadSeq - len(ownSeqs)
+
+needs no scan of group_messages. Sending only appends to ownSeqs (capped
+at CHAT_OWN_SEQS_MAX); it does not move the read marker, so messages from
+others that arrived before one's own stay unread until the chat is read.
+
+Groups/reads that predate seq are migrated lazily: the first time a group's
+counter is needed its old messages are numbered in (createdAt, _id) order,
+and a read marker with only lastReadAt is translated to a seq once.
+
+Write modes (CHAT_WRITE_MODE):
+  sync   insert_one per message and update_one per read marker, before the
+         caller broadcasts (default)
+  group  group commit: messages are buffered and written with insert_many
+         every CHAT_FLUSH_MS / CHAT_FLUSH_MAX messages; insert_message waits
+         for its batch, so a message is stored before it is broadcast
+  async  write-behind: insert_message returns right away (the _id is an
+         ObjectId made here) and the caller broadcasts while the batch is
+         pending. A crash loses what is still buffered, and history reads
+         may briefly miss the newest messages.
+In both buffered modes read markers are coalesced per (user, group) and
+written with one bulk_write per flush, and at most CHAT_QUEUE_MAX messages
+wait: beyond that senders block for up to CHAT_QUEUE_BLOCK_SECONDS and then
+write their message inline. seq is still allocated per message up front.
+
+Storage (CHAT_STORAGE): `messages` keeps one group_messages document per
+message; `buckets` packs them into per-group hourly bucket documents
+(chat_buckets.py). Everything that reads or writes message rows goes
+through this module (and groups.chat_history through chat_buckets), so the
+switch is transparent to callers.
+"""
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+import chat_buckets
+from db import register_collection
+
+CHAT_STORAGE = os.getenv("CHAT_STORAGE", "messages").strip().lower()  # messages | buckets
+CHAT_WRITE_MODE = os.getenv("CHAT_WRITE_MODE", "sync").strip().lower()
+CHAT_FLUSH_MS = float(os.getenv("CHAT_FLUSH_MS", "5"))
+CHAT_FLUSH_MAX = int(os.getenv("CHAT_FLUSH_MAX", "500"))
+CHAT_QUEUE_MAX = int(os.getenv("CHAT_QUEUE_MAX", "10000"))
+CHAT_QUEUE_BLOCK_SECONDS = float(os.getenv("CHAT_QUEUE_BLOCK_SECONDS", "2"))
+CHAT_FLUSH_RETRIES = 3
+CHAT_OWN_SEQS_MAX = 1000  # own messages remembered per unread stretch
+
+register_collection("counters")
+register_collection("group_messages", [("groupId", ASCENDING), ("seq", ASCENDING)])
+
+_BATCH = 1000
+
+# (db_name, gid) whose counter doc is known to exist in this process
+_ready: set = set()
+_ready_lock = threading.Lock()
+
+
+def _counter_id(gid) -> str:
+    return f"chat:{gid}"
+
+
+def _number_legacy(db, gid) -> None:
+    """Assign seq 1..n to messages written before seq existed."""
+    cur = (
+        db.group_messages
+          .find({"groupId": gid, "seq": {"$exists": False}}, {"_id": 1})
+          .sort([("createdAt", ASCENDING), ("_id", ASCENDING)])
+    )
+    ops, n = [], 0
+    for row in cur:
+        n += 1
+        ops.append(UpdateOne({"_id": row["_id"]}, {"$set": {"seq": n}}))
+        if len(ops) >= _BATCH:
+            db.group_messages.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        db.group_messages.bulk_write(ops, ordered=False)
+
+
+def ensure_seq(db, gid) -> None:
+    """Make sure the group's counter exists (numbering legacy messages once)."""
+    key = (db.name, str(gid))
+    if key in _ready:
+        return
+    cid = _counter_id(gid)
+    if db.counters.find_one({"_id": cid}, {"_id": 1}) is None:
+        legacy = db.group_messages.count_documents({"groupId": gid, "seq": {"$exists": False}})
+        try:
+            # claiming the counter at `legacy` reserves 1..legacy for the backfill;
+            # concurrent writers continue from legacy + 1
+            db.counters.insert_one({"_id": cid, "seq": legacy})
+            if legacy:
+                _number_legacy(db, gid)
+        except DuplicateKeyError:
+            pass  # another worker created it
+    with _ready_lock:
+        _ready.add(key)
+
+
+def next_seq(db, gid) -> int:
+    ensure_seq(db, gid)
+    doc = db.counters.find_one_and_update(
+        {"_id": _counter_id(gid)},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return int(doc["seq"])
+
+
+def last_seqs(db, gids: Iterable) -> Dict[str, int]:
+    """{gid: lastSeq} for several groups in one query."""
+    gids = list(gids)
+    for gid in gids:
+        ensure_seq(db, gid)
+    rows = db.counters.find({"_id": {"$in": [_counter_id(g) for g in gids]}})
+    by_id = {r["_id"]: int(r.get("seq") or 0) for r in rows}
+    return {str(g): by_id.get(_counter_id(g), 0) for g in gids}
+
+
+# ------------------------------- reads ----------------------------------------
+def mark_read(db, uid, gid, seq: Optional[int] = None) -> None:
+    """Advance uid's read marker in gid to `seq` (default: the latest message)."""
+    if seq is None:
+        seq = last_seqs(db, [gid])[str(gid)]
+    if _writer is not None:
+        _writer.add_read(db, uid, gid, int(seq))
+        return
+    now = datetime.utcnow()
+    db.group_reads.update_one(
+        {"userId": uid, "groupId": gid},
+        _read_update(int(seq), now),
+        upsert=True,
+    )
+
+
+def _read_update(seq: int, at: datetime) -> dict:
+    return {
+        "$max": {"lastReadSeq": seq},
+        "$set": {"lastReadAt": at, "updatedAt": at},
+        "$pull": {"ownSeqs": {"$lte": seq}},  # read now; no longer needs subtracting
+    }
+
+
+def _own_update(seqs: List[int]) -> dict:
+    return {"$push": {"ownSeqs": {"$each": seqs, "$slice": -CHAT_OWN_SEQS_MAX}},
+            "$setOnInsert": {"lastReadSeq": 0}}
+
+
+def note_own(db, uid, gid, seq: int) -> None:
+    """Record that uid sent message `seq` in gid, so it never counts as unread for them."""
+    if _writer is not None:
+        _writer.add_own(db, uid, gid, int(seq))
+        return
+    db.group_reads.update_one({"userId": uid, "groupId": gid}, _own_update([int(seq)]), upsert=True)
+
+
+def _seq_at(db, gid, at: datetime) -> int:
+    """seq of the newest message at or before `at` (legacy lastReadAt → seq)."""
+    if CHAT_STORAGE == "buckets":
+        return chat_buckets.seq_at(db, gid, at)
+    row = db.group_messages.find_one(
+        {"groupId": gid, "createdAt": {"$lte": at}, "seq": {"$exists": True}},
+        {"seq": 1},
+        sort=[("createdAt", DESCENDING), ("_id", DESCENDING)],
+    )
+    return int(row["seq"]) if row else 0
+
+
+def read_markers(db, uid, gids: Iterable) -> Dict[str, Tuple[int, int]]:
+    """
+    {gid: (lastReadSeq, own messages after it)} for uid, migrating
+    lastReadAt-only markers.
+    """
+    gids = list(gids)
+    out = {str(g): (0, 0) for g in gids}
+    for r in db.group_reads.find({"userId": uid, "groupId": {"$in": gids}},
+                                 {"groupId": 1, "lastReadSeq": 1, "lastReadAt": 1, "ownSeqs": 1}):
+        gid = r["groupId"]
+        seq = r.get("lastReadSeq")
+        if seq is None and r.get("lastReadAt"):
+            ensure_seq(db, gid)
+            seq = _seq_at(db, gid, r["lastReadAt"])
+            db.group_reads.update_one({"_id": r["_id"]}, {"$max": {"lastReadSeq": seq}})
+        seq = int(seq or 0)
+        out[str(gid)] = (seq, sum(1 for s in r.get("ownSeqs") or () if s > seq))
+    return out
+
+
+def unread_counts(db, uid, gids: Iterable) -> Dict[str, int]:
+    """{gid: unread} from counters + read markers (two queries, no scans)."""
+    gids = list(gids)
+    if not gids:
+        return {}
+    last = last_seqs(db, gids)
+    read = read_markers(db, uid, gids)
+    return {g: max(0, last[g] - read[g][0] - read[g][1]) for g in last}
+
+
+# ------------------------------- writes ---------------------------------------
+def _store_many(db, docs: List[dict]) -> None:
+    if CHAT_STORAGE == "buckets":
+        chat_buckets.append(db, docs)
+    else:
+        db.group_messages.insert_many(docs, ordered=False)
+
+
+def _store_one(db, doc: dict):
+    if CHAT_STORAGE == "buckets":
+        doc.setdefault("_id", ObjectId())
+        chat_buckets.append(db, [doc])
+        return doc["_id"]
+    return db.group_messages.insert_one(doc).inserted_id
+
+
+def _sender_id(doc: dict):
+    return (doc.get("from") or {}).get("id") or doc.get("userId")
+
+
+def insert_message(db, doc: dict):
+    """Stamp `seq`, insert, and note it as the sender's own message. Returns the new _id."""
+    gid = doc["groupId"]
+    doc["seq"] = next_seq(db, gid)
+    if _writer is None:
+        msg_id = _store_one(db, doc)
+    else:
+        doc.setdefault("_id", ObjectId())
+        _writer.add_message(db, doc)
+        msg_id = doc["_id"]
+    sender = _sender_id(doc)
+    if sender:
+        note_own(db, sender, gid, doc["seq"])
+    return msg_id
+
+
+# --------------------------- write-behind buffer ------------------------------
+class _Ticket:
+    """A group-commit sender waiting for its batch."""
+    __slots__ = ("done", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error: Optional[Exception] = None
+
+
+class WriteBehind:
+    """Buffers message inserts and read markers; one flusher thread per process."""
+
+    def __init__(self, mode: str, flush_ms: float = CHAT_FLUSH_MS, flush_max: int = CHAT_FLUSH_MAX,
+                 queue_max: int = CHAT_QUEUE_MAX, block_seconds: float = CHAT_QUEUE_BLOCK_SECONDS):
+        self.mode = mode
+        self.flush_s = max(0.0, flush_ms) / 1000.0
+        self.flush_max = max(1, flush_max)
+        self.queue_max = max(self.flush_max, queue_max)
+        self.block_seconds = block_seconds
+        self._cond = threading.Condition()
+        self._msgs: List[Tuple[object, dict, Optional[_Ticket]]] = []
+        # (db name, uid, gid) -> (db, seq, at); only the highest seq is written
+        self._reads: Dict[tuple, tuple] = {}
+        # (db name, uid, gid) -> (db, [own seqs])
+        self._own: Dict[tuple, tuple] = {}
+        self._thread: Optional[threading.Thread] = None
+        self.counters = {
+            "messages": 0, "reads": 0, "readsCoalesced": 0, "own": 0, "flushes": 0,
+            "blocked": 0, "inline": 0, "failed": 0, "maxDepth": 0,
+        }
+
+    # --- producers ---
+    def add_message(self, db, doc: dict) -> None:
+        ticket = _Ticket() if self.mode == "group" else None
+        with self._cond:
+            if len(self._msgs) >= self.queue_max:
+                self.counters["blocked"] += 1
+                self._cond.wait_for(lambda: len(self._msgs) < self.queue_max, timeout=self.block_seconds)
+            full = len(self._msgs) >= self.queue_max
+            if not full:
+                self._msgs.append((db, doc, ticket))
+                depth = len(self._msgs)
+                if depth > self.counters["maxDepth"]:
+                    self.counters["maxDepth"] = depth
+                self._cond.notify_all()
+            else:
+                self.counters["inline"] += 1
+        if full:  # flusher is not keeping up: pay for the write here
+            _store_one(db, doc)
+            return
+        self._ensure_thread()
+        if ticket:
+            ticket.done.wait()
+            if ticket.error:
+                raise ticket.error
+
+    def add_read(self, db, uid, gid, seq: int) -> None:
+        key = (db.name, uid, gid)
+        with self._cond:
+            prev = self._reads.get(key)
+            if prev:
+                self.counters["readsCoalesced"] += 1
+            if not prev or seq > prev[1]:
+                self._reads[key] = (db, seq, datetime.utcnow())
+            self._cond.notify_all()
+        self._ensure_thread()
+
+    def add_own(self, db, uid, gid, seq: int) -> None:
+        key = (db.name, uid, gid)
+        with self._cond:
+            self._own.setdefault(key, (db, []))[1].append(seq)
+            self._cond.notify_all()
+        self._ensure_thread()
+
+    # --- flusher ---
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="chat-write-behind", daemon=True)
+                self._thread.start()
+
+    def _take(self, wait: bool):
+        with self._cond:
+            if wait:
+                self._cond.wait_for(lambda: self._msgs or self._reads or self._own)
+                # let the batch fill up for one window unless it is already full
+                self._cond.wait_for(lambda: len(self._msgs) >= self.flush_max, timeout=self.flush_s)
+            msgs, self._msgs = self._msgs[:self.flush_max], self._msgs[self.flush_max:]
+            reads, self._reads = self._reads, {}
+            own, self._own = self._own, {}
+            self._cond.notify_all()  # wake senders blocked on a full queue
+        return msgs, reads, own
+
+    def _write(self, msgs, reads, own) -> None:
+        by_db: Dict[str, tuple] = {}
+        for db, doc, ticket in msgs:
+            by_db.setdefault(db.name, (db, [], []))
+            by_db[db.name][1].append(doc)
+            if ticket:
+                by_db[db.name][2].append(ticket)
+        for db, docs, tickets in by_db.values():
+            error = self._insert_many(db, docs)
+            for t in tickets:
+                t.error = error
+                t.done.set()
+
+        ops: Dict[str, tuple] = {}
+        for (_, uid, gid), (db, seqs) in own.items():
+            ops.setdefault(db.name, (db, []))[1].append(
+                UpdateOne({"userId": uid, "groupId": gid}, _own_update(seqs), upsert=True))
+        for (_, uid, gid), (db, seq, at) in reads.items():
+            ops.setdefault(db.name, (db, []))[1].append(
+                UpdateOne({"userId": uid, "groupId": gid}, _read_update(seq, at), upsert=True))
+        for db, batch in ops.values():
+            try:
+                db.group_reads.bulk_write(batch, ordered=False)
+            except Exception as e:
+                print("[chat] read marker flush failed:", e)
+
+        with self._cond:
+            c = self.counters
+            c["flushes"] += 1
+            c["messages"] += len(msgs)
+            c["reads"] += len(reads)
+            c["own"] += sum(len(seqs) for _db, seqs in own.values())
+
+    def _insert_many(self, db, docs: List[dict]) -> Optional[Exception]:
+        for attempt in range(CHAT_FLUSH_RETRIES):
+            try:
+                _store_many(db, docs)
+                return None
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                if all(err.get("code") == 11000 for err in errors):
+                    return None  # an earlier attempt got them in
+                error = e
+            except Exception as e:
+                error = e
+            time.sleep(0.05 * (2 ** attempt))
+        print(f"[chat] dropping {len(docs)} buffered messages after {CHAT_FLUSH_RETRIES} attempts:", error)
+        with self._cond:
+            self.counters["failed"] += len(docs)
+        return error
+
+    def _loop(self) -> None:
+        print(f"[chat] write-behind flusher started (mode={self.mode})")
+        while True:
+            msgs, reads, own = self._take(wait=True)
+            try:
+                self._write(msgs, reads, own)
+            except Exception as e:
+                print("[chat] flush error:", e)
+
+    def flush(self) -> None:
+        """Write everything buffered now (shutdown, tests, benchmarks)."""
+        while True:
+            msgs, reads, own = self._take(wait=False)
+            if not msgs and not reads and not own:
+                return
+            self._write(msgs, reads, own)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"mode": self.mode, "flushMs": self.flush_s * 1000, "flushMax": self.flush_max,
+                    "queueMax": self.queue_max, "depth": len(self._msgs),
+                    "pendingReads": len(self._reads), **self.counters}
+
+
+def _make_writer(mode: str = CHAT_WRITE_MODE) -> Optional[WriteBehind]:
+    if mode in ("group", "async"):
+        writer = WriteBehind(mode)
+        atexit.register(writer.flush)
+        return writer
+    if mode != "sync":
+        print(f"[chat] unknown CHAT_WRITE_MODE={mode!r}, using sync")
+    return None
+
+
+_writer = _make_writer()
+
+
+def chat_write_stats() -> dict:
+    stats = _writer.stats() if _writer is not None else {"mode": "sync"}
+    return {"storage": CHAT_STORAGE, **stats}
+
+
+# ------------------------------- gap fill -------------------------------------
+def messages_after(db, gid, seq: int, limit: int):
+    """
+    Messages of gid with seq > `seq`, oldest first, at most `limit`.
+    Returns (rows, has_more); one range scan on (groupId, seq).
+    """
+    if CHAT_STORAGE == "buckets":
+        return chat_buckets.page(db, gid, seq, "after", limit)
+    rows = list(
+        db.group_messages
+          .find({"groupId": gid, "seq": {"$gt": int(seq)}})
+          .sort("seq", ASCENDING)
+          .limit(limit + 1)
+    )
+    return rows[:limit], len(rows) > limit
+
+
+def seq_of(db, gid, msg_id) -> Optional[int]:
+    """seq of one message of gid (None if it is not there / predates seq)."""
+    if CHAT_STORAGE == "buckets":
+        return chat_buckets.seq_of(db, gid, msg_id)
+    row = db.group_messages.find_one({"_id": msg_id, "groupId": gid}, {"seq": 1})
+    return int(row["seq"]) if row and row.get("seq") is not None else None
@@ -22,6 +22,11 @@ class Config:
     SMTP_PASS = os.getenv("SMTP_PASS")  # your 16-character App Password
     FROM_EMAIL = os.getenv("FROM_EMAIL", SMTP_USER)
 
+    # --- Server (see serve.py) ---
+    ASYNC_MODE = os.getenv("ASYNC_MODE", "threading")  # threading | eventlet | gevent
+    # app-wide jobs (reminders, email outbox, retention, text extraction); serve.py enables them in one worker only
+    BACKGROUND_WORKERS = os.getenv("BACKGROUND_WORKERS", "true").lower() in ("true", "1", "yes")
+
     # --- Optional Debug Flags ---
     DEBUG = os.getenv("DEBUG", "True").lower() in ("true", "1", "yes")
 
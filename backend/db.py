@@ -1,9 +1,13 @@
 # backend/db.py
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 from flask import g
-from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT
+from pymongo.errors import CollectionInvalid, OperationFailure
 from helpers import university_from_email, tenant_from_request
 
 # ----------------- Client -----------------
@@ -24,16 +28,159 @@ def _client() -> MongoClient:
         uri = "mongodb://127.0.0.1:27017/study_group_hub"
     return MongoClient(uri, uuidRepresentation="standard")
 
+# ----------------- Schema registry -----------------
+# Blueprints declare their collections + indexes once at import time via
+# register_collection(). The registry is applied the first time a DB handle
+# is handed out (once per database per process), so handlers no longer pay
+# for list_collection_names()/create_index round trips on every request.
+
+TENANT_DB_PREFIX = "study_group_hub_"
+
+# { collection: { index_key_tuple: (keys, options) } }
+_SCHEMA: Dict[str, Dict[tuple, Tuple[list, dict]]] = {}
+# { collection: () -> name of the only DB it lives in } (app-wide collections)
+_ONLY_IN: Dict[str, Callable[[], str]] = {}
+_schema_version = 0
+_schema_lock = threading.Lock()
+
+# { db_name: schema version applied }
+_applied: Dict[str, int] = {}
+_db_locks: Dict[str, threading.Lock] = {}
+
+
+def _norm_keys(keys) -> List[tuple]:
+    if isinstance(keys, str):
+        return [(keys, ASCENDING)]
+    return [tuple(k) for k in keys]
+
+
+def register_collection(name: str, *indexes, only_in: Optional[Callable[[], str]] = None) -> None:
+    """
+    Declare a collection and its indexes. Each index is either a key spec
+    (``"email"`` or ``[("groupId", 1), ("createdAt", -1)]``) or a
+    ``(keys, {options})`` tuple. Declaring the same keys twice is a no-op.
+    `only_in` returns the name of the one DB an app-wide collection lives in
+    (e.g. the email outbox); it is then not created in any other DB.
+    """
+    global _schema_version
+    with _schema_lock:
+        if only_in is not None:
+            _ONLY_IN[name] = only_in
+        coll = _SCHEMA.setdefault(name, {})
+        for spec in indexes:
+            if isinstance(spec, tuple) and len(spec) == 2 and isinstance(spec[1], dict):
+                keys, opts = spec
+            else:
+                keys, opts = spec, {}
+            keys = _norm_keys(keys)
+            coll.setdefault(tuple(keys), (keys, dict(opts)))
+        _schema_version += 1
+
+
+def apply_schema(db) -> int:
+    """
+    Create every registered collection/index in `db`. Idempotent.
+    Index option conflicts (codes 85/86) are ignored. Returns #indexes applied.
+    """
+    with _schema_lock:
+        schema = {c: list(ix.values()) for c, ix in _SCHEMA.items()
+                  if c not in _ONLY_IN or _ONLY_IN[c]() == db.name}
+
+    existing = set(db.list_collection_names())
+    applied = 0
+    for coll_name, indexes in schema.items():
+        if coll_name not in existing:
+            try:
+                db.create_collection(coll_name)
+            except CollectionInvalid:
+                pass
+        coll = db[coll_name]
+        for keys, opts in indexes:
+            try:
+                coll.create_index(keys, background=True, **opts)
+                applied += 1
+            except OperationFailure as e:
+                if getattr(e, "code", None) in (85, 86):
+                    continue
+                print(f"[db] index {coll_name}{keys} failed on {db.name}:", e)
+    return applied
+
+
+def ensure_schema(db):
+    """Apply the registry to `db` once per process (re-applied if it grows)."""
+    name = db.name
+    version = _schema_version
+    if _applied.get(name) == version:
+        return db
+
+    with _schema_lock:
+        lock = _db_locks.setdefault(name, threading.Lock())
+    with lock:
+        if _applied.get(name) == version:
+            return db
+        try:
+            apply_schema(db)
+            _applied[name] = version
+        except Exception as e:
+            # leave unmarked so the next touch retries
+            print(f"[db] schema bootstrap failed for {name}:", e)
+    return db
+
+
+def tenant_db_names() -> List[str]:
+    """All per-tenant database names on the cluster."""
+    return sorted(
+        n for n in client().list_database_names() if n.startswith(TENANT_DB_PREFIX)
+    )
+
+
+def default_db_name() -> str:
+    """Legacy single-tenant DB (from MONGO_URI path or MONGO_DB_NAME)."""
+    return _default_db_name_from_uri(os.getenv("MONGO_URI") or "")
+
+
+def all_db_names() -> List[str]:
+    """Tenant DBs plus the legacy single-tenant default DB."""
+    names = tenant_db_names()
+    default_name = default_db_name()
+    if default_name not in names:
+        names.append(default_name)
+    return names
+
+
+def apply_schema_all(max_workers: int = 8) -> Dict[str, object]:
+    """
+    Apply the registry to every tenant DB concurrently.
+    Returns { db_name: indexes_applied | "error: ..." }.
+    """
+    names = all_db_names()
+
+    def _one(name):
+        db = client()[name]
+        try:
+            n = apply_schema(db)
+            _applied[name] = _schema_version
+            return name, n
+        except Exception as e:
+            return name, f"error: {e}"
+
+    out: Dict[str, object] = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for name, res in pool.map(_one, names):
+            out[name] = res
+    return out
+
+
 # ----------------- Per-tenant DB helpers -----------------
 
 def client() -> MongoClient:
     return _client()
 
 def db_name_for_tenant(tenant: str) -> str:
-    return f"study_group_hub_{tenant}"
+    return f"{TENANT_DB_PREFIX}{tenant}"
 
 def db_for_tenant(tenant: str):
-    return client()[db_name_for_tenant(tenant)]
+    return ensure_schema(client()[db_name_for_tenant(tenant)])
 
 def db_for_email(email: str):
     """
@@ -41,7 +188,7 @@ def db_for_email(email: str):
     Raises ValueError if email is not a university email.
     """
     _, tenant, dbname = university_from_email(email)
-    return client()[dbname]
+    return ensure_schema(client()[dbname])
 
 def bind_request_db():
     """
@@ -55,7 +202,7 @@ def bind_request_db():
         # legacy fallback (single-tenant)
         if "db" not in g:
             uri = os.getenv("MONGO_URI", "")
-            g.db = client()[_default_db_name_from_uri(uri)]
+            g.db = ensure_schema(client()[_default_db_name_from_uri(uri)])
 
 # ----------------- Public API -----------------
 
@@ -67,24 +214,20 @@ def get_db():
 def close_db(e=None):
     g.pop("db", None)
 
-# --- bootstrap helpers (same as before) ---
+# --- core collections (users + groups) ---
+register_collection("users", ("email", {"unique": True}))
+register_collection(
+    "study_groups",
+    [("ownerId", ASCENDING)],
+    [("members._id", ASCENDING)],
+    [("isOpen", ASCENDING), ("createdAt", DESCENDING)],
+    [("department", ASCENDING)],
+    [("title", TEXT), ("course", TEXT)],
+)
+
+# kept for callers that still want an explicit bootstrap
 def ensure_user_indexes(db):
-    try:
-        db.users.create_index("email", unique=True, background=True)
-    except Exception:
-        pass
+    ensure_schema(db)
 
 def ensure_group_indexes(db):
-    try:
-        db.study_groups.create_index([("ownerId", ASCENDING)], background=True)
-        db.study_groups.create_index([("members._id", ASCENDING)], background=True)
-        db.study_groups.create_index(
-            [("isOpen", ASCENDING), ("createdAt", DESCENDING)],
-            background=True,
-        )
-        try:
-            db.study_groups.create_index([("title", "text"), ("course", "text")], background=True)
-        except Exception:
-            pass
-    except Exception:
-        pass
+    ensure_schema(db)
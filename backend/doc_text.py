@@ -0,0 +1,307 @@
+# backend/doc_text.py
+"""
+Plain text out of uploaded documents, for the resource search index
+(resource_index.py runs one `python -m doc_text` subprocess per document,
+never in a request).
+
+  - DOCX: word/document.xml (+ footnotes/endnotes) read straight from the
+    zip with the stdlib ElementTree parser, streamed, stopping at max_chars
+  - PDF:  pypdf when it is installed; otherwise a small stdlib reader that
+    inflates the content streams and collects the strings shown by the
+    Tj / TJ / ' / " operators. That covers PDFs written with standard or
+    simple (single-byte) fonts; text drawn with CID fonts and no pypdf
+    comes back empty rather than as garbage
+  - TXT / MD / CSV: decoded as UTF-8 (latin-1 fallback)
+
+Everything here is stdlib and DB-free so extraction processes start
+quickly; each one is
+
+    python -m doc_text FILE [--name NAME] [--max-chars N] [--max-memory-mb M] [--out RESULT.json]
+
+(--max-memory-mb caps the process's address space, RLIMIT_AS, before the
+file is opened; the stdlib PDF reader maps the file rather than reading
+it, and inflates each stream to at most _stream_cap(max_chars) bytes, so
+neither a 1 GiB upload nor a small compressed bomb can exhaust memory),
+writing {"status": "done" | "empty" | "unsupported" | "failed", "text" |
+"error"} to --out (default stdout). The text is normalized: NFKC, control
+characters dropped, whitespace collapsed to single spaces.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import mmap
+import os
+import sys
+import re
+import unicodedata
+import zipfile
+import zlib
+from typing import Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+
+try:  # optional: much better PDF coverage (CID fonts, ToUnicode maps)
+    import pypdf
+except ImportError:  # pragma: no cover - depends on the deployment
+    pypdf = None
+
+try:  # POSIX only; without it --max-memory-mb is ignored
+    import resource
+except ImportError:  # pragma: no cover - depends on the platform
+    resource = None
+
+SUPPORTED = (".pdf", ".docx", ".txt", ".md", ".csv")
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_DOCX_PARTS = ("word/document.xml", "word/footnotes.xml", "word/endnotes.xml")
+_DOCX_BREAKS = {_W + "tab", _W + "br", _W + "cr", _W + "p"}
+
+_CONTROL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f\ufffd]")
+_SPACE = re.compile(r"\s+")
+
+
+class UnsupportedDocument(Exception):
+    pass
+
+
+def normalize(text: str, max_chars: Optional[int] = None) -> str:
+    text = unicodedata.normalize("NFKC", text or "")
+    text = _SPACE.sub(" ", _CONTROL.sub(" ", text)).strip()
+    return text[:max_chars] if max_chars else text
+
+
+# --------------------------------- DOCX ---------------------------------------
+def docx_text(path: str, max_chars: int) -> str:
+    out: List[str] = []
+    total = 0
+    with zipfile.ZipFile(path) as zf:
+        names = set(zf.namelist())
+        for part in _DOCX_PARTS:
+            if part not in names:
+                continue
+            with zf.open(part) as fh:
+                for _event, elem in ElementTree.iterparse(fh, events=("end",)):
+                    if elem.tag == _W + "t" and elem.text:
+                        out.append(elem.text)
+                        total += len(elem.text)
+                    elif elem.tag in _DOCX_BREAKS:
+                        out.append(" ")
+                    if elem.tag == _W + "p":
+                        elem.clear()  # keep memory flat on long documents
+                    if total >= max_chars:
+                        return "".join(out)
+    return "".join(out)
+
+
+# ---------------------------------- PDF ---------------------------------------
+_STREAM = re.compile(rb"stream\r?\n")
+_DELIMS = b" \t\r\n\f\x00()<>[]{}/%"
+_SHOW_OPS = {b"Tj", b"TJ", b"'", b'"'}
+_BREAK_OPS = {b"Td", b"TD", b"T*", b"Tm", b"ET", b"'", b'"'}
+_ESCAPES = {ord("n"): b"\n", ord("r"): b"\r", ord("t"): b"\t", ord("b"): b"\b", ord("f"): b"\f"}
+
+
+def _stream_cap(max_chars: int) -> int:
+    """Most bytes one stream is inflated to: content streams run far larger than their text."""
+    return max(1 << 20, max_chars * 64)
+
+
+def _streams(data, cap: int) -> Iterator[bytes]:
+    """
+    Decoded stream bodies (Flate or unfiltered) that contain text objects,
+    each cut at `cap` bytes. `data` may be an mmap: streams are inflated
+    from a view of it, never copied out whole.
+    """
+    with memoryview(data) as view:
+        for m in _STREAM.finditer(data):
+            end = data.find(b"endstream", m.end())
+            if end == -1:
+                break
+            with view[m.end():end] as raw:
+                try:
+                    body = zlib.decompressobj().decompress(raw, cap)
+                except zlib.error:
+                    body = bytes(raw[:cap])
+            if b"BT" in body:
+                yield body
+
+
+def _literal(data: bytes, i: int) -> Tuple[bytes, int]:
+    """A (...) string starting after its '('; returns (bytes, index after ')')."""
+    out = bytearray()
+    depth = 1
+    n = len(data)
+    while i < n:
+        c = data[i]
+        if c == 0x5C:  # backslash
+            i += 1
+            if i >= n:
+                break
+            e = data[i]
+            if e in _ESCAPES:
+                out += _ESCAPES[e]
+            elif 0x30 <= e <= 0x37:
+                j = i
+                while j < min(i + 3, n) and 0x30 <= data[j] <= 0x37:
+                    j += 1
+                out.append(int(data[i:j], 8) & 0xFF)
+                i = j
+                continue
+            elif e in (0x0D, 0x0A):
+                pass  # line continuation
+            else:
+                out.append(e)
+        elif c == 0x28:
+            depth += 1
+            out.append(c)
+        elif c == 0x29:
+            depth -= 1
+            if not depth:
+                return bytes(out), i + 1
+            out.append(c)
+        else:
+            out.append(c)
+        i += 1
+    return bytes(out), i
+
+
+def _decode(raw: bytes) -> str:
+    if raw.startswith(b"\xfe\xff"):
+        return raw[2:].decode("utf-16-be", "ignore")
+    if raw and all(b >= 0x20 or b in (9, 10, 13) for b in raw):
+        return raw.decode("latin-1")
+    return ""  # glyph ids of a CID font: meaningless without its CMap
+
+
+def _content_text(data: bytes) -> str:
+    out: List[str] = []
+    pending: List[str] = []
+    i, n = 0, len(data)
+    while i < n:
+        c = data[i]
+        if c == 0x28:  # (
+            raw, i = _literal(data, i + 1)
+            pending.append(_decode(raw))
+            continue
+        if c == 0x3C and data[i + 1:i + 2] != b"<":  # <hex>
+            j = data.find(b">", i)
+            j = n if j == -1 else j
+            try:
+                pending.append(_decode(bytes.fromhex(data[i + 1:j].decode("ascii", "ignore"))))
+            except ValueError:
+                pass
+            i = j + 1
+            continue
+        if c == 0x25:  # comment
+            j = data.find(b"\n", i)
+            i = n if j == -1 else j + 1
+            continue
+        if c in _DELIMS:
+            i += 1
+            continue
+        j = i
+        while j < n and data[j] not in _DELIMS:
+            j += 1
+        tok = data[i:j]
+        i = j
+        if tok in _SHOW_OPS:
+            if tok != b"Tj" and tok != b"TJ":
+                out.append(" ")
+            out.append("".join(pending))
+        if tok in _BREAK_OPS:
+            out.append(" ")
+        if tok[:1].isalpha() or tok in _SHOW_OPS:
+            pending = []
+        elif pending:
+            try:  # TJ kerning: a wide negative gap is a word space
+                if float(tok) <= -200:
+                    pending.append(" ")
+            except ValueError:
+                pass
+    return "".join(out)
+
+
+def _pdf_text_stdlib(path: str, max_chars: int) -> str:
+    if not os.path.getsize(path):
+        return ""
+    out: List[str] = []
+    total = 0
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        with contextlib.closing(_streams(data, _stream_cap(max_chars))) as streams:
+            for body in streams:
+                text = _content_text(body)
+                out.append(text)
+                out.append(" ")
+                total += len(text)
+                if total >= max_chars:
+                    break
+    return "".join(out)
+
+
+def pdf_text(path: str, max_chars: int) -> str:
+    if pypdf is None:
+        return _pdf_text_stdlib(path, max_chars)
+    out: List[str] = []
+    total = 0
+    for page in pypdf.PdfReader(path).pages:
+        text = page.extract_text() or ""
+        out.append(text)
+        total += len(text)
+        if total >= max_chars:
+            break
+    return " ".join(out)
+
+
+# --------------------------------- entry --------------------------------------
+def extract(path: str, filename: str, max_chars: int) -> str:
+    """Normalized text of the document (at most max_chars). UnsupportedDocument otherwise."""
+    ext = os.path.splitext(filename or path)[1].lower()
+    if ext == ".docx":
+        text = docx_text(path, max_chars)
+    elif ext == ".pdf":
+        text = pdf_text(path, max_chars)
+    elif ext in (".txt", ".md", ".csv"):
+        with open(path, "rb") as fh:
+            raw = fh.read(max_chars * 4)
+        try:
+            text = raw.decode("utf-8")
+        except UnicodeDecodeError as e:
+            # a character cut in half by the read limit is still UTF-8
+            text = raw.decode("utf-8", "ignore") if e.start >= len(raw) - 3 else raw.decode("latin-1")
+    else:
+        raise UnsupportedDocument(ext or "no extension")
+    return normalize(text, max_chars)
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("path")
+    ap.add_argument("--name", help="original filename (its extension picks the parser)")
+    ap.add_argument("--max-chars", type=int, default=200000)
+    ap.add_argument("--max-memory-mb", type=int, default=0,
+                    help="address-space limit for this process (0 = none)")
+    ap.add_argument("--out", help="write the JSON result here instead of stdout")
+    args = ap.parse_args(argv)
+
+    if args.max_memory_mb and resource is not None:
+        limit = args.max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    try:
+        text = extract(args.path, args.name or args.path, args.max_chars)
+        result = {"status": "done" if text else "empty", "text": text}
+    except UnsupportedDocument as e:
+        result = {"status": "unsupported", "error": str(e)}
+    except Exception as e:
+        result = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+    if args.out:
+        tmp = args.out + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, ensure_ascii=False)
+        os.replace(tmp, args.out)  # the worker only ever sees a complete file
+    else:
+        json.dump(result, sys.stdout, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
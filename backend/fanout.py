@@ -0,0 +1,193 @@
+# backend/fanout.py
+"""
+Cross-process Socket.IO fan-out.
+
+Without a client manager, `socketio.emit(...)` only reaches sockets connected
+to the current process. With SOCKETIO_FANOUT set, every emit is published to
+a shared bus and each worker process re-emits it to its own sockets, so the
+app can run N processes behind a load balancer (sticky sessions are only
+needed for the polling transport; the frontend uses websocket only).
+
+Backends (SOCKETIO_FANOUT):
+  ""       off: single process (default)
+  mongo    capped collection + tailable cursor. Works on a standalone mongod
+           (change streams would need a replica set). SOCKETIO_FANOUT_URL
+           defaults to MONGO_URI; SOCKETIO_FANOUT_CAP_MB sizes the ring.
+  memory   in-process bus; managers created in one interpreter see each
+           other's emits. For tests / local experiments.
+
+Both plug into python-socketio's PubSubManager, so rooms, skip_sid and ack
+callbacks behave exactly as with the stock Redis/Kombu managers. Messages
+are stored as plain BSON documents (no pickle).
+
+The bus also carries membership cache invalidations (membership.py), so a
+member removed on one worker loses access on all of them at once, and
+meeting reminder schedule/cancel calls (reminders.py) from the workers that
+do not run the reminder scheduler to the one that does.
+
+tests/test_fanout.py runs two app processes against a real mongod and
+checks that a group_message sent on one reaches a client of the other.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from socketio import PubSubManager
+
+import membership
+from reminders import reminder_scheduler
+
+SOCKETIO_FANOUT = os.getenv("SOCKETIO_FANOUT", "").strip().lower()
+SOCKETIO_FANOUT_CHANNEL = os.getenv("SOCKETIO_FANOUT_CHANNEL", "socketio")
+SOCKETIO_FANOUT_CAP_MB = int(os.getenv("SOCKETIO_FANOUT_CAP_MB", "16"))
+
+
+class _BusManager(PubSubManager, ABC):
+    """
+    PubSubManager whose bus also carries the app's own control messages;
+    subclasses implement _receive() instead of _listen().
+    """
+
+    @abstractmethod
+    def _receive(self):
+        """Yield every message published on the channel (by any process)."""
+
+    def _listen(self):
+        for data in self._receive():
+            if isinstance(data, dict) and data.get("method") == "membership_invalidate":
+                if data.get("host_id") != self.host_id:
+                    membership.drop_cached(data.get("db") or "", data.get("gid") or "")
+                continue
+            if isinstance(data, dict) and data.get("method") == "reminder_schedule":
+                if data.get("host_id") != self.host_id:
+                    reminder_scheduler.apply_remote(data.get("db") or "", data.get("mid") or "", data.get("at"))
+                continue
+            yield data
+
+    def publish_invalidation(self, db_name: str, gid: str) -> None:
+        """Tell the other processes to drop their cached members of this group."""
+        self._publish({"method": "membership_invalidate", "host_id": self.host_id,
+                       "db": db_name, "gid": str(gid)})
+
+    def publish_reminder(self, db_name: str, meeting_id: str, reminder_at: Optional[datetime]) -> None:
+        """Hand a reminder schedule (reminder_at None: cancel) to the process running the scheduler."""
+        self._publish({"method": "reminder_schedule", "host_id": self.host_id,
+                       "db": db_name, "mid": str(meeting_id), "at": reminder_at})
+
+
+class MemoryManager(_BusManager):
+    """Fan-out between managers living in the same interpreter."""
+
+    name = "memory"
+    _buses: Dict[str, List[queue.Queue]] = {}
+    _bus_lock = threading.Lock()
+
+    def __init__(self, channel: str = SOCKETIO_FANOUT_CHANNEL, write_only: bool = False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._inbox: Optional[queue.Queue] = None
+        if not write_only:
+            self._inbox = queue.Queue()
+            with self._bus_lock:
+                self._buses.setdefault(channel, []).append(self._inbox)
+
+    def _publish(self, data):
+        with self._bus_lock:
+            inboxes = list(self._buses.get(self.channel, ()))
+        for q in inboxes:
+            q.put(data)
+
+    def _receive(self):
+        while True:
+            yield self._inbox.get()
+
+
+class MongoManager(_BusManager):
+    """
+    Fan-out over a capped collection. Publishers insert one doc per emit;
+    every process tails the collection with a TAILABLE_AWAIT cursor.
+    """
+
+    name = "mongo"
+
+    def __init__(self, url: Optional[str] = None, channel: str = SOCKETIO_FANOUT_CHANNEL,
+                 write_only: bool = False, logger=None, cap_mb: int = SOCKETIO_FANOUT_CAP_MB):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.url = url or os.getenv("SOCKETIO_FANOUT_URL") or os.getenv("MONGO_URI") \
+            or "mongodb://127.0.0.1:27017/study_group_hub"
+        self.cap_bytes = max(1, cap_mb) * 1024 * 1024
+        self._coll = None
+        self._coll_lock = threading.Lock()
+
+    def _collection(self):
+        if self._coll is not None:
+            return self._coll
+        with self._coll_lock:
+            if self._coll is None:
+                from pymongo import MongoClient
+                from pymongo.errors import CollectionInvalid
+                cli = MongoClient(self.url)
+                db = cli.get_default_database(default=os.getenv("MONGO_DB_NAME", "study_group_hub"))
+                try:
+                    db.create_collection("socketio_fanout", capped=True, size=self.cap_bytes)
+                    # a tailable cursor dies on an empty capped collection
+                    db.socketio_fanout.insert_one({"channel": None, "ts": datetime.utcnow()})
+                except CollectionInvalid:
+                    pass
+                self._coll = db.socketio_fanout
+        return self._coll
+
+    def _publish(self, data):
+        self._collection().insert_one({"channel": self.channel, "ts": datetime.utcnow(), "data": data})
+
+    def _receive(self):
+        from pymongo import CursorType
+
+        coll = self._collection()
+        since = datetime.utcnow()
+        # The cursor matches every doc (a tailable cursor whose query matches
+        # nothing is dead on arrival), so old/foreign docs are skipped here.
+        # Clocks and ObjectIds differ between processes: a re-opened cursor
+        # accepts docs from slightly before `since` and drops ones already seen.
+        seen: deque = deque(maxlen=4096)
+        seen_set: set = set()
+        while True:
+            cur = coll.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+            floor = since - timedelta(seconds=2)
+            try:
+                while cur.alive:
+                    for doc in cur:
+                        ts = doc.get("ts")
+                        if doc.get("channel") != self.channel or not ts or ts < floor:
+                            continue
+                        if doc["_id"] in seen_set:
+                            continue
+                        if len(seen) == seen.maxlen:
+                            seen_set.discard(seen[0])
+                        seen.append(doc["_id"])
+                        seen_set.add(doc["_id"])
+                        since = max(since, ts)
+                        yield doc.get("data")
+            except Exception as e:
+                print("[fanout] tail error:", e)
+            finally:
+                cur.close()
+            time.sleep(0.5)
+
+
+def make_client_manager(backend: str = SOCKETIO_FANOUT, write_only: bool = False):
+    """Client manager for SocketIO(client_manager=...), or None for single-process mode."""
+    if not backend:
+        return None
+    if backend == "mongo":
+        return MongoManager(write_only=write_only)
+    if backend == "memory":
+        return MemoryManager(write_only=write_only)
+    print(f"[fanout] unknown SOCKETIO_FANOUT={backend!r}; running single-process")
+    return None
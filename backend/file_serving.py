@@ -0,0 +1,99 @@
+# backend/file_serving.py
+"""
+Sending stored uploads (resources.download_file, groups.serve_group_file)
+after the caller's membership has been checked.
+
+Responses are conditional and cacheable:
+  - ETag: strong, "<sha256>-<size>" for files with a known hash (blob
+    store / resumable uploads); files stored before that get Werkzeug's
+    mtime/size/path tag
+  - Last-Modified from the file; If-None-Match / If-Modified-Since → 304
+  - Range (one byte range) → 206, 416 when unsatisfiable
+  - Cache-Control: private, max-age=FILE_CACHE_SECONDS, plus immutable
+    for hashed files (both URLs always name the same bytes)
+
+FILE_OFFLOAD hands the body to the fronting web server instead of a
+worker thread streaming it:
+
+    off         (default) Werkzeug streams the file
+    x-accel     nginx: X-Accel-Redirect: FILE_ACCEL_PREFIX/<path under UPLOAD_DIR>
+                  location /protected-uploads/ { internal; alias /srv/sgh/uploads/; }
+    x-sendfile  Apache mod_xsendfile / lighttpd: X-Sendfile: <absolute path>
+
+In the offload modes the 304 check still happens here (no file I/O), and
+the web server does Range itself.
+"""
+from __future__ import annotations
+
+import os
+from typing import Optional
+from urllib.parse import quote
+
+from flask import Response, request, send_file
+
+FILE_OFFLOAD = os.getenv("FILE_OFFLOAD", "off").strip().lower()  # off | x-accel | x-sendfile
+FILE_ACCEL_PREFIX = os.getenv("FILE_ACCEL_PREFIX", "/protected-uploads/")
+FILE_CACHE_SECONDS = int(os.getenv("FILE_CACHE_SECONDS", str(30 * 86400)))
+
+_counts = {"sent": 0, "notModified": 0, "partial": 0, "offloaded": 0}
+
+
+def etag_for(sha256: Optional[str], size: int) -> Optional[str]:
+    return f"{sha256}-{size}" if sha256 else None
+
+
+def _cache_headers(rv: Response, immutable: bool) -> None:
+    rv.cache_control.no_cache = None
+    rv.cache_control.public = False
+    rv.cache_control.private = True
+    rv.cache_control.max_age = FILE_CACHE_SECONDS
+    if immutable:
+        rv.cache_control.immutable = True
+
+
+def _offload(path: str, upload_dir: str, mimetype: str, as_attachment: bool,
+             download_name: Optional[str], etag: Optional[str]) -> Response:
+    st = os.stat(path)
+    rv = Response(mimetype=mimetype)
+    if download_name:
+        rv.headers.set("Content-Disposition", "attachment" if as_attachment else "inline",
+                       filename=download_name)
+    rv.last_modified = st.st_mtime
+    rv.set_etag(etag or f"{int(st.st_mtime)}-{st.st_size}")
+    _cache_headers(rv, immutable=bool(etag))
+    rv.make_conditional(request.environ)
+    if rv.status_code == 304:
+        return rv
+    if FILE_OFFLOAD == "x-accel":
+        rel = os.path.relpath(os.path.abspath(path), os.path.abspath(upload_dir))
+        rv.headers["X-Accel-Redirect"] = FILE_ACCEL_PREFIX.rstrip("/") + "/" + quote(rel.replace(os.sep, "/"))
+    else:
+        rv.headers["X-Sendfile"] = os.path.abspath(path)
+    return rv
+
+
+def send_stored(path: str, upload_dir: str, mimetype: str, as_attachment: bool = False,
+                download_name: Optional[str] = None, sha256: Optional[str] = None) -> Response:
+    """Response for the stored file at `path` (under upload_dir), honouring validators and Range."""
+    etag = etag_for(sha256, os.path.getsize(path)) if sha256 else None
+    if FILE_OFFLOAD in ("x-accel", "x-sendfile"):
+        rv = _offload(path, upload_dir, mimetype, as_attachment, download_name, etag)
+        _counts["notModified" if rv.status_code == 304 else "offloaded"] += 1
+        return rv
+
+    rv = send_file(path, mimetype=mimetype, as_attachment=as_attachment, download_name=download_name,
+                   conditional=True, etag=etag or True, max_age=FILE_CACHE_SECONDS)
+    _cache_headers(rv, immutable=bool(etag))
+    rv.headers.pop("Expires", None)  # max-age says it
+    rv.accept_ranges = "bytes"
+    _counts[{304: "notModified", 206: "partial"}.get(rv.status_code, "sent")] += 1
+    return rv
+
+
+def file_serving_stats() -> dict:
+    return {
+        "offload": FILE_OFFLOAD,
+        "accelPrefix": FILE_ACCEL_PREFIX if FILE_OFFLOAD == "x-accel" else None,
+        "cacheSeconds": FILE_CACHE_SECONDS,
+        **_counts,
+    }
@@ -1,13 +1,17 @@
 # backend/helpers.py
 from __future__ import annotations
 
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 from typing import Optional, Tuple
 
 from bson import ObjectId
-from flask import g
-from flask_jwt_extended import get_jwt_identity, get_jwt, verify_jwt_in_request
+from flask import g, has_request_context
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
 
 # ---------------------------------------------------------------------
 # General utilities
@@ -111,14 +115,41 @@ def university_from_email(email: str) -> Tuple[str, str, str]:
     db_name = f"study_group_hub_{tenant}"
     return domain, tenant, db_name
 
+def jwt_claims() -> dict:
+    """
+    Claims of the current request's JWT ({} if none), decoded once per request.
+    app._bind_db already verified the token; we only verify again when called
+    outside that path (e.g. a request without the before_request hook).
+    """
+    if not has_request_context():
+        return {}
+    if "_jwt_claims" in g:
+        return g._jwt_claims
+    try:
+        claims = get_jwt() or {}
+    except RuntimeError:
+        try:
+            verify_jwt_in_request(optional=True)
+            claims = get_jwt() or {}
+        except Exception:
+            claims = {}
+    except Exception:
+        claims = {}
+    g._jwt_claims = claims
+    return claims
+
+def current_identity() -> Optional[str]:
+    """JWT `sub` (user id) of the current request, or None."""
+    ident = jwt_claims().get("sub")
+    return str(ident) if ident is not None else None
+
 def tenant_from_request(fallback_email: Optional[str] = None) -> Optional[str]:
     """
     Preferred: read 'tenant' claim from the current JWT.
     Fallback: infer from given email.
     """
     try:
-        verify_jwt_in_request(optional=True)
-        claims = get_jwt() or {}
+        claims = jwt_claims()
         t = claims.get("tenant")
         if t:
             return _slugify(str(t))
@@ -143,27 +174,109 @@ def is_public_email_domain(domain: str) -> bool:
 # Auth / user helpers
 # ---------------------------------------------------------------------
 
+# What callers of the shared loaders read: identity and display name.
+# Secrets never leave the users collection this way, and per-feature data
+# (gamification, availability, profile settings) is read by the route
+# that needs it, so cached users stay small.
+USER_PROJECTION = {
+    "id": 1,
+    "email": 1,
+    "name": 1,
+    "fullName": 1,
+    "displayName": 1,
+    "firstName": 1,
+    "lastName": 1,
+    "username": 1,
+    "primaryEmail": 1,
+    "mail": 1,
+    "department": 1,
+}
+
+class _UserCache:
+    """Small cross-request LRU keyed by (db name, user id) with a TTL."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._data: "OrderedDict[Tuple[str, str], Tuple[float, Optional[dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            hit = self._data.get(key)
+            if not hit:
+                return False, None
+            if hit[0] <= time.monotonic():
+                self._data.pop(key, None)
+                return False, None
+            self._data.move_to_end(key)
+            return True, hit[1]
+
+    def put(self, key, doc):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, doc)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+_USER_CACHE = _UserCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "2000")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "30")),
+)
+
+def load_user(db, uid) -> Optional[dict]:
+    """
+    Load a user (secrets stripped) by Mongo id, string _id or legacy `id`
+    field in a single query, backed by the (tenant, uid) TTL cache.
+    Callers must treat the returned dict as read-only.
+    """
+    if uid is None:
+        return None
+    key = (db.name, str(uid))
+    found, doc = _USER_CACHE.get(key)
+    if found:
+        return doc
+
+    _id = oid(uid)
+    clauses = [{"_id": _id}] if _id else []
+    clauses += [{"_id": str(uid)}, {"id": str(uid)}]
+    doc = db.users.find_one({"$or": clauses}, USER_PROJECTION)
+    _USER_CACHE.put(key, doc)
+    return doc
+
+def invalidate_user(db, uid) -> None:
+    """Drop a cached user (call after writing to their users document)."""
+    if uid is None:
+        return
+    _USER_CACHE.pop((db.name, str(uid)))
+    if has_request_context():
+        cached = g.get("_current_user")
+        if cached and cached[0] == db.name:
+            g.pop("_current_user", None)
+
 def current_user(db) -> Optional[dict]:
     """
     Load the current user document (for the active tenant DB) using the JWT identity.
-    Identity can be a Mongo id or an email.
+    Identity can be a Mongo id or an email. Memoized on `g` for the request and
+    backed by the cross-request user cache; the password hash is never loaded.
     """
-    try:
-        verify_jwt_in_request()
-    except Exception:
-        return None
+    cached = g.get("_current_user")
+    if cached and cached[0] == db.name:
+        return cached[1]
 
-    ident = get_jwt_identity()
+    ident = current_identity()
     if ident is None:
         return None
 
-    _id = oid(ident)
-    if _id:
-        doc = db.users.find_one({"_id": _id})
-        if doc:
-            return doc
-
-    if isinstance(ident, str) and "@" in ident:
-        return db.users.find_one({"email": ident.strip().lower()})
+    doc = None
+    if "@" in ident:
+        doc = db.users.find_one({"email": ident.strip().lower()}, USER_PROJECTION)
+    else:
+        doc = load_user(db, ident)
 
-    return None
+    g._current_user = (db.name, doc)
+    return doc
@@ -1,73 +1,284 @@
-
 import os
 import smtplib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from email.message import EmailMessage
 
 SMTP_HOST = os.getenv("SMTP_HOST", "").strip()
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587").strip() or 587)
 SMTP_USER = os.getenv("SMTP_USER", "").strip()
 SMTP_PASS = os.getenv("SMTP_PASS", "").strip()
-SMTP_FROM = os.getenv("SMTP_FROM", SMTP_USER).strip() 
+SMTP_FROM = os.getenv("SMTP_FROM", SMTP_USER).strip()
 SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() not in ("0", "false", "no")
 
-def _ready():
-    return all([SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, SMTP_FROM])
+# connection pool: authenticated sessions are kept open and reused
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+SMTP_POOL_IDLE_SECONDS = float(os.getenv("SMTP_POOL_IDLE_SECONDS", "60"))
+SMTP_POOL_MAX_MESSAGES = int(os.getenv("SMTP_POOL_MAX_MESSAGES", "100"))  # per session, then reconnect
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+# 0 = quiet, 1 = print the SMTP dialogue (what Gmail / SMTP says)
+SMTP_DEBUG = int(os.getenv("SMTP_DEBUG", "0") or 0)
 
-def send_email(to: str, subject: str, html: str, text: str = ""):
+
+def build_message(to: str, subject: str, html: str, text: str = "", sender: str = None) -> EmailMessage:
+    em = EmailMessage()
+    em["From"] = sender or SMTP_FROM
+    em["To"] = to
+    em["Subject"] = subject
+    if html:
+        em.set_content(text or " ")
+        em.add_alternative(html, subtype="html")
+    else:
+        em.set_content(text or "(no content)")
+    return em
+
+
+def _describe_error(e: Exception) -> str:
+    if isinstance(e, smtplib.SMTPAuthenticationError):
+        print("[mailer] AUTH error:", repr(e))
+        return "SMTP authentication failed (check SMTP_USER/SMTP_PASS; for Gmail use an App Password)"
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        print("[mailer] recipients refused:", e.recipients)
+        return f"SMTP refused recipient(s): {e.recipients}"
+    if isinstance(e, smtplib.SMTPResponseException):
+        print("[mailer] SMTP response error:", e.smtp_code, e.smtp_error)
+        return f"SMTP error {e.smtp_code}: {e.smtp_error!r}"
+    print("[mailer] generic error:", repr(e))
+    return str(e)
+
+
+class _Conn:
+    __slots__ = ("smtp", "last_used", "sent")
+
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.last_used = time.monotonic()
+        self.sent = 0
+
+
+class _Session:
+    """One checked-out connection; reconnects when the server drops it."""
+
+    def __init__(self, pool: "SMTPPool", conn: _Conn):
+        self.pool = pool
+        self.conn = conn
+
+    def send(self, em: EmailMessage) -> None:
+        """Send one message; raises on failure (refused recipients included)."""
+        if self.conn is None or self.conn.sent >= self.pool.max_messages:
+            self._reconnect()
+        try:
+            refused = self.conn.smtp.send_message(em)
+        except smtplib.SMTPServerDisconnected:
+            # idle session closed by the server: one fresh connection, one retry
+            self.pool.reconnects += 1
+            self._reconnect()
+            refused = self.conn.smtp.send_message(em)
+        self.conn.sent += 1
+        self.conn.last_used = time.monotonic()
+        self.pool.sent += 1
+        if refused:
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+    def reset(self) -> None:
+        """RSET after a failed transaction so the session stays usable."""
+        try:
+            if self.conn is not None:
+                self.conn.smtp.rset()
+        except Exception:
+            self.discard()
+
+    def discard(self) -> None:
+        if self.conn is not None:
+            self.pool._close(self.conn)
+            self.conn = None
+
+    def _reconnect(self) -> None:
+        self.discard()
+        self.conn = self.pool._connect()
+
+
+class SMTPPool:
     """
-    Send an email. Returns (ok, error_message_or_None).
-    This function is VERBOSE: it prints SMTP dialogue so you can see what Gmail / SMTP says.
+    Bounded pool of logged-in SMTP sessions.
+
+    Instead of connect -> EHLO -> STARTTLS -> EHLO -> LOGIN -> send -> QUIT per
+    message, sessions stay open between sends (up to `idle_timeout` seconds and
+    `max_messages` messages each) and are reopened transparently when the
+    server has disconnected them.
     """
-    if not _ready():
-        msg = "[mailer] not configured: set SMTP_HOST/PORT/USER/PASS/SMTP_FROM in .env"
-        print(msg)
-        return False, msg
-
-    if not to:
-        msg = "[mailer] missing 'to' address"
-        print(msg)
-        return False, msg
-
-    try:
-        em = EmailMessage()
-        em["From"] = SMTP_FROM
-        em["To"] = to
-        em["Subject"] = subject
-        if html:
-            em.set_content(text or " ")
-            em.add_alternative(html, subtype="html")
-        else:
-            em.set_content(text or "(no content)")
-
-        print(f"[mailer] connecting to SMTP {SMTP_HOST}:{SMTP_PORT} (TLS={SMTP_USE_TLS}) as {SMTP_USER}")
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as s:
-            s.set_debuglevel(1)  
-
-            if SMTP_USE_TLS:
+
+    def __init__(self, host=None, port=None, user=None, password=None, sender=None,
+                 use_tls=None, size=SMTP_POOL_SIZE, idle_timeout=SMTP_POOL_IDLE_SECONDS,
+                 max_messages=SMTP_POOL_MAX_MESSAGES, timeout=SMTP_TIMEOUT, debuglevel=SMTP_DEBUG):
+        self.host = SMTP_HOST if host is None else host
+        self.port = SMTP_PORT if port is None else port
+        self.user = SMTP_USER if user is None else user
+        self.password = SMTP_PASS if password is None else password
+        self.sender = (SMTP_FROM if sender is None else sender) or self.user
+        self.use_tls = SMTP_USE_TLS if use_tls is None else use_tls
+        self.size = max(1, int(size))
+        self.idle_timeout = float(idle_timeout)
+        self.max_messages = max(1, int(max_messages))
+        self.timeout = timeout
+        self.debuglevel = debuglevel
+
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self.connects = 0
+        self.reconnects = 0
+        self.sent = 0
+
+    def ready(self) -> bool:
+        return all([self.host, self.port, self.user, self.password, self.sender])
+
+    # ------------------------------ connections --------------------------------
+    def _connect(self) -> _Conn:
+        print(f"[mailer] connecting to SMTP {self.host}:{self.port} (TLS={self.use_tls}) as {self.user}")
+        s = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            s.set_debuglevel(self.debuglevel)
+            if self.use_tls:
                 s.ehlo()
                 s.starttls()
                 s.ehlo()
+            s.login(self.user, self.password)
+        except Exception:
+            try:
+                s.close()
+            except Exception:
+                pass
+            raise
+        self.connects += 1
+        return _Conn(s)
 
-            s.login(SMTP_USER, SMTP_PASS)
+    @staticmethod
+    def _close(conn: _Conn) -> None:
+        try:
+            conn.smtp.quit()
+        except Exception:
+            try:
+                conn.smtp.close()
+            except Exception:
+                pass
 
-            resp = s.send_message(em)
-           
-            if resp:
-                print("[mailer] send_message returned errors:", resp)
-                return False, f"SMTP refused recipient(s): {resp}"
+    def _checkout(self) -> _Conn:
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return self._connect()
+            if now - conn.last_used > self.idle_timeout or conn.sent >= self.max_messages:
+                self._close(conn)
+                continue
+            return conn
+
+    def _checkin(self, conn: _Conn) -> None:
+        if conn.sent >= self.max_messages:
+            self._close(conn)
+            return
+        with self._lock:
+            self._idle.append(conn)
+
+    @contextmanager
+    def session(self):
+        """Check out one session (blocking while all `size` sessions are busy)."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("SMTP pool exhausted")
+        sess = None
+        try:
+            sess = _Session(self, self._checkout())
+            yield sess
+        except Exception:
+            if sess is not None:
+                sess.discard()
+            raise
+        finally:
+            if sess is not None and sess.conn is not None:
+                self._checkin(sess.conn)
+            self._slots.release()
+
+    def close(self) -> None:
+        with self._lock:
+            conns, self._idle = list(self._idle), deque()
+        for conn in conns:
+            self._close(conn)
+
+    # -------------------------------- sending ----------------------------------
+    def send(self, to: str, subject: str, html: str, text: str = ""):
+        """Send one message. Returns (ok, error_message_or_None)."""
+        return self.send_many([{"to": to, "subject": subject, "html": html, "text": text}])[0]
+
+    def send_many(self, messages):
+        """
+        Send a batch over one session. `messages` are dicts with
+        to/subject/html/text. Returns a list of (ok, error_or_None) in order;
+        a refused recipient fails only its own message.
+        """
+        messages = list(messages)
+        if not self.ready():
+            msg = "[mailer] not configured: set SMTP_HOST/PORT/USER/PASS/SMTP_FROM in .env"
+            print(msg)
+            return [(False, msg)] * len(messages)
+
+        results = [None] * len(messages)
+        try:
+            with self.session() as sess:
+                for i, m in enumerate(messages):
+                    to = m.get("to")
+                    if not to:
+                        msg = "[mailer] missing 'to' address"
+                        print(msg)
+                        results[i] = (False, msg)
+                        continue
+                    em = build_message(to, m.get("subject") or "", m.get("html") or "",
+                                       m.get("text") or "", sender=self.sender)
+                    try:
+                        sess.send(em)
+                        print(f"[mailer] sent → {to}")
+                        results[i] = (True, None)
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError,
+                            smtplib.SMTPSenderRefused) as e:
+                        results[i] = (False, _describe_error(e))
+                        sess.reset()
+        except Exception as e:
+            # connection/auth level failure: everything not yet sent fails
+            err = _describe_error(e)
+            results = [r if r is not None else (False, err) for r in results]
+        return results
+
+    def stats(self):
+        with self._lock:
+            idle = len(self._idle)
+        return {
+            "size": self.size,
+            "idle": idle,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "sent": self.sent,
+        }
+
+
+pool = SMTPPool()
+
+
+def send_email(to: str, subject: str, html: str, text: str = ""):
+    """
+    Send an email over a pooled SMTP session. Returns (ok, error_message_or_None).
+    Set SMTP_DEBUG=1 to print the SMTP dialogue so you can see what Gmail / SMTP says.
+    """
+    return pool.send(to, subject, html, text)
+
+
+def send_many(messages):
+    """Send several emails over one pooled session. See SMTPPool.send_many."""
+    return pool.send_many(messages)
 
-        print(f"[mailer] sent → {to}")
-        return True, None
 
-    except smtplib.SMTPAuthenticationError as e:
-        print("[mailer] AUTH error:", repr(e))
-        return False, "SMTP authentication failed (check SMTP_USER/SMTP_PASS; for Gmail use an App Password)"
-    except smtplib.SMTPResponseException as e:
-        print("[mailer] SMTP response error:", e.smtp_code, e.smtp_error)
-        return False, f"SMTP error {e.smtp_code}: {e.smtp_error!r}"
-    except Exception as e:
-        print("[mailer] generic error:", repr(e))
-        return False, str(e)
 def send_password_reset_email(to: str, code: str):
     """
     Convenience helper to send a password reset code.
@@ -0,0 +1,222 @@
+# backend/membership.py
+"""
+Process-wide group membership cache.
+
+Keeps a compact set of member ids (owner included) per (tenant DB, group)
+in a bounded LRU with a TTL, so chat/uploads/files/polls/resources can
+authorize without fetching the group document on every call.
+
+Writers that change membership must call `invalidate_group(db, gid)`
+(create / approve / leave / delete in blueprints/groups.py). With
+SOCKETIO_FANOUT the invalidation is also published on the fan-out bus and
+every other worker drops its copy (fanout.py), so a removed member does
+not keep access elsewhere for MEMBERSHIP_CACHE_TTL.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Optional, Tuple
+
+from bson import ObjectId
+
+# group collections, in lookup order (resources.py historically also used "groups")
+_GROUP_COLLECTIONS = ("study_groups", "groups")
+
+_PROJECTION = {
+    "ownerId": 1, "owner": 1, "ownerId_oid": 1,
+    "members._id": 1, "members.id": 1, "members.userId": 1,
+    "memberIds": 1, "member_ids": 1, "members_str": 1, "members_oid": 1, "memberOids": 1,
+}
+
+
+def _as_oid(v: Any) -> Optional[ObjectId]:
+    if isinstance(v, ObjectId):
+        return v
+    try:
+        return ObjectId(str(v))
+    except Exception:
+        return None
+
+
+def _ids_from(values) -> set:
+    out = set()
+    for m in values or []:
+        if isinstance(m, dict):
+            m = m.get("_id") or m.get("id") or m.get("userId")
+        if m is None:
+            continue
+        s = str(m).strip()
+        if s:
+            out.add(s)
+    return out
+
+
+def member_ids_from_doc(doc: dict) -> FrozenSet[str]:
+    """All ids (as strings) that count as owner/member of a group doc."""
+    ids = set()
+    for key in ("ownerId", "owner", "ownerId_oid"):
+        if doc.get(key) is not None:
+            ids.add(str(doc.get(key)))
+    for key in ("members", "memberIds", "member_ids", "members_str", "members_oid", "memberOids"):
+        ids |= _ids_from(doc.get(key))
+    return frozenset(ids)
+
+
+def _load_group(db, gid: Any) -> Optional[dict]:
+    """Find a group by ObjectId or string id across the known collections."""
+    gid_oid = _as_oid(gid)
+    clauses = [{"_id": gid_oid}] if gid_oid else []
+    clauses.append({"_id": str(gid)})
+    query = clauses[0] if len(clauses) == 1 else {"$or": clauses}
+    for coll_name in _GROUP_COLLECTIONS:
+        try:
+            doc = db[coll_name].find_one(query, _PROJECTION)
+        except Exception:
+            doc = None
+        if doc:
+            return doc
+    return None
+
+
+class MembershipCache:
+    """
+    Bounded LRU of {(db_name, gid): (expires_at, member_ids | None)}.
+
+    Loads run outside the lock. Each key with a load in flight has a
+    generation that drop() bumps; a load that finishes after a drop does not
+    write its (possibly stale) result back.
+    """
+
+    def __init__(self, maxsize: int = 5000, ttl: float = 60.0):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self._data: "OrderedDict[Tuple[str, str], Tuple[float, Optional[FrozenSet[str]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # key -> [generation, loads in flight]; only kept while a load runs
+        self._gens: Dict[Tuple[str, str], list] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(db, gid) -> Tuple[str, str]:
+        return (getattr(db, "name", ""), str(gid))
+
+    def members(self, db, gid) -> Optional[FrozenSet[str]]:
+        """Member id set for the group, or None if the group does not exist."""
+        if not gid:
+            return None
+        key = self._key(db, gid)
+        now = time.monotonic()
+        with self._lock:
+            hit = self._data.get(key)
+            if hit and hit[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return hit[1]
+            self.misses += 1
+            gen = self._gens.setdefault(key, [0, 0])
+            gen[1] += 1
+            seen = gen[0]
+
+        try:
+            doc = _load_group(db, gid)
+            ids = member_ids_from_doc(doc) if doc else None
+        except BaseException:
+            with self._lock:
+                self._release(key, gen)
+            raise
+        with self._lock:
+            self._release(key, gen)
+            if gen[0] != seen:
+                return ids  # dropped while loading: don't cache what may be stale
+            self._data[key] = (now + self.ttl, ids)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return ids
+
+    def _release(self, key, gen: list) -> None:
+        gen[1] -= 1
+        if not gen[1]:
+            self._gens.pop(key, None)
+
+    def is_member(self, db, gid, uid) -> bool:
+        if not gid or not uid:
+            return False
+        ids = self.members(db, gid)
+        return bool(ids) and str(uid) in ids
+
+    def invalidate(self, db, gid) -> None:
+        self.drop(*self._key(db, gid))
+
+    def drop(self, db_name: str, gid: str) -> None:
+        key = (db_name, str(gid))
+        with self._lock:
+            self._data.pop(key, None)
+            gen = self._gens.get(key)
+            if gen:
+                gen[0] += 1
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hitRate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+membership = MembershipCache(
+    maxsize=int(os.getenv("MEMBERSHIP_CACHE_SIZE", "5000")),
+    ttl=float(os.getenv("MEMBERSHIP_CACHE_TTL", "60")),
+)
+
+
+# ---- module-level shortcuts ---------------------------------------------------
+def group_members(db, gid) -> Optional[FrozenSet[str]]:
+    return membership.members(db, gid)
+
+
+def is_member(db, gid, uid) -> bool:
+    return membership.is_member(db, gid, uid)
+
+
+# (db name, gid) -> None; set by app.py when a fan-out bus links the workers
+_publish: Optional[Callable[[str, str], None]] = None
+
+
+def publish_invalidations(publish: Optional[Callable[[str, str], None]]) -> None:
+    global _publish
+    _publish = publish
+
+
+def invalidate_group(db, gid) -> None:
+    membership.invalidate(db, gid)
+    if _publish is not None:
+        try:
+            _publish(getattr(db, "name", ""), str(gid))
+        except Exception as e:
+            print("[membership] invalidation publish failed:", e)
+
+
+def drop_cached(db_name: str, gid: str) -> None:
+    """Invalidation received from another worker."""
+    membership.drop(db_name, gid)
+
+
+def membership_stats() -> Dict[str, Any]:
+    return membership.stats()
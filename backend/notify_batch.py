@@ -0,0 +1,142 @@
+# backend/notify_batch.py
+"""
+Per-user notification batching on the /ws/chat channel.
+
+`notify`, `meeting_updated`, ... events for `user:<id>` rooms are queued per
+room and flushed at most once every NOTIFY_BATCH_MS. A room with one queued
+event gets it unchanged; several events become one frame
+
+    notify_batch  { events: [{event: "notify", data: {...}}, {event: "meeting_updated", ...}] }
+
+in the order they were queued (the client replays them through its normal
+listeners). Payload types in NOTIFY_IMMEDIATE (default: meeting_reminder)
+flush their room right away, together with whatever was already queued for
+it, so ordering still holds.
+
+    from notify_batch import notify_user
+    notify_user(sio, receiver_id, "notify", payload)
+
+Until start_notify_batcher() ran in this process (scripts, tests), events
+are sent immediately.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from typing import Dict, List, Tuple
+
+NOTIFY_BATCH_MS = float(os.getenv("NOTIFY_BATCH_MS", "50"))
+NOTIFY_IMMEDIATE = frozenset(
+    t.strip() for t in os.getenv("NOTIFY_IMMEDIATE", "meeting_reminder").split(",") if t.strip()
+)
+
+NAMESPACE = "/ws/chat"
+
+
+class UserEventBatcher:
+    """Queues events per user room; one frame per room per interval."""
+
+    def __init__(self, interval_ms: float = NOTIFY_BATCH_MS, immediate=NOTIFY_IMMEDIATE):
+        self.interval = max(0.0, interval_ms) / 1000.0
+        self.immediate = frozenset(immediate)
+        self._lock = threading.Lock()        # guards _pending and the counters
+        self._send_lock = threading.Lock()   # one flush at a time keeps per-room order
+        self._pending: Dict[str, List[Tuple[str, dict]]] = {}
+        self._wake = threading.Event()
+        self._sio = None
+        self.queued = 0      # events handed to notify_user
+        self.urgent = 0      # of those, flushed right away
+        self.frames = 0      # frames actually emitted
+        self.batches = 0     # of those, notify_batch frames
+
+    def _urgent(self, payload) -> bool:
+        return isinstance(payload, dict) and payload.get("type") in self.immediate
+
+    def emit(self, sio, user_id, event: str, payload: dict) -> None:
+        room = f"user:{str(user_id)}"
+        flush_now = self._sio is None or not self.interval or self._urgent(payload)
+        with self._lock:
+            self.queued += 1
+            self._pending.setdefault(room, []).append((event, payload))
+            if flush_now:
+                self.urgent += 1
+        if flush_now:
+            self.flush(sio, rooms=[room])
+        else:
+            self._wake.set()
+
+    def _send(self, sio, room: str, items: List[Tuple[str, dict]]) -> bool:
+        try:
+            if len(items) == 1:
+                event, payload = items[0]
+                sio.emit(event, payload, namespace=NAMESPACE, to=room)
+            else:
+                events = [{"event": e, "data": p} for e, p in items]
+                sio.emit("notify_batch", {"events": events}, namespace=NAMESPACE, to=room)
+            return True
+        except Exception as e:
+            print("[notify] emit error:", e)
+            return False
+
+    def flush(self, sio, rooms=None) -> int:
+        """Send what is queued (for `rooms`, or everything). Returns frames sent."""
+        sent = batches = 0
+        with self._send_lock:
+            with self._lock:
+                if rooms is None:
+                    pending, self._pending = self._pending, {}
+                else:
+                    pending = {r: self._pending.pop(r) for r in rooms if r in self._pending}
+            for room, items in pending.items():
+                if self._send(sio, room, items):
+                    sent += 1
+                    batches += len(items) > 1
+        with self._lock:
+            self.frames += sent
+            self.batches += batches
+        return sent
+
+    def _loop(self, sio) -> None:
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            sio.sleep(self.interval)  # let the rest of this window accumulate
+            self.flush(sio)
+
+    def start(self, sio) -> None:
+        if self._sio is not None:
+            return
+        self._sio = sio
+        if self.interval:
+            sio.start_background_task(self._loop, sio)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "intervalMs": int(self.interval * 1000),
+                "immediateTypes": sorted(self.immediate),
+                "queued": self.queued,
+                "urgent": self.urgent,
+                "frames": self.frames,
+                "batches": self.batches,
+                # one frame per event is what we sent before batching
+                "saved": self.queued - self.frames - sum(len(v) for v in self._pending.values()),
+                "pendingRooms": len(self._pending),
+            }
+
+
+batcher = UserEventBatcher()
+
+
+def notify_user(sio, user_id, event: str, payload: dict) -> None:
+    """Queue `event` for the user's `user:<id>` room (see module docstring)."""
+    batcher.emit(sio, user_id, event, payload)
+
+
+def start_notify_batcher(socketio) -> None:
+    """Start the flusher (once per process); before that, events go out immediately."""
+    batcher.start(socketio)
+
+
+def notify_stats() -> dict:
+    return batcher.stats()
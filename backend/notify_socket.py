@@ -7,39 +7,30 @@ Usage from app.py:
     from notify_socket import register_socket_handlers
     register_socket_handlers(socketio)
 
+Typing state lives in the shared presence store (presence.py): entries are
+per socket, expire after TYPING_TTL if "stop" never arrives, and are cleared
+when the socket disconnects. Changes reach the room as coalesced
+`presence_delta` events ({typing: [...], stoppedTyping: [...]}), at most one
+per room per PRESENCE_COALESCE_MS, instead of the full map per keystroke.
+
 This file does NOT import app.py to avoid circular imports.
 """
 
-from typing import Dict, Tuple
-
-# { groupId: { userId: name } }
-_TYPING: Dict[str, Dict[str, str]] = {}
-
-
-def _group_room(gid: str) -> str:
-    """Room name helper – must match whatever you use for join_group."""
-    return f"group:{gid}"
-
+from flask import request, session
 
-def _broadcast_typing(socketio, gid: str) -> None:
-    """
-    Emits to the group room:
+from presence import presence
 
-      event: "group_typing"
-      payload: { groupId, users: [{userId, name}, ...] }
-    """
-    group_map = _TYPING.get(gid) or {}
-    users = [
-        {"userId": uid, "name": name}
-        for uid, name in group_map.items()
-    ]
 
-    socketio.emit(
-      "group_typing",
-      {"groupId": gid, "users": users},
-      room=_group_room(gid),
-      namespace="/ws/chat",
-    )
+def _typing_target(data):
+    """(gid, session identity) for an authorized typing event, else (None, None)."""
+    me = session.get("sgh")  # set by ChatNamespace.on_connect
+    gid = str((data or {}).get("groupId") or "").strip()
+    if not me or not gid:
+        return None, None
+    from sockets import _can_access  # lazy: sockets imports presence too
+    if not _can_access(me, gid):
+        return None, None
+    return gid, me
 
 
 def register_socket_handlers(socketio):
@@ -56,47 +47,23 @@ def register_socket_handlers(socketio):
     @socketio.on("group_typing_start", namespace="/ws/chat")
     def handle_group_typing_start(data):
         """
-        data: { groupId, user: { id, name, email? } }
+        data: { groupId }  (identity comes from the socket session)
         """
-        try:
-            gid = str((data or {}).get("groupId") or "").strip()
-            user = (data or {}).get("user") or {}
-            uid = str(user.get("id") or "").strip()
-            name = (user.get("name") or "Member").strip()
-        except Exception:
-            return
-
-        if not gid or not uid:
-            return
+        gid, me = _typing_target(data)
+        if not gid:
+            return {"ok": False, "error": "unauthorized"}
 
-        group_map = _TYPING.get(gid) or {}
-        group_map[uid] = name
-        _TYPING[gid] = group_map
-
-        _broadcast_typing(socketio, gid)
+        presence.typing_start(gid, me["uidStr"], request.sid, name=me["name"])
+        return {"ok": True}
 
     @socketio.on("group_typing_stop", namespace="/ws/chat")
     def handle_group_typing_stop(data):
         """
-        data: { groupId, user: { id } }
+        data: { groupId }
         """
-        try:
-            gid = str((data or {}).get("groupId") or "").strip()
-            user = (data or {}).get("user") or {}
-            uid = str(user.get("id") or "").strip()
-        except Exception:
-            return
-
-        if not gid or not uid:
-            return
-
-        group_map = _TYPING.get(gid) or {}
-        if uid in group_map:
-            del group_map[uid]
-
-        if group_map:
-            _TYPING[gid] = group_map
-        else:
-            _TYPING.pop(gid, None)
-
-        _broadcast_typing(socketio, gid)
+        gid, me = _typing_target(data)
+        if not gid:
+            return {"ok": False, "error": "unauthorized"}
+
+        presence.typing_stop(gid, me["uidStr"], request.sid)
+        return {"ok": True}
@@ -0,0 +1,271 @@
+# backend/outbox.py
+"""
+Durable email outbox.
+
+HTTP handlers call `enqueue_email(...)` (one insert) instead of talking SMTP
+inside the request. A small pool of background workers drains the
+`email_outbox` collection with retry + exponential backoff, and a circuit
+breaker stops hammering the SMTP server while it is failing.
+
+Document shape:
+  { to, subject, html, text, kind,
+    status: "pending" | "sending" | "sent" | "failed",
+    attempts, nextAttemptAt, lockedAt, lastError,
+    createdAt, sentAt, latencyMs }
+
+The outbox lives in one shared DB (OUTBOX_DB, default: the default DB from
+MONGO_URI) so workers don't have to scan every tenant.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+from db import client, default_db_name, ensure_schema, register_collection
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "20"))  # messages per SMTP session round
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "15"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "1800"))
+OUTBOX_IDLE_SECONDS = float(os.getenv("OUTBOX_IDLE_SECONDS", "5"))
+OUTBOX_LOCK_SECONDS = int(os.getenv("OUTBOX_LOCK_SECONDS", "300"))
+
+BREAKER_THRESHOLD = int(os.getenv("OUTBOX_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("OUTBOX_BREAKER_COOLDOWN_SECONDS", "60"))
+
+def outbox_db_name() -> str:
+    return os.getenv("OUTBOX_DB") or default_db_name()
+
+
+def outbox_db():
+    return client()[outbox_db_name()]
+
+
+register_collection(
+    "email_outbox",
+    [("status", ASCENDING), ("nextAttemptAt", ASCENDING)],
+    [("status", ASCENDING), ("lockedAt", ASCENDING)],
+    [("createdAt", DESCENDING)],
+    only_in=outbox_db_name,
+)
+
+
+def _outbox():
+    """email_outbox collection (indexes applied once per process by ensure_schema)."""
+    return ensure_schema(outbox_db()).email_outbox
+
+
+# ------------------------------ circuit breaker --------------------------------
+class CircuitBreaker:
+    """closed -> (N consecutive failures) -> open -> (cooldown) -> half-open -> closed/open."""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            st = self.state
+            if st == "closed":
+                return True
+            if st == "half-open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def release(self) -> None:
+        """Give back a half-open probe slot that was not used."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self._probe_in_flight = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN_SECONDS)
+
+_wake = threading.Event()
+_latencies_ms: deque = deque(maxlen=200)
+_last_error: Dict[str, Any] = {}
+_started = False
+
+
+# ---------------------------------- enqueue ------------------------------------
+def enqueue_email(to: str, subject: str, html: str, text: str = "", kind: Optional[str] = None):
+    """
+    Queue an email for background delivery. Returns the outbox id (or None if
+    there is no recipient). Never talks to SMTP.
+    """
+    if not to:
+        return None
+    now = datetime.utcnow()
+    ins = _outbox().insert_one({
+        "to": to,
+        "subject": subject,
+        "html": html,
+        "text": text or "",
+        "kind": kind,
+        "status": "pending",
+        "attempts": 0,
+        "nextAttemptAt": now,
+        "lockedAt": None,
+        "lastError": None,
+        "createdAt": now,
+    })
+    _wake.set()
+    return ins.inserted_id
+
+
+# ---------------------------------- workers ------------------------------------
+def _backoff(attempts: int) -> float:
+    return min(OUTBOX_BACKOFF_MAX_SECONDS, OUTBOX_BACKOFF_SECONDS * (2 ** max(0, attempts - 1)))
+
+
+def _claim_one() -> Optional[dict]:
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=OUTBOX_LOCK_SECONDS)
+    return _outbox().find_one_and_update(
+        {"$or": [
+            {"status": "pending", "nextAttemptAt": {"$lte": now}},
+            {"status": "sending", "lockedAt": {"$lte": stale}},  # crashed worker
+        ]},
+        {"$set": {"status": "sending", "lockedAt": now}, "$inc": {"attempts": 1}},
+        sort=[("nextAttemptAt", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _finish(doc: dict, ok: bool, err: Optional[str], latency_ms: int) -> None:
+    breaker.record(ok)
+    coll = _outbox()
+    if ok:
+        _latencies_ms.append(latency_ms)
+        coll.update_one(
+            {"_id": doc["_id"]},
+            {"$set": {"status": "sent", "sentAt": datetime.utcnow(), "latencyMs": latency_ms,
+                      "lockedAt": None, "lastError": None}},
+        )
+        return
+
+    _last_error.update({"error": err, "at": datetime.utcnow().isoformat() + "Z"})
+    attempts = int(doc.get("attempts") or 1)
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        update = {"status": "failed", "lockedAt": None, "lastError": err}
+    else:
+        update = {
+            "status": "pending",
+            "lockedAt": None,
+            "lastError": err,
+            "nextAttemptAt": datetime.utcnow() + timedelta(seconds=_backoff(attempts)),
+        }
+    coll.update_one({"_id": doc["_id"]}, {"$set": update})
+    print(f"[outbox] send to {doc.get('to')} failed (attempt {attempts}):", err)
+
+
+def _deliver(docs: List[dict]) -> None:
+    """Send a claimed batch over one pooled SMTP session."""
+    from mailer import send_many  # lazy: mailer reads SMTP env at import
+
+    started = time.monotonic()
+    try:
+        results = send_many(docs)
+    except Exception as e:  # send_many normally returns [(ok, err), ...]
+        results = [(False, str(e))] * len(docs)
+    latency_ms = int((time.monotonic() - started) * 1000 / max(1, len(docs)))
+    for doc, (ok, err) in zip(docs, results):
+        _finish(doc, ok, err, latency_ms)
+
+
+def _claim_batch() -> List[dict]:
+    # while half-open only one probe message goes out
+    limit = 1 if breaker.state != "closed" else max(1, OUTBOX_BATCH)
+    docs = []
+    while len(docs) < limit:
+        doc = _claim_one()
+        if not doc:
+            break
+        docs.append(doc)
+    return docs
+
+
+def _worker_loop(n: int) -> None:
+    print(f"[outbox] worker {n} started")
+    while True:
+        try:
+            if not breaker.allow():
+                time.sleep(min(BREAKER_COOLDOWN_SECONDS, 5))
+                continue
+            docs = _claim_batch()
+            if not docs:
+                breaker.release()
+                _wake.wait(OUTBOX_IDLE_SECONDS)
+                _wake.clear()
+                continue
+            _deliver(docs)
+        except Exception as e:
+            print(f"[outbox] worker {n} error:", e)
+            time.sleep(1)
+
+
+def start_outbox_workers(socketio, workers: int = OUTBOX_WORKERS) -> None:
+    """Start the background sender pool (once per process)."""
+    global _started
+    if _started:
+        return
+    _started = True
+    for n in range(max(1, workers)):
+        socketio.start_background_task(_worker_loop, n)
+
+
+# ----------------------------------- status ------------------------------------
+def outbox_stats() -> Dict[str, Any]:
+    coll = _outbox()
+    counts = {
+        row["_id"]: row["n"]
+        for row in coll.aggregate([
+            {"$match": {"status": {"$in": ["pending", "sending", "failed"]}}},
+            {"$group": {"_id": "$status", "n": {"$sum": 1}}},
+        ])
+    }
+    lat = sorted(_latencies_ms)
+    return {
+        "queueDepth": int(counts.get("pending", 0)),
+        "sending": int(counts.get("sending", 0)),
+        "failed": int(counts.get("failed", 0)),
+        "breaker": breaker.state,
+        "consecutiveFailures": breaker.failures,
+        "sendLatencyMs": {
+            "samples": len(lat),
+            "avg": round(sum(lat) / len(lat), 1) if lat else None,
+            "p95": lat[int(len(lat) * 0.95) - 1] if lat else None,
+            "last": _latencies_ms[-1] if _latencies_ms else None,
+        },
+        "lastError": dict(_last_error) or None,
+    }
@@ -0,0 +1,512 @@
+# backend/presence.py
+"""
+Group presence ("who is online") and typing indicators.
+
+Entries are tracked per socket id with an expiry:
+
+    (kind, groupId) -> userId -> {info, sids: {sid: expiresAt}}
+
+kind is "online" or "typing". A user is listed while at least one of their
+sockets has a live entry, so two tabs don't knock each other offline.
+
+  - disconnect removes every entry of that sid (ChatNamespace.on_disconnect),
+  - the owning process heartbeats its connected sids' "online" entries, so
+    entries left behind by a crashed process simply expire (PRESENCE_TTL),
+  - typing entries are never renewed and expire after TYPING_TTL if the
+    "stop" event gets lost,
+  - a background sweeper drops expired entries.
+
+Changes are not broadcast one by one: RoomCoalescer collects them per room
+and emits at most one `presence_delta` per room every PRESENCE_COALESCE_MS:
+
+    { groupId, joined: [info], left: [uid], typing: [{userId, name}], stoppedTyping: [uid] }
+
+A change that is undone within the same window (join+leave, start+stop) is
+dropped entirely. Full lists are only sent to the socket that asks for them
+(presence_join / join_group).
+
+Backends (PRESENCE_BACKEND):
+  memory  one process; sharded dicts, one lock per shard (default)
+  mongo   shared `presence` collection in PRESENCE_DB (default: the default
+          DB), for several worker processes behind a load balancer
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Set, Tuple
+
+from pymongo import ASCENDING
+
+from db import client, default_db_name, ensure_schema, register_collection
+
+PRESENCE_BACKEND = os.getenv("PRESENCE_BACKEND", "memory").strip().lower()
+
+
+def presence_db_name() -> str:
+    return os.getenv("PRESENCE_DB") or default_db_name()
+
+
+if PRESENCE_BACKEND == "mongo":
+    register_collection(
+        "presence",
+        [("kind", ASCENDING), ("gid", ASCENDING)],
+        [("sid", ASCENDING)],
+        ([("expiresAt", ASCENDING)], {"expireAfterSeconds": 0}),
+        only_in=presence_db_name,
+    )
+PRESENCE_TTL = float(os.getenv("PRESENCE_TTL", "60"))
+TYPING_TTL = float(os.getenv("TYPING_TTL", "8"))
+PRESENCE_SWEEP_SECONDS = float(os.getenv("PRESENCE_SWEEP_SECONDS", "10"))
+PRESENCE_SHARDS = int(os.getenv("PRESENCE_SHARDS", "16"))
+PRESENCE_COALESCE_MS = float(os.getenv("PRESENCE_COALESCE_MS", "250"))
+
+ONLINE = "online"
+TYPING = "typing"
+
+Change = Tuple[str, str, str]  # (kind, gid, uid) that appeared/disappeared
+
+
+# --------------------------------- backends ------------------------------------
+class PresenceStore(ABC):
+    """Backend interface. All times are epoch seconds."""
+
+    @abstractmethod
+    def touch(self, kind: str, gid: str, uid: str, sid: str, info: dict, ttl: float) -> bool:
+        """Add/refresh an entry. Returns True if the visible member list changed."""
+        ...
+
+    @abstractmethod
+    def remove(self, kind: str, gid: str, uid: str, sid: str) -> bool:
+        ...
+
+    @abstractmethod
+    def remove_sid(self, sid: str) -> Set[Change]:
+        """Drop every entry of a socket; returns the (kind, gid, uid) that disappeared."""
+        ...
+
+    @abstractmethod
+    def renew(self, kind: str, sids: Iterable[str], ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    def members(self, kind: str, gid: str) -> List[dict]:
+        ...
+
+    @abstractmethod
+    def sweep(self) -> Set[Change]:
+        """Drop expired entries; returns the (kind, gid, uid) that disappeared."""
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+
+class _Shard:
+    __slots__ = ("lock", "groups")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (kind, gid) -> uid -> {"info": dict, "sids": {sid: expires}}
+        self.groups: Dict[Tuple[str, str], Dict[str, dict]] = {}
+
+
+class MemoryPresenceStore(PresenceStore):
+    """Single-process store: groups spread over N locked shards + a sid index."""
+
+    def __init__(self, shards: int = PRESENCE_SHARDS):
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._sid_lock = threading.Lock()
+        self._by_sid: Dict[str, Set[Tuple[str, str, str]]] = {}
+
+    def _shard(self, gid: str) -> _Shard:
+        return self._shards[zlib.crc32(gid.encode()) % len(self._shards)]
+
+    def touch(self, kind, gid, uid, sid, info, ttl):
+        sh = self._shard(gid)
+        with sh.lock:
+            users = sh.groups.setdefault((kind, gid), {})
+            entry = users.get(uid)
+            changed = entry is None
+            if entry is None:
+                entry = users[uid] = {"info": dict(info), "sids": {}}
+            else:
+                entry["info"].update(info)
+            entry["sids"][sid] = time.time() + ttl
+        with self._sid_lock:
+            self._by_sid.setdefault(sid, set()).add((kind, gid, uid))
+        return changed
+
+    def _drop(self, kind, gid, uid, sid) -> bool:
+        sh = self._shard(gid)
+        with sh.lock:
+            users = sh.groups.get((kind, gid))
+            entry = users.get(uid) if users else None
+            if not entry or sid not in entry["sids"]:
+                return False
+            entry["sids"].pop(sid, None)
+            if entry["sids"]:
+                return False
+            users.pop(uid, None)
+            if not users:
+                sh.groups.pop((kind, gid), None)
+            return True
+
+    def remove(self, kind, gid, uid, sid):
+        with self._sid_lock:
+            refs = self._by_sid.get(sid)
+            if refs:
+                refs.discard((kind, gid, uid))
+                if not refs:
+                    self._by_sid.pop(sid, None)
+        return self._drop(kind, gid, uid, sid)
+
+    def remove_sid(self, sid):
+        with self._sid_lock:
+            refs = self._by_sid.pop(sid, set())
+        return {(kind, gid, uid) for kind, gid, uid in refs if self._drop(kind, gid, uid, sid)}
+
+    def renew(self, kind, sids, ttl):
+        expires = time.time() + ttl
+        with self._sid_lock:
+            refs = [(sid, ref) for sid in sids for ref in self._by_sid.get(sid, ())]
+        for sid, (k, gid, uid) in refs:
+            if k != kind:
+                continue
+            sh = self._shard(gid)
+            with sh.lock:
+                entry = (sh.groups.get((k, gid)) or {}).get(uid)
+                if entry and sid in entry["sids"]:
+                    entry["sids"][sid] = expires
+
+    def members(self, kind, gid):
+        now = time.time()
+        sh = self._shard(gid)
+        with sh.lock:
+            users = sh.groups.get((kind, gid)) or {}
+            return [
+                {**e["info"]} for e in users.values()
+                if any(exp > now for exp in e["sids"].values())
+            ]
+
+    def sweep(self):
+        now = time.time()
+        changed: Set[Change] = set()
+        dead: List[Tuple[str, Tuple[str, str, str]]] = []
+        for sh in self._shards:
+            with sh.lock:
+                for key in list(sh.groups):
+                    users = sh.groups[key]
+                    for uid in list(users):
+                        sids = users[uid]["sids"]
+                        for sid, exp in list(sids.items()):
+                            if exp <= now:
+                                sids.pop(sid)
+                                dead.append((sid, (key[0], key[1], uid)))
+                        if not sids:
+                            users.pop(uid)
+                            changed.add((key[0], key[1], uid))
+                    if not users:
+                        sh.groups.pop(key)
+        if dead:
+            with self._sid_lock:
+                for sid, ref in dead:
+                    refs = self._by_sid.get(sid)
+                    if refs:
+                        refs.discard(ref)
+                        if not refs:
+                            self._by_sid.pop(sid, None)
+        return changed
+
+    def stats(self):
+        groups = entries = 0
+        for sh in self._shards:
+            with sh.lock:
+                groups += len(sh.groups)
+                entries += sum(len(u) for u in sh.groups.values())
+        with self._sid_lock:
+            sids = len(self._by_sid)
+        return {"backend": "memory", "shards": len(self._shards), "lists": groups,
+                "users": entries, "sids": sids}
+
+
+class MongoPresenceStore(PresenceStore):
+    """
+    Shared store for several processes. One doc per (kind, gid, uid, sid);
+    a TTL index on expiresAt is a backstop, the sweeper does the prompt cleanup.
+    """
+
+    def __init__(self, coll=None):
+        self._coll = coll
+
+    def _c(self):
+        """presence collection (indexes applied once per process by ensure_schema)."""
+        if self._coll is None:
+            self._coll = ensure_schema(client()[presence_db_name()]).presence
+        return self._coll
+
+    @staticmethod
+    def _id(kind, gid, uid, sid):
+        return f"{kind}|{gid}|{uid}|{sid}"
+
+    def _has_other(self, kind, gid, uid) -> bool:
+        return self._c().find_one(
+            {"kind": kind, "gid": gid, "uid": uid, "expiresAt": {"$gt": datetime.utcnow()}},
+            {"_id": 1},
+        ) is not None
+
+    def touch(self, kind, gid, uid, sid, info, ttl):
+        existed = self._has_other(kind, gid, uid)
+        self._c().update_one(
+            {"_id": self._id(kind, gid, uid, sid)},
+            {"$set": {"kind": kind, "gid": gid, "uid": uid, "sid": sid, "info": info,
+                      "expiresAt": datetime.utcnow() + timedelta(seconds=ttl)}},
+            upsert=True,
+        )
+        return not existed
+
+    def remove(self, kind, gid, uid, sid):
+        res = self._c().delete_one({"_id": self._id(kind, gid, uid, sid)})
+        return bool(res.deleted_count) and not self._has_other(kind, gid, uid)
+
+    def remove_sid(self, sid):
+        coll = self._c()
+        rows = list(coll.find({"sid": sid}, {"kind": 1, "gid": 1, "uid": 1}))
+        coll.delete_many({"sid": sid})
+        gone = {(r["kind"], r["gid"], r["uid"]) for r in rows}
+        return {c for c in gone if not self._has_other(*c)}
+
+    def renew(self, kind, sids, ttl):
+        sids = list(sids)
+        if sids:
+            self._c().update_many(
+                {"kind": kind, "sid": {"$in": sids}},
+                {"$set": {"expiresAt": datetime.utcnow() + timedelta(seconds=ttl)}},
+            )
+
+    def members(self, kind, gid):
+        out: Dict[str, dict] = {}
+        for r in self._c().find({"kind": kind, "gid": gid, "expiresAt": {"$gt": datetime.utcnow()}}):
+            out.setdefault(r["uid"], r.get("info") or {})
+        return list(out.values())
+
+    def sweep(self):
+        coll = self._c()
+        q = {"expiresAt": {"$lte": datetime.utcnow()}}
+        rows = list(coll.find(q, {"kind": 1, "gid": 1, "uid": 1}))
+        if not rows:
+            return set()
+        coll.delete_many({"_id": {"$in": [r["_id"] for r in rows]}})
+        gone = {(r["kind"], r["gid"], r["uid"]) for r in rows}
+        return {c for c in gone if not self._has_other(*c)}
+
+    def stats(self):
+        return {"backend": "mongo", "entries": self._c().estimated_document_count()}
+
+
+def make_store(backend: str = PRESENCE_BACKEND) -> PresenceStore:
+    if backend == "mongo":
+        return MongoPresenceStore()
+    if backend != "memory":
+        print(f"[presence] unknown PRESENCE_BACKEND={backend!r}, using memory")
+    return MemoryPresenceStore()
+
+
+# -------------------------------- coalescing -----------------------------------
+class RoomCoalescer:
+    """Batches presence/typing changes into one delta event per room per interval."""
+
+    def __init__(self, interval_ms: float = PRESENCE_COALESCE_MS):
+        self.interval = max(0.0, interval_ms) / 1000.0
+        self._lock = threading.Lock()
+        # gid -> {(kind, uid): ("+", info) | ("-", None)}
+        self._pending: Dict[str, Dict[Tuple[str, str], tuple]] = {}
+        self._wake = threading.Event()
+        self.changes = 0     # individual changes recorded
+        self.redundant = 0   # events that changed nothing (repeat typing_start, ...)
+        self.cancelled = 0   # changes undone inside one window
+        self.emitted = 0     # delta events actually sent
+
+    def added(self, gid: str, kind: str, uid: str, info: dict) -> None:
+        self._record(gid, kind, uid, ("+", info))
+
+    def removed(self, gid: str, kind: str, uid: str) -> None:
+        self._record(gid, kind, uid, ("-", None))
+
+    def unchanged(self) -> None:
+        with self._lock:
+            self.redundant += 1
+
+    def _record(self, gid, kind, uid, op) -> None:
+        with self._lock:
+            self.changes += 1
+            room = self._pending.setdefault(gid, {})
+            prev = room.get((kind, uid))
+            if prev and prev[0] != op[0]:
+                room.pop((kind, uid))
+                self.cancelled += 1
+                if not room:
+                    self._pending.pop(gid, None)
+            else:
+                room[(kind, uid)] = op
+        self._wake.set()
+
+    def drain(self) -> Dict[str, dict]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        out = {}
+        for gid, ops in pending.items():
+            delta = {"groupId": gid, "joined": [], "left": [], "typing": [], "stoppedTyping": []}
+            for (kind, uid), (sign, info) in ops.items():
+                if kind == ONLINE:
+                    if sign == "+":
+                        delta["joined"].append(info)
+                    else:
+                        delta["left"].append(uid)
+                elif sign == "+":
+                    delta["typing"].append(info)
+                else:
+                    delta["stoppedTyping"].append(uid)
+            out[gid] = delta
+        return out
+
+    def flush(self, sio) -> int:
+        sent = 0
+        for gid, delta in self.drain().items():
+            try:
+                sio.emit("presence_delta", delta, namespace="/ws/chat", to=f"group:{gid}")
+                sent += 1
+            except Exception as e:
+                print("[presence] delta emit error:", e)
+        with self._lock:
+            self.emitted += sent
+        return sent
+
+    def _loop(self, sio) -> None:
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self.interval:
+                sio.sleep(self.interval)  # let the rest of this window accumulate
+            self.flush(sio)
+
+    def start(self, sio) -> None:
+        sio.start_background_task(self._loop, sio)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "intervalMs": int(self.interval * 1000),
+                "changes": self.changes,
+                "redundant": self.redundant,
+                "cancelled": self.cancelled,
+                "emitted": self.emitted,
+                # what a broadcast-per-event scheme would have sent, minus what we sent
+                "suppressed": self.changes + self.redundant - self.emitted,
+                "pendingRooms": len(self._pending),
+            }
+
+
+# --------------------------------- service -------------------------------------
+class Presence:
+    """What the socket handlers talk to; owns the sids connected to this process."""
+
+    def __init__(self, store: PresenceStore, coalescer: RoomCoalescer):
+        self.store = store
+        self.coalescer = coalescer
+        self._local: Set[str] = set()
+        self._local_lock = threading.Lock()
+        self._started = False
+
+    def _removed(self, changes: Iterable[Change]) -> None:
+        for kind, gid, uid in changes:
+            self.coalescer.removed(gid, kind, uid)
+
+    # --- connection lifecycle ---
+    def connect(self, sid: str) -> None:
+        with self._local_lock:
+            self._local.add(sid)
+
+    def disconnect(self, sid: str) -> None:
+        with self._local_lock:
+            self._local.discard(sid)
+        self._removed(self.store.remove_sid(sid))
+
+    # --- online ---
+    def join(self, gid: str, uid: str, sid: str, name=None, email=None) -> None:
+        info = {"_id": uid, "name": name, "email": email,
+                "lastSeen": datetime.utcnow().isoformat() + "Z"}
+        if self.store.touch(ONLINE, gid, uid, sid, info, PRESENCE_TTL):
+            self.coalescer.added(gid, ONLINE, uid, info)
+        else:
+            self.coalescer.unchanged()
+
+    def leave(self, gid: str, uid: str, sid: str) -> None:
+        if self.store.remove(ONLINE, gid, uid, sid):
+            self.coalescer.removed(gid, ONLINE, uid)
+        else:
+            self.coalescer.unchanged()
+
+    def online(self, gid: str) -> List[dict]:
+        return self.store.members(ONLINE, gid)
+
+    # --- typing ---
+    def typing_start(self, gid: str, uid: str, sid: str, name=None) -> None:
+        info = {"userId": uid, "name": name or "Member"}
+        if self.store.touch(TYPING, gid, uid, sid, info, TYPING_TTL):
+            self.coalescer.added(gid, TYPING, uid, info)
+        else:
+            self.coalescer.unchanged()
+
+    def typing_stop(self, gid: str, uid: str, sid: str) -> None:
+        if self.store.remove(TYPING, gid, uid, sid):
+            self.coalescer.removed(gid, TYPING, uid)
+        else:
+            self.coalescer.unchanged()
+
+    def typing(self, gid: str) -> List[dict]:
+        return self.store.members(TYPING, gid)
+
+    # --- background sweeper ---
+    def _sweep_loop(self, sio) -> None:
+        print(f"[presence] sweeper started ({self.store.__class__.__name__})")
+        while True:
+            sio.sleep(PRESENCE_SWEEP_SECONDS)
+            try:
+                with self._local_lock:
+                    local = list(self._local)
+                # heartbeat: this process still owns these sockets
+                self.store.renew(ONLINE, local, PRESENCE_TTL)
+                self._removed(self.store.sweep())
+            except Exception as e:
+                print("[presence] sweep error:", e)
+
+    def start(self, sio) -> None:
+        if self._started:
+            return
+        self._started = True
+        sio.start_background_task(self._sweep_loop, sio)
+        self.coalescer.start(sio)
+
+    def stats(self) -> dict:
+        with self._local_lock:
+            local = len(self._local)
+        return {**self.store.stats(), "localSids": local,
+                "ttl": PRESENCE_TTL, "typingTtl": TYPING_TTL,
+                "broadcasts": self.coalescer.stats()}
+
+
+presence = Presence(make_store(), RoomCoalescer())
+
+
+def start_presence_sweeper(socketio) -> None:
+    """Start the TTL sweeper and the delta broadcaster (once per process)."""
+    presence.start(socketio)
+
+
+def presence_stats() -> dict:
+    return presence.stats()
@@ -0,0 +1,290 @@
+# backend/reminders.py
+"""
+Event-driven meeting reminder scheduler.
+
+Keeps a min-heap of upcoming `reminderAt` instants across ALL tenant DBs and
+sleeps exactly until the next one is due (instead of polling every N seconds).
+
+  - seeded at startup from every tenant DB (`seed()`),
+  - pushed new entries by meetings.respond_meeting on accept (`schedule()`),
+  - uses the shared pooled client from db.client().
+
+Only the background worker process runs the scheduler. In every other
+process schedule()/cancel() do not touch the heap: with SOCKETIO_FANOUT they
+are forwarded over the fan-out bus (fanout.py) to the process that runs it,
+otherwise they are dropped. A coarse resync (REMINDER_RESYNC_SECONDS, 0 = off)
+picks up anything that did not arrive that way; sending is claimed atomically
+with find_one_and_update so a reminder is never sent twice.
+"""
+from __future__ import annotations
+
+import heapq
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from db import client, all_db_names
+from notify_batch import notify_user
+
+REMINDER_LEAD_MINUTES = int(os.getenv("REMINDER_LEAD_MINUTES", "30"))
+
+
+def reminder_at_for(start_at: Optional[datetime]) -> Optional[datetime]:
+    """reminderAt = startAt - REMINDER_LEAD_MINUTES (naive UTC, like the rest of the app)."""
+    if not isinstance(start_at, datetime):
+        return None
+    if start_at.tzinfo is not None:
+        start_at = start_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return start_at - timedelta(minutes=REMINDER_LEAD_MINUTES)
+
+
+def _ts(dt: datetime) -> float:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _due_query() -> dict:
+    return {
+        "status": "accepted",
+        "reminderSent": {"$ne": True},
+        "reminderAt": {"$ne": None},
+    }
+
+
+class ReminderScheduler:
+    def __init__(self):
+        self._heap: List[Tuple[float, str, str]] = []
+        # (db_name, meeting_id) -> ts currently scheduled (lazy heap deletion)
+        self._scheduled: Dict[Tuple[str, str], float] = {}
+        self._cond = threading.Condition()
+        self._app = None
+        self._socketio = None
+        self._started = False
+        self._forward: Optional[Callable[[str, str, Optional[datetime]], None]] = None
+        self.sent = 0
+        self.forwarded = 0
+
+    # ----------------------------- wiring ------------------------------------
+    def init_app(self, app, socketio) -> None:
+        self._app = app
+        self._socketio = socketio
+
+    def start(self) -> None:
+        if self._started or self._socketio is None:
+            return
+        self._started = True
+        self._socketio.start_background_task(self._run)
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    def forward_to(self, fn: Optional[Callable[[str, str, Optional[datetime]], None]]) -> None:
+        """Where schedule()/cancel() go when this process does not run the scheduler:
+        fn(db_name, meeting_id, reminder_at), reminder_at None meaning cancel."""
+        self._forward = fn
+
+    def _pass_on(self, db_name: str, meeting_id, reminder_at: Optional[datetime]) -> None:
+        if self._forward is None:
+            return  # single scheduler-less process: the resync will find it
+        try:
+            self._forward(db_name, str(meeting_id), reminder_at)
+            self.forwarded += 1
+        except Exception as e:
+            print("[reminder] forward failed:", e)
+
+    def apply_remote(self, db_name: str, meeting_id, reminder_at: Optional[datetime]) -> None:
+        """A schedule()/cancel() forwarded by another process; ignored unless we run the scheduler."""
+        if not self._started:
+            return
+        if reminder_at:
+            self._push(db_name, meeting_id, reminder_at)
+        else:
+            self._drop(db_name, meeting_id)
+
+    # --------------------------- scheduling ----------------------------------
+    def schedule(self, db_name: str, meeting_id, reminder_at: Optional[datetime]) -> None:
+        """Push (or move) a reminder; wakes the worker if it is now the earliest."""
+        if not reminder_at:
+            return
+        if not self._started:
+            self._pass_on(db_name, meeting_id, reminder_at)
+            return
+        self._push(db_name, meeting_id, reminder_at)
+
+    def cancel(self, db_name: str, meeting_id) -> None:
+        if not self._started:
+            self._pass_on(db_name, meeting_id, None)
+            return
+        self._drop(db_name, meeting_id)
+
+    def _push(self, db_name: str, meeting_id, reminder_at: datetime) -> None:
+        key = (db_name, str(meeting_id))
+        ts = _ts(reminder_at)
+        with self._cond:
+            if self._scheduled.get(key) == ts:
+                return
+            self._scheduled[key] = ts
+            heapq.heappush(self._heap, (ts, db_name, str(meeting_id)))
+            if self._heap[0][0] == ts:
+                self._cond.notify()
+
+    def _drop(self, db_name: str, meeting_id) -> None:
+        with self._cond:
+            self._scheduled.pop((db_name, str(meeting_id)), None)
+
+    def seed(self) -> int:
+        """Load every pending reminder from every tenant DB (scheduler process only)."""
+        if not self._started:
+            return 0
+        count = 0
+        for name in all_db_names():
+            try:
+                cur = client()[name].meetings.find(_due_query(), {"reminderAt": 1})
+                for m in cur:
+                    if isinstance(m.get("reminderAt"), datetime):
+                        self._push(name, m["_id"], m["reminderAt"])
+                        count += 1
+            except Exception as e:
+                print(f"[reminder] seed failed for {name}:", e)
+        return count
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._scheduled)
+
+    # ----------------------------- worker ------------------------------------
+    def _pop_due(self, now_ts: float) -> List[Tuple[str, str]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now_ts:
+            ts, db_name, mid = heapq.heappop(self._heap)
+            if self._scheduled.get((db_name, mid)) != ts:
+                continue  # superseded / cancelled
+            self._scheduled.pop((db_name, mid), None)
+            due.append((db_name, mid))
+        return due
+
+    def run_due(self, now: Optional[datetime] = None) -> int:
+        """Send every reminder due at `now`. Returns how many were sent."""
+        now = now or datetime.now(timezone.utc)
+        with self._cond:
+            due = self._pop_due(now.timestamp())
+        sent = 0
+        for db_name, mid in due:
+            if self._send_one(db_name, mid, now):
+                sent += 1
+        return sent
+
+    def _run(self) -> None:
+        resync = int(os.getenv("REMINDER_RESYNC_SECONDS", "900"))
+        with self._app.app_context():
+            try:
+                n = self.seed()
+                print(f"[reminder] scheduler started ({n} pending)")
+            except Exception as e:
+                print("[reminder] seed error:", e)
+            next_resync = time.time() + resync if resync > 0 else None
+
+            while True:
+                with self._cond:
+                    now_ts = time.time()
+                    wake_at = self._heap[0][0] if self._heap else None
+                    if next_resync is not None:
+                        wake_at = min(wake_at, next_resync) if wake_at else next_resync
+                    if wake_at is None or wake_at > now_ts:
+                        timeout = None if wake_at is None else wake_at - now_ts
+                        self._cond.wait(timeout)
+
+                try:
+                    self.run_due()
+                except Exception as e:
+                    print("[reminder] loop error:", e)
+
+                if next_resync is not None and time.time() >= next_resync:
+                    try:
+                        self.seed()
+                    except Exception as e:
+                        print("[reminder] resync error:", e)
+                    next_resync = time.time() + resync
+
+    # ----------------------------- sending -----------------------------------
+    def _send_one(self, db_name: str, mid: str, now: datetime) -> bool:
+        db = client()[db_name]
+        try:
+            m_oid = ObjectId(mid)
+        except Exception:
+            return False
+
+        # claim atomically: only one process/thread sends a given reminder
+        m = db.meetings.find_one_and_update(
+            {**_due_query(), "_id": m_oid, "reminderAt": {"$lte": now.replace(tzinfo=None)}},
+            {"$set": {"reminderSent": True, "reminderSentAt": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if not m:
+            return False
+
+        try:
+            send_meeting_reminder(db, m, self._socketio, now)
+            self.sent += 1
+            return True
+        except Exception as e:
+            print("[reminder] process item error:", e)
+            return False
+
+
+def send_meeting_reminder(db, m: dict, sio, now: datetime) -> None:
+    """Email both parties and push an in-app notify for one meeting."""
+    from blueprints.meetings import _format_when, _get_user_email  # lazy import
+    from outbox import enqueue_email
+
+    slot = m.get("slot") or {}
+    link = m.get("meetingLink")
+    sender_id = str(m.get("senderId"))
+    receiver_id = str(m.get("receiverId"))
+
+    when_text, when_html = _format_when(slot)
+
+    subject = "Reminder: your meeting starts soon"
+    html = f"""
+      <div style="font-family:system-ui,Segoe UI,Arial">
+        <h2>Starting soon</h2>
+        <p>Time: {when_html}</p>
+        {f"<p>Meeting link: <a href='{link}'>{link}</a></p>" if link else ""}
+      </div>
+    """
+    text = f"Starting soon: {when_text}. Link: {link or '(no link)'}"
+
+    # emails
+    try:
+        se = _get_user_email(db, sender_id)
+        re = _get_user_email(db, receiver_id)
+        if se:
+            enqueue_email(to=se, subject=subject, html=html, text=text, kind="meeting_reminder")
+        if re:
+            enqueue_email(to=re, subject=subject, html=html, text=text, kind="meeting_reminder")
+    except Exception as e:
+        print("[reminder] email error:", e)
+
+    # in-app notifications
+    payload = {
+        "type": "meeting_reminder",
+        "title": "Reminder: upcoming meeting",
+        "slot": slot,
+        "at": now.isoformat(),
+    }
+    try:
+        if sio:
+            notify_user(sio, sender_id, "notify", payload)
+            notify_user(sio, receiver_id, "notify", payload)
+    except Exception as e:
+        print("[reminder] socket emit error:", e)
+
+
+reminder_scheduler = ReminderScheduler()
@@ -0,0 +1,317 @@
+# backend/resource_index.py
+"""
+Searchable text of file resources (GET /api/resources/search).
+
+Uploading a file resource only marks it `textStatus: "pending"`; the
+extraction worker (worker process 0, like retention) claims pending
+resources across tenant DBs and runs up to RESOURCE_TEXT_WORKERS
+`python -m doc_text` processes at a time, one per document, so parsing a
+300-page PDF never holds a request thread or the GIL of a process that
+serves sockets. (Plain subprocesses rather than multiprocessing.Pool: its
+helper threads deadlock under eventlet's monkey-patching, and a stuck
+extraction is one kill away.) Results go to
+
+    resource_text {_id: <resource _id>, groupId, title, filename, sha256,
+                   status, text, chars, extractedAt}
+
+with a compound text index { groupId: 1, title, filename, text } (title
+4x, filename 2x), and the resource ends up `done`, `empty`, `unsupported`
+or `failed` (textError says why); the last three are still found by
+title and filename. A resource whose bytes (sha256) were
+already extracted elsewhere in the tenant reuses that text. Claims older
+than 2 x RESOURCE_TEXT_TIMEOUT are taken again, at most
+RESOURCE_TEXT_ATTEMPTS times; a process that runs past the timeout is
+killed and its resource marked failed. Each process also gets an
+address-space limit (RLIMIT_AS) of RESOURCE_TEXT_MAX_MEMORY_MB plus the
+file's size, so a decompression bomb fails the document, not the host.
+
+Files uploaded before this existed are picked up with
+
+    cd backend && python -m resource_index backfill [--db NAME] [--uploads DIR] [--workers N] [--force]
+
+which queues every unindexed file resource and extracts them in parallel
+(--force re-extracts everything); `python -m resource_index stats`.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, ReturnDocument, TEXT
+
+import blob_store
+import chat_search
+import doc_text
+import upload_sessions
+from db import all_db_names, client, ensure_schema, register_collection
+
+RESOURCE_TEXT_WORKERS = int(os.getenv("RESOURCE_TEXT_WORKERS", "0"))  # 0 = CPUs - 1
+RESOURCE_TEXT_POLL_SECONDS = float(os.getenv("RESOURCE_TEXT_POLL_SECONDS", "10"))  # 0 = no worker
+RESOURCE_TEXT_TIMEOUT = float(os.getenv("RESOURCE_TEXT_TIMEOUT", "120"))
+RESOURCE_TEXT_MAX_CHARS = int(os.getenv("RESOURCE_TEXT_MAX_CHARS", "200000"))
+# address space per extractor on top of the document's own size (it is mapped)
+RESOURCE_TEXT_MAX_MEMORY_MB = int(os.getenv("RESOURCE_TEXT_MAX_MEMORY_MB", "512"))  # 0 = no limit
+RESOURCE_TEXT_ATTEMPTS = 3
+RESOURCE_SEARCH_QUERY_MAX = 200
+
+register_collection("resources", [("textStatus", ASCENDING), ("createdAt", ASCENDING)])
+register_collection(
+    "resource_text",
+    ([("groupId", ASCENDING), ("title", TEXT), ("filename", TEXT), ("text", TEXT)],
+     {"name": "resource_search", "weights": {"title": 4, "filename": 2, "text": 1}}),
+    [("sha256", ASCENDING)],
+)
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+_counts = {"done": 0, "empty": 0, "unsupported": 0, "failed": 0, "reused": 0, "timeouts": 0}
+_started = False
+
+
+def pool_size() -> int:
+    return RESOURCE_TEXT_WORKERS or max(1, (os.cpu_count() or 2) - 1)
+
+
+# -------------------------------- queueing ------------------------------------
+def _claim(db) -> Optional[dict]:
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=RESOURCE_TEXT_TIMEOUT * 2)
+    return db.resources.find_one_and_update(
+        {"type": "file", "$or": [
+            {"textStatus": "pending"},
+            {"textStatus": "running", "textClaimedAt": {"$lt": stale},
+             "textAttempts": {"$lt": RESOURCE_TEXT_ATTEMPTS}},
+        ]},
+        {"$set": {"textStatus": "running", "textClaimedAt": now}, "$inc": {"textAttempts": 1}},
+        sort=[("createdAt", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _reuse(db, r: dict) -> bool:
+    """Same bytes already extracted in this tenant: copy that text."""
+    if not r.get("sha256"):
+        return False
+    prev = db.resource_text.find_one({"sha256": r["sha256"], "_id": {"$ne": r["_id"]},
+                                      "status": {"$in": ["done", "empty"]}})
+    if not prev:
+        return False
+    _store(db, r, prev["status"], prev.get("text") or "")
+    _counts["reused"] += 1
+    return True
+
+
+def _store(db, r: dict, status: str, result: str) -> None:
+    """Record the outcome; files without text still get indexed by title and filename."""
+    now = datetime.utcnow()
+    text = result if status == "done" else ""
+    db.resource_text.replace_one({"_id": r["_id"]}, {
+        "groupId": r.get("groupId"),
+        "title": r.get("title") or "",
+        "filename": r.get("filename") or "",
+        "sha256": r.get("sha256"),
+        "status": status,
+        "text": text,
+        "chars": len(text),
+        "extractedAt": now,
+    }, upsert=True)
+    fields = {"textStatus": status, "textChars": len(text), "textAt": now}
+    if status in ("done", "empty"):
+        db.resources.update_one({"_id": r["_id"]}, {"$set": fields, "$unset": {"textError": ""}})
+    else:
+        db.resources.update_one({"_id": r["_id"]}, {"$set": {**fields, "textError": result}})
+    _counts[status] += 1
+
+
+def queue_existing(db, force: bool = False) -> int:
+    """Mark file resources that were never extracted (or all, with force) as pending."""
+    q: dict = {"type": "file"}
+    if not force:
+        q["textStatus"] = {"$exists": False}
+    return db.resources.update_many(q, {"$set": {"textStatus": "pending", "textAttempts": 0}}).modified_count
+
+
+def _job_path(db, r: dict, upload_dir: str) -> Optional[str]:
+    """File to extract, or None when the resource was settled without a process."""
+    if _reuse(db, r):
+        return None
+    path = blob_store.resource_path(upload_dir, r)
+    if not os.path.isfile(path):
+        _store(db, r, "failed", "file missing")
+        return None
+    return path
+
+
+# --------------------------------- worker -------------------------------------
+def _read_result(path: str, returncode: int) -> Tuple[str, str]:
+    try:
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        return data["status"], data.get("text") or data.get("error") or ""
+    except (OSError, ValueError, KeyError):
+        return "failed", f"extractor exited with status {returncode}"
+
+
+class ExtractionPool:
+    """Up to `size` concurrent `python -m doc_text` processes, one per document."""
+
+    def __init__(self, size: int, upload_dir: str):
+        self.size = max(1, size)
+        self.upload_dir = upload_dir
+        self.jobs: List[tuple] = []  # (proc, result path, db name, resource, started)
+
+    def __len__(self) -> int:
+        return len(self.jobs)
+
+    def full(self) -> bool:
+        return len(self.jobs) >= self.size
+
+    def fill(self, db_name: str) -> None:
+        """Claim pending resources of one tenant until every slot is busy."""
+        db = client()[db_name]
+        while not self.full():
+            r = _claim(db)
+            if not r:
+                return
+            path = _job_path(db, r, self.upload_dir)
+            if path:
+                self._spawn(db_name, r, path)
+
+    def _spawn(self, db_name: str, r: dict, path: str) -> None:
+        out = upload_sessions.staging_path(self.upload_dir, f"text-{r['_id']}")
+        memory_mb = 0
+        if RESOURCE_TEXT_MAX_MEMORY_MB:
+            memory_mb = RESOURCE_TEXT_MAX_MEMORY_MB + os.path.getsize(path) // (1024 * 1024) + 1
+        # the child sets its own RLIMIT_AS first thing (preexec_fn is unsafe in a threaded parent)
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "doc_text", path, "--name", r.get("filename") or path,
+             "--max-chars", str(RESOURCE_TEXT_MAX_CHARS), "--max-memory-mb", str(memory_mb), "--out", out],
+            cwd=_HERE, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        self.jobs.append((proc, out, db_name, r, time.monotonic()))
+
+    def reap(self) -> None:
+        """Store the results of finished processes; kill the ones past RESOURCE_TEXT_TIMEOUT."""
+        for job in list(self.jobs):
+            proc, out, db_name, r, started = job
+            code = proc.poll()
+            if code is None:
+                if time.monotonic() - started <= RESOURCE_TEXT_TIMEOUT:
+                    continue
+                proc.kill()
+                proc.wait()
+                status, result = "failed", f"timed out after {RESOURCE_TEXT_TIMEOUT:.0f}s"
+                _counts["timeouts"] += 1
+            else:
+                status, result = _read_result(out, code)
+            self.jobs.remove(job)
+            try:
+                os.remove(out)
+            except OSError:
+                pass
+            _store(client()[db_name], r, status, result)
+
+
+def _loop(socketio, upload_dir: str) -> None:
+    pool = ExtractionPool(pool_size(), upload_dir)
+    while True:
+        try:
+            pool.reap()
+            for name in all_db_names():
+                if pool.full():
+                    break
+                pool.fill(name)
+        except Exception as e:
+            print("[resource_text] worker error:", e)
+        socketio.sleep(0.25 if len(pool) else RESOURCE_TEXT_POLL_SECONDS)
+
+
+def start_resource_text_worker(socketio, upload_dir: str) -> None:
+    """Extract pending resources every RESOURCE_TEXT_POLL_SECONDS (once per process)."""
+    global _started
+    if _started or RESOURCE_TEXT_POLL_SECONDS <= 0:
+        return
+    _started = True
+    socketio.start_background_task(_loop, socketio, upload_dir)
+
+
+def resource_text_stats() -> dict:
+    return {
+        "processes": pool_size(),
+        "pollSeconds": RESOURCE_TEXT_POLL_SECONDS,
+        "pdf": "pypdf" if doc_text.pypdf else "stdlib",
+        **_counts,
+    }
+
+
+# --------------------------------- search -------------------------------------
+def search(db, group_id: str, q: str, limit: int) -> List[dict]:
+    """Best-matching file resources of the group, each with `_score` and `snippet`."""
+    rows = list(
+        db.resource_text.find({"groupId": group_id, "$text": {"$search": q}},
+                              {"score": {"$meta": "textScore"}, "text": 1, "title": 1, "filename": 1})
+        .sort([("score", {"$meta": "textScore"})])
+        .limit(limit)
+    )
+    rx = chat_search.matcher(chat_search.terms(q))
+    for row in rows:
+        text = row.get("text") or ""
+        if not (rx and rx.search(text)):
+            text = row.get("title") or row.get("filename") or text
+        row["snippet"] = chat_search.snippet(text, rx)
+    return rows
+
+
+# ---------------------------------- CLI ---------------------------------------
+def backfill(db_names=None, upload_dir: Optional[str] = None, processes: Optional[int] = None,
+             force: bool = False) -> Dict[str, dict]:
+    """Queue and extract every unindexed file resource, `processes` at a time."""
+    pool = ExtractionPool(processes or pool_size(), upload_dir)
+    out: Dict[str, dict] = {}
+    for name in db_names or all_db_names():
+        db = ensure_schema(client()[name])
+        before = dict(_counts)
+        queued = queue_existing(db, force)
+        started = time.time()
+        while True:
+            pool.fill(name)
+            if not len(pool):
+                break
+            time.sleep(0.05)
+            pool.reap()
+        out[name] = {"queued": queued, "seconds": round(time.time() - started, 1),
+                     **{k: _counts[k] - before[k] for k in _counts}}
+        print(f"[resource_text] {name}: {out[name]}")
+    return out
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("command", choices=["backfill", "stats"])
+    ap.add_argument("--db", action="append", help="database name (repeatable; default: every tenant DB)")
+    ap.add_argument("--uploads", default=os.getenv("UPLOAD_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "uploads"))
+    ap.add_argument("--workers", type=int, default=0, help="extraction processes (default: CPUs - 1)")
+    ap.add_argument("--force", action="store_true", help="backfill: re-extract already indexed files")
+    args = ap.parse_args(argv)
+
+    if args.command == "backfill":
+        backfill(args.db, args.uploads, args.workers or None, args.force)
+        return
+    for name in args.db or all_db_names():
+        db = ensure_schema(client()[name])
+        by_status = {row["_id"] or "never": row["n"] for row in db.resources.aggregate([
+            {"$match": {"type": "file"}},
+            {"$group": {"_id": "$textStatus", "n": {"$sum": 1}}},
+        ])}
+        print(f"[resource_text] {name}: {by_status}")
+
+
+if __name__ == "__main__":
+    main()
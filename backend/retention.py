@@ -0,0 +1,321 @@
+# backend/retention.py
+"""
+Per-tenant data retention.
+
+Each tenant DB may carry a policy document
+
+    settings { _id: "retention", chatDays, readNotificationDays }
+
+(set with `python -m retention set`); a missing field falls back to
+CHAT_RETENTION_DAYS / NOTIFY_READ_RETENTION_DAYS, and 0 keeps data forever
+(the default). A run, every RETENTION_INTERVAL_HOURS in the background
+worker process or by hand with
+
+    cd backend && python -m retention run [--db NAME] [--uploads DIR]
+
+does, per tenant:
+  - chat: messages older than chatDays move from the hot storage into the
+    compressed chat_archive (chat_archive.py); history still pages into them
+  - notifications: keeps a TTL index on `readAt` (set when a notification
+    is marked read) with expireAfterSeconds = readNotificationDays, so
+    mongod deletes read notifications on its own; read ones from before
+    readAt existed are stamped once
+  - deleted groups: drops their group_reads, messages, buckets, archive
+    runs, counter and chat-file references (blob_names)
+and, once for the cluster, removes UPLOAD_DIR/<gid>/ folders of groups that
+no longer exist in any tenant and blobs no tenant references any more,
+plus staging files of expired resumable uploads. Deleted-group and orphan
+cleanup only runs with RETENTION_PURGE_ORPHANS=true (or `--purge-orphans`);
+a group counts as live if it is in `study_groups` or the legacy `groups`
+collection (membership._GROUP_COLLECTIONS).
+
+The report gives bytes reclaimed per tenant: BSON bytes taken out of the
+hot collections minus the compressed archive bytes written, plus the bytes
+of orphaned documents, plus read notifications now due for TTL expiry.
+The last one is kept on the tenant's settings doc as `lastRun`.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+
+import blob_store
+import chat_archive
+import upload_sessions
+from chat_store import CHAT_STORAGE, _counter_id
+from db import all_db_names, client, ensure_schema, register_collection
+from membership import _GROUP_COLLECTIONS
+
+CHAT_RETENTION_DAYS = int(os.getenv("CHAT_RETENTION_DAYS", "0"))
+NOTIFY_READ_RETENTION_DAYS = int(os.getenv("NOTIFY_READ_RETENTION_DAYS", "0"))
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", "24"))  # 0 = no worker
+RETENTION_PURGE_ORPHANS = os.getenv("RETENTION_PURGE_ORPHANS", "false").lower() in ("true", "1", "yes")
+
+# upload folders younger than this are left alone (their group may be brand new)
+_UPLOAD_GRACE = timedelta(days=1)
+_TTL_INDEX = "readAt_ttl"
+_DAY = 86400
+
+register_collection("settings")
+
+_last: Dict[str, object] = {}
+
+
+def policy(db) -> Dict[str, int]:
+    doc = db.settings.find_one({"_id": "retention"}) or {}
+    return {
+        "chatDays": int(doc.get("chatDays") if doc.get("chatDays") is not None else CHAT_RETENTION_DAYS),
+        "readNotificationDays": int(doc.get("readNotificationDays")
+                                    if doc.get("readNotificationDays") is not None
+                                    else NOTIFY_READ_RETENTION_DAYS),
+    }
+
+
+def set_policy(db, chat_days: Optional[int] = None, read_notification_days: Optional[int] = None) -> dict:
+    fields = {}
+    if chat_days is not None:
+        fields["chatDays"] = max(0, int(chat_days))
+    if read_notification_days is not None:
+        fields["readNotificationDays"] = max(0, int(read_notification_days))
+    if fields:
+        db.settings.update_one({"_id": "retention"}, {"$set": fields}, upsert=True)
+    return policy(db)
+
+
+def _bytes(coll, q: dict) -> int:
+    """Total BSON size of the documents matching q ($bsonSize needs MongoDB 4.4+)."""
+    try:
+        rows = list(coll.aggregate([
+            {"$match": q},
+            {"$group": {"_id": None, "n": {"$sum": {"$bsonSize": "$$ROOT"}}}},
+        ]))
+    except OperationFailure:
+        return 0
+    return int(rows[0]["n"]) if rows else 0
+
+
+# ------------------------------ notifications ---------------------------------
+def _read_ttl(db, days: int, now: datetime) -> dict:
+    coll = db.notifications
+    current = coll.index_information().get(_TTL_INDEX)
+    if not days:
+        if current:
+            coll.drop_index(_TTL_INDEX)
+        return {"ttlDays": 0, "expiring": 0, "expiringBytes": 0, "stamped": 0}
+
+    seconds = days * _DAY
+    if current is None:
+        coll.create_index([("readAt", ASCENDING)], name=_TTL_INDEX, expireAfterSeconds=seconds)
+    elif current.get("expireAfterSeconds") != seconds:
+        db.command("collMod", "notifications", index={"name": _TTL_INDEX, "expireAfterSeconds": seconds})
+    stamped = coll.update_many(
+        {"read": True, "readAt": {"$exists": False}}, {"$set": {"readAt": now}}
+    ).modified_count
+    due = {"readAt": {"$lt": now - timedelta(seconds=seconds)}}
+    return {
+        "ttlDays": days,
+        "expiring": coll.count_documents(due),
+        "expiringBytes": _bytes(coll, due),
+        "stamped": stamped,
+    }
+
+
+# ------------------------------- orphans --------------------------------------
+def _live_groups(db) -> set:
+    """Ids of every group the app can still resolve (current and legacy collection)."""
+    live = set()
+    for name in _GROUP_COLLECTIONS:
+        live.update(db[name].distinct("_id"))
+    return live
+
+
+def _purge_deleted_groups(db, live: set) -> dict:
+    """Chat state of groups that were deleted (delete_group only drops the group doc)."""
+    gone = set()
+    for coll in (db.group_reads, db.group_messages, db.chat_buckets, db.chat_archive, db.blob_names):
+        gone.update(g for g in coll.distinct("groupId") if g not in live)
+    out = {"groups": len(gone), "documents": 0, "bytes": 0}
+    if not gone:
+        return out
+    q = {"groupId": {"$in": list(gone)}}
+    for coll in (db.group_reads, db.group_messages, db.chat_buckets, db.chat_archive):
+        out["bytes"] += _bytes(coll, q)
+        out["documents"] += coll.delete_many(q).deleted_count
+    db.counters.delete_many({"_id": {"$in": [_counter_id(g) for g in gone]}})
+    out["documents"] += blob_store.drop_groups(db, gone)  # their files go with the next gc()
+    return out
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def purge_upload_dirs(upload_dir: str, live: set, now: datetime) -> dict:
+    """Remove UPLOAD_DIR/<gid>/ folders whose group exists in no tenant."""
+    out = {"dirs": 0, "bytes": 0}
+    if not upload_dir or not os.path.isdir(upload_dir):
+        return out
+    live_ids = {str(g) for g in live}
+    for name in os.listdir(upload_dir):
+        path = os.path.join(upload_dir, name)
+        if not ObjectId.is_valid(name) or name in live_ids or not os.path.isdir(path):
+            continue
+        if now - datetime.utcfromtimestamp(os.path.getmtime(path)) < _UPLOAD_GRACE:
+            continue
+        size = _dir_bytes(path)
+        shutil.rmtree(path, ignore_errors=True)
+        out["dirs"] += 1
+        out["bytes"] += size
+    return out
+
+
+# --------------------------------- run ----------------------------------------
+def run_tenant(db, now: Optional[datetime] = None, purge_orphans: bool = RETENTION_PURGE_ORPHANS) -> dict:
+    now = now or datetime.utcnow()
+    pol = policy(db)
+    report: Dict[str, object] = {"policy": pol}
+
+    chat = {"groups": 0, "messages": 0, "rawBytes": 0, "archiveBytes": 0}
+    if pol["chatDays"]:
+        chat = chat_archive.archive_older_than(db, now - timedelta(days=pol["chatDays"]), CHAT_STORAGE)
+    report["chat"] = chat
+    report["notifications"] = _read_ttl(db, pol["readNotificationDays"], now)
+
+    orphans = {"groups": 0, "documents": 0, "bytes": 0}
+    live = _live_groups(db) if purge_orphans else set()
+    if live:  # no groups at all looks like the wrong DB: leave it be
+        orphans = _purge_deleted_groups(db, live)
+    report["orphans"] = orphans
+
+    report["reclaimedBytes"] = (
+        max(0, chat["rawBytes"] - chat["archiveBytes"])
+        + orphans["bytes"]
+        + report["notifications"]["expiringBytes"]
+    )
+    report["at"] = now
+    db.settings.update_one({"_id": "retention"}, {"$set": {"lastRun": report}}, upsert=True)
+    return report
+
+
+def run(db_names=None, upload_dir: Optional[str] = None,
+        purge_orphans: bool = RETENTION_PURGE_ORPHANS) -> dict:
+    """One retention pass over the given (default: all) tenant DBs."""
+    started = time.time()
+    now = datetime.utcnow()
+    tenants: Dict[str, object] = {}
+    for name in db_names or all_db_names():
+        try:
+            rep = run_tenant(ensure_schema(client()[name]), now=now, purge_orphans=purge_orphans)
+            tenants[name] = rep
+            print(f"[retention] {name}: {rep['chat']['messages']} messages archived, "
+                  f"{rep['reclaimedBytes']} bytes reclaimed")
+        except Exception as e:
+            tenants[name] = {"error": str(e)}
+            print(f"[retention] {name} failed:", e)
+
+    uploads = {"dirs": 0, "bytes": 0}
+    blobs = {"files": 0, "bytes": 0}
+    # folders and blobs are shared by all tenants: only judge them after a pass over every DB
+    if purge_orphans and upload_dir and not db_names:
+        live = set()
+        for name in all_db_names():
+            live.update(_live_groups(client()[name]))
+        if live:
+            uploads = purge_upload_dirs(upload_dir, live, now)
+        if uploads["dirs"]:
+            print(f"[retention] uploads: {uploads['dirs']} orphaned folders, {uploads['bytes']} bytes")
+        blobs = blob_store.gc(upload_dir)
+        if blobs["files"]:
+            print(f"[retention] blobs: {blobs['files']} unreferenced, {blobs['bytes']} bytes")
+    staging = upload_sessions.sweep_staging(upload_dir) if upload_dir else {"files": 0, "bytes": 0}
+
+    out = {
+        "at": now,
+        "seconds": round(time.time() - started, 2),
+        "tenants": tenants,
+        "uploads": uploads,
+        "staging": staging,
+        "blobs": blobs,
+        "reclaimedBytes": uploads["bytes"] + staging["bytes"] + blobs["bytes"] + sum(
+            t.get("reclaimedBytes", 0) for t in tenants.values()
+        ),
+    }
+    _last.clear()
+    _last.update(out)
+    return out
+
+
+def _loop(socketio, upload_dir: str) -> None:
+    while True:
+        try:
+            run(upload_dir=upload_dir)
+        except Exception as e:
+            print("[retention] run failed:", e)
+        socketio.sleep(RETENTION_INTERVAL_HOURS * 3600)
+
+
+_started = False
+
+
+def start_retention_worker(socketio, upload_dir: str) -> None:
+    """Run retention now and every RETENTION_INTERVAL_HOURS (once per process)."""
+    global _started
+    if _started or RETENTION_INTERVAL_HOURS <= 0:
+        return
+    _started = True
+    socketio.start_background_task(_loop, socketio, upload_dir)
+
+
+def retention_stats() -> dict:
+    return {
+        "intervalHours": RETENTION_INTERVAL_HOURS,
+        "defaults": {"chatDays": CHAT_RETENTION_DAYS, "readNotificationDays": NOTIFY_READ_RETENTION_DAYS},
+        "codec": chat_archive.CHAT_ARCHIVE_CODEC,
+        "lastRun": dict(_last) or None,
+    }
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("command", choices=["run", "set", "stats"])
+    ap.add_argument("--db", action="append", help="database name (repeatable; default: every tenant DB)")
+    ap.add_argument("--uploads", default=os.getenv("UPLOAD_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "uploads"))
+    ap.add_argument("--chat-days", type=int, help="set: archive chat older than N days (0 = never)")
+    ap.add_argument("--read-notification-days", type=int,
+                    help="set: expire read notifications after N days (0 = never)")
+    ap.add_argument("--purge-orphans", action="store_true", default=RETENTION_PURGE_ORPHANS,
+                    help="run: also clean up deleted groups, orphaned upload folders and blobs")
+    args = ap.parse_args(argv)
+
+    if args.command == "run":
+        out = run(args.db, upload_dir=args.uploads, purge_orphans=args.purge_orphans)
+        print(f"[retention] {out['reclaimedBytes']} bytes reclaimed in {out['seconds']}s")
+        return
+    for name in args.db or all_db_names():
+        db = ensure_schema(client()[name])
+        if args.command == "set":
+            print(f"[retention] {name}: {set_policy(db, args.chat_days, args.read_notification_days)}")
+        else:
+            last = (db.settings.find_one({"_id": "retention"}) or {}).get("lastRun")
+            print(f"[retention] {name}: policy {policy(db)}, archive {chat_archive.stats(db)}, "
+                  f"last run {last and last.get('at')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -72,7 +72,8 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.security import check_password_hash, generate_password_hash
 import re
 
-from db import get_db
+from db import get_db, register_collection
+from helpers import invalidate_user
 
 me_bp = Blueprint("me", __name__, url_prefix="/api/me")
 
@@ -84,10 +85,7 @@ STRONG_PASS_RE = re.compile(
 )
 
 
-def ensure_prefs_collection(db):
-    if "user_prefs" not in db.list_collection_names():
-        db.create_collection("user_prefs")
-    db.user_prefs.create_index([("userId", 1)], unique=True)
+register_collection("user_prefs", ([("userId", 1)], {"unique": True}))
 
 
 def _oid(s):
@@ -110,7 +108,6 @@ def _iso(dt):
 @jwt_required()
 def get_prefs():
     db = get_db()
-    ensure_prefs_collection(db)
 
     uid = _oid(get_jwt_identity())
     if not uid:
@@ -125,7 +122,6 @@ def get_prefs():
 @jwt_required()
 def set_prefs():
     db = get_db()
-    ensure_prefs_collection(db)
 
     uid = _oid(get_jwt_identity())
     if not uid:
@@ -283,6 +279,7 @@ def update_profile():
     updates["updatedAt"] = datetime.utcnow()
 
     db.users.update_one({"_id": uid}, {"$set": updates})
+    invalidate_user(db, uid)
     return jsonify({"ok": True}), 200
 
 
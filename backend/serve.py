@@ -0,0 +1,265 @@
+# backend/serve.py
+"""
+Production entry point (`python app.py` stays the dev server with reloader).
+
+    cd backend && python serve.py
+    python serve.py --mode eventlet --workers 4 --port 57977
+
+  - async mode (ASYNC_MODE / --mode): eventlet, gevent or threading; "auto"
+    takes the first cooperative library that is installed. A WebSocket then
+    costs a greenlet instead of an OS thread.
+  - eventlet/gevent monkey-patch the stdlib in each worker BEFORE `app`
+    (and with it pymongo) is imported, so Mongo/SMTP I/O yields instead of
+    blocking the whole process.
+  - workers (WEB_WORKERS, 0 = one per CPU) are pre-forked: the parent binds
+    the port once, every worker accepts on the shared socket, and the parent
+    restarts workers that die. WEB_CONNECTIONS caps concurrent connections
+    per worker (greenlet pool size, or thread count in threading mode).
+  - app-wide background workers (reminders, email outbox, retention, text
+    extraction) run in worker 0 only; the presence heartbeat/delta
+    broadcaster runs in every worker since each one owns its own sockets.
+    BACKGROUND_WORKERS=false turns the app-wide ones off here (e.g. when
+    another host runs them).
+
+More than one worker needs SOCKETIO_FANOUT (see fanout.py) so emits reach
+sockets held by the other processes, and PRESENCE_BACKEND=mongo so they
+share who is online; without SOCKETIO_FANOUT the launcher runs one worker.
+
+The parent imports nothing but the stdlib and dotenv: patching and the app
+import happen after the fork, like gunicorn's async workers.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODES = ("eventlet", "gevent", "threading")
+# per-worker connection cap when WEB_CONNECTIONS is 0
+DEFAULT_CONNECTIONS = {"eventlet": 1000, "gevent": 1000, "threading": 200}
+
+
+def _flag(name: str, default: bool) -> bool:
+    return os.getenv(name, "true" if default else "false").lower() in ("true", "1", "yes")
+
+
+def _installed(mode: str) -> bool:
+    if mode == "threading":
+        return True
+    return importlib.util.find_spec(mode) is not None  # without importing it here
+
+
+def resolve_mode(mode: str) -> str:
+    mode = (mode or "auto").strip().lower()
+    if mode == "auto":
+        return next(m for m in MODES if _installed(m))
+    if mode not in MODES:
+        raise SystemExit(f"[serve] unknown ASYNC_MODE={mode!r} (use auto, {', '.join(MODES)})")
+    if not _installed(mode):
+        raise SystemExit(f"[serve] ASYNC_MODE={mode} but {mode} is not installed (pip install {mode})")
+    return mode
+
+
+def monkey_patch(mode: str) -> None:
+    """Make socket/ssl/select/time/threading cooperative. Call before pymongo is imported."""
+    if "pymongo" in sys.modules and mode != "threading":
+        print(f"[serve] WARNING: pymongo was imported before {mode} monkey-patching")
+    if mode == "eventlet":
+        import eventlet
+        eventlet.monkey_patch()
+    elif mode == "gevent":
+        from gevent import monkey
+        monkey.patch_all()
+
+
+def cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))  # honours taskset / container CPU sets
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def size_workers(requested: int) -> int:
+    n = requested if requested > 0 else cpu_count()
+    if n > 1 and not hasattr(os, "fork"):
+        print("[serve] no fork() on this platform; running 1 worker")
+        return 1
+    if n > 1 and not os.getenv("SOCKETIO_FANOUT"):
+        print("[serve] SOCKETIO_FANOUT is not set; running 1 worker "
+              "(emits would not reach sockets held by other workers)")
+        return 1
+    if n > 1 and os.getenv("PRESENCE_BACKEND", "memory").strip().lower() != "mongo":
+        print("[serve] WARNING: several workers with PRESENCE_BACKEND=memory; "
+              "each worker only sees its own members online")
+    return n
+
+
+def size_connections(mode: str, requested: int) -> int:
+    return requested if requested > 0 else DEFAULT_CONNECTIONS[mode]
+
+
+def listen(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+# --------------------------------- servers ------------------------------------
+def _threaded_server(sock: socket.socket, wsgi_app, threads: int):
+    import logging
+    import threading
+    from werkzeug.serving import ThreadedWSGIServer
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no per-request lines
+
+    class BoundedThreadedServer(ThreadedWSGIServer):
+        """Werkzeug's threaded server with at most `threads` live connections."""
+
+        def __init__(self):
+            self._slots = threading.BoundedSemaphore(threads)
+            host, port = sock.getsockname()[:2]
+            super().__init__(host, port, wsgi_app, fd=sock.fileno())
+
+        def process_request(self, request, client_address):
+            self._slots.acquire()  # full: stop accepting, the backlog queues up
+            try:
+                super().process_request(request, client_address)
+            except Exception:
+                self._slots.release()
+                raise
+
+        def process_request_thread(self, request, client_address):
+            try:
+                super().process_request_thread(request, client_address)
+            finally:
+                self._slots.release()
+
+    return BoundedThreadedServer()
+
+
+def serve_app(wsgi_app, mode: str, sock: socket.socket, connections: int) -> None:
+    """Serve `wsgi_app` on an already listening socket (after monkey_patch(mode))."""
+    if mode == "eventlet":
+        import eventlet.wsgi
+        green = socket.socket(sock.family, sock.type, fileno=sock.detach())
+        eventlet.wsgi.server(green, wsgi_app, max_size=connections, log_output=False)
+    elif mode == "gevent":
+        from gevent.pool import Pool
+        from gevent.pywsgi import WSGIServer
+        kw = {}
+        try:
+            from geventwebsocket.handler import WebSocketHandler
+            kw["handler_class"] = WebSocketHandler
+        except ImportError:
+            pass  # engineio falls back to simple-websocket
+        green = socket.socket(sock.family, sock.type, fileno=sock.detach())
+        WSGIServer(green, wsgi_app, spawn=Pool(connections), log=None, **kw).serve_forever()
+    else:
+        _threaded_server(sock, wsgi_app, connections).serve_forever()
+
+
+# --------------------------------- workers ------------------------------------
+def run_worker(index: int, mode: str, sock: socket.socket, connections: int, background: bool) -> None:
+    monkey_patch(mode)
+    os.environ["ASYNC_MODE"] = mode
+    os.environ["BACKGROUND_WORKERS"] = "true" if background else "false"
+    from app import app  # noqa: E402  (after monkey-patching, on purpose)
+
+    extra = " +background" if background else ""
+    print(f"[serve] worker {index} pid={os.getpid()} mode={mode} connections={connections}{extra}")
+    serve_app(app, mode, sock, connections)
+
+
+def _fork_worker(index: int, start) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    code = 0
+    try:
+        start(index)
+    except KeyboardInterrupt:
+        pass
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def supervise(workers: int, start) -> None:
+    """Fork `workers` children running start(index); restart any that die."""
+    children = {}
+    for i in range(workers):
+        children[_fork_worker(i, start)] = i
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        print(f"[serve] worker {index} (pid {pid}) exited with status {status}; restarting")
+        time.sleep(1)
+        children[_fork_worker(index, start)] = index
+    print("[serve] stopped")
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mode", default=os.getenv("ASYNC_MODE", "auto"))
+    ap.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("PORT", "57977")))
+    ap.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", "0")))
+    ap.add_argument("--connections", type=int, default=int(os.getenv("WEB_CONNECTIONS", "0")))
+    args = ap.parse_args(argv)
+
+    mode = resolve_mode(args.mode)
+    workers = size_workers(args.workers)
+    connections = size_connections(mode, args.connections)
+    background = _flag("BACKGROUND_WORKERS", True)
+    sock = listen(args.host, args.port)
+    print(f"[serve] http://{args.host}:{args.port} mode={mode} workers={workers} "
+          f"connections/worker={connections} cpus={cpu_count()}")
+
+    def start(index: int) -> None:
+        run_worker(index, mode, sock, connections, background and index == 0)
+
+    if workers == 1:
+        try:
+            start(0)
+        except KeyboardInterrupt:
+            pass
+        return
+    supervise(workers, start)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,18 @@
+import os
 from datetime import datetime
 from bson import ObjectId
-from flask_socketio import Namespace, emit, join_room, leave_room
+from flask import request, session
+from flask_jwt_extended import decode_token
+from flask_socketio import ConnectionRefusedError, Namespace, emit, join_room, leave_room
 
-from db import get_db, db_for_email
-from helpers import university_from_email
+from db import client, db_for_email, db_for_tenant, default_db_name, ensure_schema
+from helpers import load_user, university_from_email
+from membership import is_member
+from chat_store import insert_message, messages_after, seq_of
+from presence import presence
 
-GROUP_ONLINE = {}
+# most messages join_group replays on reconnect; further behind = refetch history
+CHAT_GAP_FILL_MAX = int(os.getenv("CHAT_GAP_FILL_MAX", "100"))
 
 
 def _oid(v):
@@ -15,31 +22,6 @@ def _oid(v):
         return None
 
 
-def _id_eq(a, b) -> bool:
-    return str(a) == str(b)
-
-
-def _ensure_chat_indexes(db):
-    if "group_messages" not in db.list_collection_names():
-        db.create_collection("group_messages")
-    db.group_messages.create_index([("groupId", 1), ("createdAt", 1)], background=True)
-
-
-def _is_member(db, gid: ObjectId, uid: ObjectId) -> bool:
-    doc = db.study_groups.find_one(
-        {"_id": gid}, {"members._id": 1, "ownerId": 1, "memberIds": 1}
-    )
-    if not doc:
-        return False
-    if _id_eq(doc.get("ownerId"), uid):
-        return True
-    if any(_id_eq(m.get("_id"), uid) for m in (doc.get("members") or [])):
-        return True
-    if any(_id_eq(mid, uid) for mid in (doc.get("memberIds") or [])):
-        return True
-    return False
-
-
 def _serialize_msg(doc):
     return {
         "id": str(doc["_id"]),
@@ -52,19 +34,84 @@ def _serialize_msg(doc):
         },
         "text": doc["text"],
         "createdAt": doc["createdAt"].isoformat() + "Z",
+        "seq": doc.get("seq"),
+    }
+
+
+def _serialize_stored(doc):
+    """group_messages row in the shape its live event had (socket vs REST sender)."""
+    if doc.get("user"):
+        return _serialize_msg(doc)
+    from blueprints.groups import _serialize_chat  # lazy: REST-sent messages (from/kind/file)
+    return _serialize_chat(doc)
+
+
+def _gap_fill(db, gid, data) -> dict:
+    """
+    Messages a reconnecting client missed, from its lastSeq or lastSeenId.
+    {} when it sent neither; {"refetch": True} when it is too far behind
+    (or its last message is unknown) and should reload history instead.
+    """
+    last_seq = data.get("lastSeq")
+    if last_seq is None and data.get("lastSeenId"):
+        mid = _oid(str(data["lastSeenId"]))
+        last_seq = seq_of(db, gid, mid) if mid else None
+        if last_seq is None:
+            return {"refetch": True}
+    if last_seq is None:
+        return {}
+    try:
+        last_seq = max(0, int(last_seq))
+    except (TypeError, ValueError):
+        return {"refetch": True}
+    rows, more = messages_after(db, gid, last_seq, CHAT_GAP_FILL_MAX)
+    if more:
+        return {"refetch": True}
+    return {
+        "missed": [_serialize_stored(r) for r in rows],
+        "lastSeq": rows[-1]["seq"] if rows else last_seq,
     }
 
 
-def _tenant_db_from_email_or_default(email: str):
+def _tenant_db_from_claims(claims: dict):
     """
-    Prefer the tenant DB resolved from a university email.
-    Fallback to request-bound DB (single-tenant dev) if anything fails.
+    Tenant DB from the JWT: `tenant` claim first, then the university email.
+    Fallback to the default DB (single-tenant dev) if anything fails.
     """
+    tenant = claims.get("tenant")
+    if tenant:
+        return db_for_tenant(str(tenant))
+    email = (claims.get("email") or "").strip().lower()
     try:
         university_from_email(email)  # raises if not a university address
         return db_for_email(email)
     except Exception:
-        return get_db()
+        return ensure_schema(client()[default_db_name()])
+
+
+def _handshake_token(auth) -> str:
+    """JWT from the Socket.IO auth payload, the Authorization header or ?token=."""
+    if isinstance(auth, dict) and auth.get("token"):
+        return str(auth["token"])
+    header = request.headers.get("Authorization", "")
+    if header.lower().startswith("bearer "):
+        return header[7:].strip()
+    return request.args.get("token") or ""
+
+
+def _me():
+    """Identity stored in the Socket.IO session by on_connect (None if missing)."""
+    return session.get("sgh")
+
+
+def _can_access(me: dict, gid_s: str) -> bool:
+    """
+    Authorize through the shared membership cache (an in-process lookup
+    while the group is cached), so removals and their invalidations apply
+    to open sockets right away.
+    """
+    gid = _oid(gid_s)
+    return bool(gid) and is_member(me["db"], gid, me["uid"])
 
 
 class ChatNamespace(Namespace):
@@ -83,20 +130,55 @@ class ChatNamespace(Namespace):
             print("[ws] meeting_notify error:", e)
 
     # ----------------------------- lifecycle ---------------------------------
-    def on_connect(self):
-        print("[ws] client connected to /ws/chat")
-        emit("connected", {"ok": True})
+    def on_connect(self, auth=None):
+        """
+        Authenticate once per connection. uid and the tenant DB handle live in
+        the Socket.IO session for later events; membership is checked against
+        the process-wide cache (membership.py) on every join and message.
+        """
+        token = _handshake_token(auth)
+        if not token:
+            raise ConnectionRefusedError("missing token")
+        try:
+            claims = decode_token(token)
+        except Exception as e:
+            print("[ws] connect rejected:", e)
+            raise ConnectionRefusedError("invalid token")
+
+        uid = _oid(str(claims.get("sub") or ""))
+        if not uid:
+            raise ConnectionRefusedError("invalid identity")
+
+        db = _tenant_db_from_claims(claims)
+        user = load_user(db, uid) or {}
+        session["sgh"] = {
+            "uid": uid,
+            "uidStr": str(uid),
+            "name": user.get("fullName") or user.get("name") or user.get("email") or "Member",
+            "email": user.get("email") or claims.get("email"),
+            "db": db,
+        }
+        presence.connect(request.sid)
+        print(f"[ws] client connected to /ws/chat (user {uid}, db {db.name})")
+        emit("connected", {"ok": True, "userId": str(uid)})
 
-    def on_disconnect(self):
-        # We don't fully clean GROUP_ONLINE here because we don't know which
-        # groups this socket had joined, but we at least log it.
+    def on_disconnect(self, reason=None):  # python-socketio >= 5.12 passes the reason
+        # presence tracks entries per sid, so every group/typing list this
+        # socket was in is cleaned up (and announced as a coalesced delta)
+        try:
+            presence.disconnect(request.sid)
+        except Exception as e:
+            print("[ws] presence cleanup error:", e)
         print("[ws] client disconnected from /ws/chat")
 
     # --------------------------- user rooms ----------------------------------
     def on_join_user(self, data):
-        uid = (data or {}).get("userId")
-        if not uid:
-            return {"ok": False, "error": "missing userId"}
+        me = _me()
+        if not me:
+            return {"ok": False, "error": "unauthorized"}
+        uid = (data or {}).get("userId") or me["uidStr"]
+        if str(uid) != me["uidStr"]:
+            return {"ok": False, "error": "forbidden"}
         room = f"user:{str(uid)}"
         join_room(room)
         print(f"[ws] joined user room {room}")
@@ -115,14 +197,31 @@ class ChatNamespace(Namespace):
 
     # --------------------------- group rooms ---------------------------------
     def on_join_group(self, data):
+        """
+        data: { groupId, lastSeq? | lastSeenId? }
+
+        On reconnect, pass the newest seq (or message id) already shown: the
+        ack then carries the messages sent since ({missed, lastSeq}), or
+        {refetch: true} if that is more than CHAT_GAP_FILL_MAX.
+        """
+        me = _me()
+        if not me:
+            return {"ok": False, "error": "unauthorized"}
         gid = (data or {}).get("groupId")
         if not gid:
             return {"ok": False, "error": "missing groupId"}
+        if not _can_access(me, str(gid)):
+            return {"ok": False, "error": "not a member"}
         room = f"group:{str(gid)}"
         join_room(room)
         print(f"[ws] joined group room {room}")
         emit("system", {"msg": f"joined {room}"})
-        return {"ok": True, "room": room}
+        # later typing changes arrive as presence_delta; start from a snapshot
+        emit("group_typing", {"groupId": str(gid), "users": presence.typing(str(gid))})
+        # joined first, then read: a message sent in between shows up twice
+        # (clients dedupe by id) rather than not at all
+        gap = _gap_fill(me["db"], _oid(str(gid)), data or {})
+        return {"ok": True, "room": room, **gap}
 
     def on_leave_group(self, data):
         gid = (data or {}).get("groupId")
@@ -137,45 +236,26 @@ class ChatNamespace(Namespace):
     # ----------------------- REAL-TIME PRESENCE ------------------------------
     def on_presence_join(self, data):
         """
-        data: {
-          "groupId": "<gid>",
-          "user": { "id": "...", "name": "...", "email": "..." }
-        }
+        data: { "groupId": "<gid>" }  (identity comes from the socket session)
         """
         try:
-            data = data or {}
-            gid_s = str(data.get("groupId") or "").strip()
-            user = data.get("user") or {}
-            uid_s = str(user.get("id") or user.get("_id") or "").strip()
-
-            if not gid_s or not uid_s:
-                return {"ok": False, "error": "missing groupId or user.id"}
+            me = _me()
+            if not me:
+                return {"ok": False, "error": "unauthorized"}
+            gid_s = str((data or {}).get("groupId") or "").strip()
+            if not gid_s:
+                return {"ok": False, "error": "missing groupId"}
+            if not _can_access(me, gid_s):
+                return {"ok": False, "error": "not a member"}
 
             room = f"group:{gid_s}"
             join_room(room)
 
-            now = datetime.utcnow().isoformat() + "Z"
-
-            if gid_s not in GROUP_ONLINE:
-                GROUP_ONLINE[gid_s] = {}
-
-            GROUP_ONLINE[gid_s][uid_s] = {
-                "_id": uid_s,
-                "name": user.get("name"),
-                "email": user.get("email"),
-                "lastSeen": now,
-            }
-
-            online_list = list(GROUP_ONLINE[gid_s].values())
-
-            emit(
-                "presence_update",
-                {"groupId": gid_s, "online": online_list},
-                room=room,
-            )
-            print(
-                f"[ws] presence_join {uid_s} in {room}, now {len(online_list)} online"
-            )
+            presence.join(gid_s, me["uidStr"], request.sid, name=me["name"], email=me["email"])
+            # full list only to the joining socket; the room gets a coalesced delta
+            online_list = presence.online(gid_s)
+            emit("presence_update", {"groupId": gid_s, "online": online_list})
+            print(f"[ws] presence_join {me['uidStr']} in {room}, now {len(online_list)} online")
             return {"ok": True, "onlineCount": len(online_list)}
         except Exception as e:
             print("[ws] presence_join error:", e)
@@ -183,32 +263,21 @@ class ChatNamespace(Namespace):
 
     def on_presence_leave(self, data):
         """
-        data: { "groupId": "<gid>", "userId": "<uid>" }
+        data: { "groupId": "<gid>" }
         """
         try:
-            data = data or {}
-            gid_s = str(data.get("groupId") or "").strip()
-            uid_s = str(data.get("userId") or "").strip()
-            if not gid_s or not uid_s:
-                return {"ok": False, "error": "missing groupId or userId"}
+            me = _me()
+            if not me:
+                return {"ok": False, "error": "unauthorized"}
+            gid_s = str((data or {}).get("groupId") or "").strip()
+            if not gid_s:
+                return {"ok": False, "error": "missing groupId"}
 
             room = f"group:{gid_s}"
             leave_room(room)
-
-            if gid_s in GROUP_ONLINE and uid_s in GROUP_ONLINE[gid_s]:
-                GROUP_ONLINE[gid_s].pop(uid_s, None)
-
-            online_list = list(GROUP_ONLINE.get(gid_s, {}).values())
-
-            emit(
-                "presence_update",
-                {"groupId": gid_s, "online": online_list},
-                room=room,
-            )
-            print(
-                f"[ws] presence_leave {uid_s} from {room}, now {len(online_list)} online"
-            )
-            return {"ok": True, "onlineCount": len(online_list)}
+            presence.leave(gid_s, me["uidStr"], request.sid)
+            print(f"[ws] presence_leave {me['uidStr']} from {room}")
+            return {"ok": True}
         except Exception as e:
             print("[ws] presence_leave error:", e)
             return {"ok": False, "error": str(e)}
@@ -217,52 +286,43 @@ class ChatNamespace(Namespace):
     def on_group_message(self, data):
         """
         Expected payload from client:
-          {
-            "groupId": "<string>",
-            "text": "<string>",
-            "user": {"id": "...", "name": "...", "email": "..."}  # sender identity
-          }
+          { "groupId": "<string>", "text": "<string>" }
+
+        Sender identity comes from the authenticated session (any client
+        supplied "user" is ignored). Path: validate -> insert -> emit.
         """
         try:
+            me = _me()
+            if not me:
+                return {"ok": False, "error": "unauthorized"}
             data = data or {}
-            gid_s = data.get("groupId")
+            gid_s = str(data.get("groupId") or "").strip()
             text = (data.get("text") or "").strip()
-            user = data.get("user") or {}
-            uid_s = user.get("id") or user.get("_id")
-            email = (user.get("email") or "").strip().lower()
 
-            if not gid_s or not text or not uid_s:
+            if not gid_s or not text:
                 return {"ok": False, "error": "missing fields"}
 
-            db = _tenant_db_from_email_or_default(email)
-            _ensure_chat_indexes(db)
-
             gid = _oid(gid_s)
-            uid = _oid(uid_s)
-            if not gid or not uid:
+            if not gid:
                 return {"ok": False, "error": "invalid ids"}
 
-            if not _is_member(db, gid, uid):
+            if not _can_access(me, gid_s):
                 return {"ok": False, "error": "not a member"}
 
+            db = me["db"]
+            uid = me["uid"]
             doc = {
                 "groupId": gid,
                 "userId": uid,
-                "user": {
-                    "_id": uid,
-                    "name": user.get("name"),
-                    "email": email or user.get("email"),
-                },
+                "user": {"_id": uid, "name": me["name"], "email": me["email"]},
                 "text": text,
                 "createdAt": datetime.utcnow(),
             }
-            ins = db.group_messages.insert_one(doc)
-            saved = db.group_messages.find_one({"_id": ins.inserted_id})
-            payload = _serialize_msg(saved)
+            msg_id = insert_message(db, doc)
+            payload = _serialize_msg({**doc, "_id": msg_id})
 
             room = f"group:{gid_s}"
             emit("group_message", payload, to=room)
-            print(f"[ws] group_message -> {room}: {payload}")
             return {"ok": True, "id": payload["id"]}
         except Exception as e:
             print("[ws] group_message error:", e)
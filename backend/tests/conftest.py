@@ -0,0 +1,24 @@
+# backend/tests/conftest.py
+"""
+Shared test setup: backend/ on sys.path and a throwaway mongomock database.
+
+    cd backend && pip install -r tests/requirements.txt && python -m pytest -q tests
+"""
+from __future__ import annotations
+
+import os
+import sys
+import uuid
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+
+@pytest.fixture
+def db():
+    """A fresh in-memory DB (mongomock: no $text, no server needed)."""
+    mongomock = pytest.importorskip("mongomock")
+    return mongomock.MongoClient()[f"sgh_test_{uuid.uuid4().hex[:8]}"]
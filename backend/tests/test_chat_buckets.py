@@ -0,0 +1,251 @@
+# backend/tests/test_chat_buckets.py
+"""
+Seq paging over chat_buckets (chat_buckets.py) and chat_archive runs
+(chat_archive.py): the early exit in _collect, sibling buckets whose seq
+ranges overlap, duplicates left by a retried push, and resuming a
+migration from counters.migratedSeq.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import chat_archive
+import chat_buckets
+from chat_buckets import INF
+
+T0 = datetime(2026, 3, 2, 9, 0)
+
+
+def _msg(seq: int, gid, at=None) -> dict:
+    return {"_id": ObjectId(), "groupId": gid, "seq": seq, "text": f"m{seq}",
+            "createdAt": at or T0 + timedelta(minutes=seq)}
+
+
+def _seqs(rows):
+    return [r["seq"] for r in rows]
+
+
+def _bucket(gid, msgs):
+    seqs = [m["seq"] for m in msgs]
+    ats = [m["createdAt"] for m in msgs]
+    return {"groupId": gid, "hour": chat_buckets._hour(ats[0]), "count": len(msgs),
+            "firstSeq": min(seqs), "lastSeq": max(seqs), "firstAt": min(ats), "lastAt": max(ats),
+            "messages": [{k: v for k, v in m.items() if k != "groupId"} for m in msgs]}
+
+
+@pytest.fixture
+def small_buckets(monkeypatch):
+    monkeypatch.setattr(chat_buckets, "CHAT_BUCKET_MAX", 4)
+
+
+@pytest.fixture(autouse=True)
+def _archive_cache():
+    chat_archive._cache.clear()
+    yield
+    chat_archive._cache.clear()
+
+
+# ------------------------------- paging ---------------------------------------
+def test_append_fills_buckets_and_opens_siblings(db, small_buckets):
+    gid = ObjectId()
+    chat_buckets.append(db, [_msg(s, gid, T0 + timedelta(seconds=s)) for s in range(1, 11)])
+    buckets = list(db.chat_buckets.find({"groupId": gid}).sort("firstSeq", 1))
+    assert [b["count"] for b in buckets] == [4, 4, 2]
+    assert [(b["firstSeq"], b["lastSeq"]) for b in buckets] == [(1, 4), (5, 8), (9, 10)]
+    assert all(b["hour"] == T0 for b in buckets)
+
+
+def test_pages_walk_the_whole_history_both_ways(db, small_buckets):
+    gid = ObjectId()
+    chat_buckets.append(db, [_msg(s, gid) for s in range(1, 26)])
+
+    seen, pivot, more = [], INF, True
+    while more:
+        rows, more = chat_buckets.page(db, gid, pivot, "before", 6)
+        assert _seqs(rows) == sorted(_seqs(rows))
+        seen = _seqs(rows) + seen
+        pivot = rows[0]["seq"]
+    assert seen == list(range(1, 26))
+
+    seen, pivot, more = [], 0, True
+    while more:
+        rows, more = chat_buckets.page(db, gid, pivot, "after", 6)
+        seen += _seqs(rows)
+        pivot = rows[-1]["seq"]
+    assert seen == list(range(1, 26))
+
+
+@pytest.mark.parametrize("limit", [1, 3, 4, 5, 8])
+def test_page_boundaries_match_a_plain_slice(db, small_buckets, limit):
+    gid = ObjectId()
+    chat_buckets.append(db, [_msg(s, gid) for s in range(1, 18)])
+    for pivot in (INF, 17, 13, 9, 5, 2, 1):
+        rows, more = chat_buckets.page(db, gid, pivot, "before", limit)
+        older = [s for s in range(1, 18) if s < pivot]
+        assert _seqs(rows) == older[-limit:]
+        assert more == (len(older) > limit)
+    for pivot in (0, 1, 4, 8, 12, 16, 17):
+        rows, more = chat_buckets.page(db, gid, pivot, "after", limit)
+        newer = [s for s in range(1, 18) if s > pivot]
+        assert _seqs(rows) == newer[:limit]
+        assert more == (len(newer) > limit)
+
+
+def test_collect_stops_once_no_bucket_can_be_nearer(small_buckets):
+    gid = ObjectId()
+    buckets = [_bucket(gid, [_msg(s, gid) for s in range(lo, lo + 4)]) for lo in (13, 9, 5, 1)]
+    opened = []
+
+    def cur():
+        for b in buckets:  # newest first, like the lastSeq DESC cursor
+            opened.append(b["firstSeq"])
+            yield b
+
+    rows = chat_buckets._collect(cur(), lambda s: True, 3, "lastSeq", newest_first=True)
+    assert _seqs(rows) == [16, 15, 14]
+    assert opened == [13, 9]  # looked at the next bucket's edge, never past it
+
+
+def test_collect_keeps_going_while_the_edge_ties(small_buckets):
+    """A bucket whose edge equals the worst kept seq may still hold it (duplicate retry)."""
+    gid = ObjectId()
+    a = [_msg(s, gid) for s in (10, 11, 12)]
+    buckets = [_bucket(gid, a), _bucket(gid, [a[0]])]  # same message pushed twice
+    rows = chat_buckets._collect(iter(buckets), lambda s: True, 3, "lastSeq", newest_first=True)
+    assert _seqs(rows) == [12, 11, 10]
+
+
+def test_overlapping_sibling_buckets(db, small_buckets):
+    """Two flushes of the same hour interleave seqs across siblings."""
+    gid = ObjectId()
+    msgs = {s: _msg(s, gid, T0 + timedelta(seconds=s)) for s in range(1, 9)}
+    db.chat_buckets.insert_many([
+        _bucket(gid, [msgs[s] for s in (1, 2, 5, 7)]),
+        _bucket(gid, [msgs[s] for s in (3, 4, 6, 8)]),
+    ])
+    rows, more = chat_buckets.page(db, gid, INF, "before", 3)
+    assert (_seqs(rows), more) == ([6, 7, 8], True)
+    rows, more = chat_buckets.page(db, gid, 6, "before", 3)
+    assert (_seqs(rows), more) == ([3, 4, 5], True)
+    rows, more = chat_buckets.page(db, gid, 0, "after", 5)
+    assert (_seqs(rows), more) == ([1, 2, 3, 4, 5], True)
+    rows, more = chat_buckets.page(db, gid, 5, "after", 5)
+    assert (_seqs(rows), more) == ([6, 7, 8], False)
+
+
+def test_retried_push_is_read_once(db, small_buckets):
+    gid = ObjectId()
+    docs = [_msg(s, gid) for s in range(1, 4)]
+    chat_buckets.append(db, docs)
+    chat_buckets.append(db, docs[1:])  # write-behind retry after a lost ack
+    rows, more = chat_buckets.page(db, gid, INF, "before", 10)
+    assert (_seqs(rows), more) == ([1, 2, 3], False)
+    rows, more = chat_buckets.page(db, gid, 0, "after", 2)
+    assert (_seqs(rows), more) == ([1, 2], True)
+
+
+def test_seq_lookups(db, small_buckets):
+    gid = ObjectId()
+    docs = [_msg(s, gid) for s in range(1, 10)]
+    chat_buckets.append(db, docs)
+    assert chat_buckets.seq_of(db, gid, docs[6]["_id"]) == 7
+    assert chat_buckets.seq_of(db, gid, ObjectId()) is None
+    assert chat_buckets.seq_at(db, gid, docs[4]["createdAt"]) == 5
+    assert chat_buckets.ts_pivot(db, gid, docs[4]["createdAt"]) == 4.5
+    assert chat_buckets.exists(db, gid, 1, "before") is False
+    assert chat_buckets.exists(db, gid, 8, "after") is True
+
+
+# ------------------------------ migration -------------------------------------
+def _legacy(db, gid, n: int):
+    """n group_messages written before seq existed (numbered on first use)."""
+    docs = [{"_id": ObjectId(), "groupId": gid, "text": f"m{i}", "createdAt": T0 + timedelta(minutes=i)}
+            for i in range(1, n + 1)]
+    db.group_messages.insert_many(docs)
+    return docs
+
+
+def _all(db, gid):
+    rows, more = chat_buckets.page(db, gid, INF, "before", 1000)
+    assert not more
+    return _seqs(rows)
+
+
+def test_migrate_numbers_legacy_messages_and_moves_them(db, small_buckets):
+    gid = ObjectId()
+    _legacy(db, gid, 10)
+    assert chat_buckets.migrate_group(db, gid, batch=3) == 10
+    assert _all(db, gid) == list(range(1, 11))
+    assert db.counters.find_one({"_id": f"chat:{gid}"})["migratedSeq"] == 10
+    assert chat_buckets.migrate_group(db, gid, batch=3) == 0  # nothing new
+
+
+def test_migrate_resumes_after_an_interruption(db, small_buckets, monkeypatch):
+    gid = ObjectId()
+    _legacy(db, gid, 10)
+    real_append, calls = chat_buckets.append, []
+
+    def failing_append(db_, docs):
+        calls.append(len(docs))
+        if len(calls) == 3:
+            raise RuntimeError("connection lost")
+        real_append(db_, docs)
+
+    monkeypatch.setattr(chat_buckets, "append", failing_append)
+    with pytest.raises(RuntimeError):
+        chat_buckets.migrate_group(db, gid, batch=3)
+    assert db.counters.find_one({"_id": f"chat:{gid}"})["migratedSeq"] == 6
+
+    monkeypatch.setattr(chat_buckets, "append", real_append)
+    assert chat_buckets.migrate_group(db, gid, batch=3) == 4
+    assert _all(db, gid) == list(range(1, 11))
+
+
+def test_migrate_rerun_after_crash_before_marker_reads_each_message_once(db, small_buckets):
+    gid = ObjectId()
+    _legacy(db, gid, 5)
+    chat_buckets.migrate_group(db, gid, batch=5)
+    # messages written while the app still stored them in group_messages
+    db.group_messages.insert_many([_msg(s, gid) for s in (6, 7, 8)])
+    db.counters.update_one({"_id": f"chat:{gid}"}, {"$set": {"seq": 8}})
+    # the batch reached the buckets but the process died before migratedSeq moved
+    chat_buckets.append(db, list(db.group_messages.find({"groupId": gid, "seq": {"$gt": 5}})))
+    assert chat_buckets.migrate_group(db, gid, batch=5, delete=True) == 3
+    assert _all(db, gid) == list(range(1, 9))
+    assert db.group_messages.count_documents({"groupId": gid, "seq": {"$gt": 5}}) == 0
+
+
+# ------------------------------- archive --------------------------------------
+def test_archive_pages_across_runs(db):
+    gid = ObjectId()
+    msgs = [_msg(s, gid) for s in range(1, 23)]
+    for lo in range(0, 22, 5):
+        chat_archive.store(db, gid, msgs[lo:lo + 5])
+
+    seen, pivot, more = [], INF, True
+    while more:
+        rows, more = chat_archive.page(db, gid, pivot, "before", 4)
+        seen = _seqs(rows) + seen
+        pivot = rows[0]["seq"]
+    assert seen == list(range(1, 23))
+
+    rows, more = chat_archive.page(db, gid, 9, "after", 4)
+    assert (_seqs(rows), more) == ([10, 11, 12, 13], True)
+    rows, more = chat_archive.page(db, gid, 20, "after", 4)
+    assert (_seqs(rows), more) == ([21, 22], False)
+    assert all(r["groupId"] == gid for r in rows)
+
+
+def test_archive_rerun_overwrites_its_run(db):
+    gid = ObjectId()
+    now = datetime.utcnow()  # find() locates runs by the ObjectId's time
+    msgs = [_msg(s, gid, now + timedelta(microseconds=s)) for s in range(1, 6)]
+    chat_archive.store(db, gid, msgs)
+    chat_archive.store(db, gid, msgs)  # batch retried after the hot delete failed
+    assert db.chat_archive.count_documents({"groupId": gid}) == 1
+    rows, more = chat_archive.page(db, gid, INF, "before", 10)
+    assert (_seqs(rows), more) == ([1, 2, 3, 4, 5], False)
+    assert chat_archive.seq_of(db, gid, msgs[2]["_id"]) == 3
@@ -0,0 +1,159 @@
+# backend/tests/test_fanout.py
+"""
+Cross-process fan-out (fanout.py, SOCKETIO_FANOUT=mongo): two separate app
+processes share one mongod; a `group_message` sent by a client of the first
+must reach a client of the second.
+
+Needs a running mongod (FANOUT_TEST_MONGO_URI, default
+mongodb://127.0.0.1:27017); skipped when there is none.
+
+    cd backend && python -m pytest -q tests/test_fanout.py
+"""
+from __future__ import annotations
+
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import pytest
+
+pymongo = pytest.importorskip("pymongo")
+socketio = pytest.importorskip("socketio")
+pytest.importorskip("websocket")  # websocket transport of the socketio client
+
+from bson import ObjectId
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MONGO_URI = os.getenv("FANOUT_TEST_MONGO_URI", "mongodb://127.0.0.1:27017")
+JWT_SECRET = "fanout-test-secret"
+NAMESPACE = "/ws/chat"
+
+
+@pytest.fixture(scope="module")
+def mongo():
+    cli = pymongo.MongoClient(MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        cli.admin.command("ping")
+    except Exception as e:
+        pytest.skip(f"no mongod at {MONGO_URI}: {e}")
+    name = f"sgh_fanout_test_{uuid.uuid4().hex[:8]}"
+    yield cli, name
+    cli.drop_database(name)
+    cli.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port: int, proc, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"app process exited with {proc.returncode}:\n{proc.stdout.read()}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"app on port {port} did not come up")
+
+
+def _start_app(db_name: str, port: int):
+    env = dict(
+        os.environ,
+        MONGO_URI=f"{MONGO_URI.rstrip('/')}/{db_name}",
+        JWT_SECRET_KEY=JWT_SECRET,
+        SOCKETIO_FANOUT="mongo",
+        BACKGROUND_WORKERS="false",
+        PYTHONUNBUFFERED="1",
+    )
+    env.pop("SOCKETIO_FANOUT_URL", None)
+    return subprocess.Popen(
+        [sys.executable, "serve.py", "--mode", "threading", "--workers", "1",
+         "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+
+
+def _token(uid: ObjectId) -> str:
+    from flask import Flask
+    from flask_jwt_extended import JWTManager, create_access_token
+
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = JWT_SECRET
+    JWTManager(app)
+    with app.app_context():
+        return create_access_token(identity=str(uid))
+
+
+def _client(port: int, token: str):
+    sio = socketio.Client(reconnection=False)
+    sio.connect(f"http://127.0.0.1:{port}", namespaces=[NAMESPACE], transports=["websocket"],
+                auth={"token": token}, wait_timeout=10)
+    return sio
+
+
+@pytest.fixture(scope="module")
+def apps(mongo):
+    cli, db_name = mongo
+    ports = [_free_port(), _free_port()]
+    procs = [_start_app(db_name, p) for p in ports]
+    try:
+        for port, proc in zip(ports, procs):
+            _wait_for_port(port, proc)
+        yield cli[db_name], ports
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def test_group_message_reaches_client_on_other_process(apps):
+    db, (port_a, port_b) = apps
+    alice, bob, gid = ObjectId(), ObjectId(), ObjectId()
+    db.users.insert_many([
+        {"_id": alice, "email": "alice@example.com", "fullName": "Alice"},
+        {"_id": bob, "email": "bob@example.com", "fullName": "Bob"},
+    ])
+    db.study_groups.insert_one({
+        "_id": gid, "name": "fanout", "ownerId": alice,
+        "members": [{"_id": alice}, {"_id": bob}], "createdAt": datetime.utcnow(),
+    })
+
+    received = []
+    arrived = threading.Event()
+    sender = _client(port_a, _token(alice))
+    listener = _client(port_b, _token(bob))
+    try:
+        @listener.on("group_message", namespace=NAMESPACE)
+        def _on_message(payload):
+            received.append(payload)
+            arrived.set()
+
+        for sio in (sender, listener):
+            ack = sio.call("join_group", {"groupId": str(gid)}, namespace=NAMESPACE, timeout=10)
+            assert ack and ack.get("ok"), ack
+        time.sleep(0.5)  # let the other process's tailing cursor settle
+
+        ack = sender.call("group_message", {"groupId": str(gid), "text": "across processes"},
+                          namespace=NAMESPACE, timeout=10)
+        assert ack and ack.get("ok"), ack
+
+        assert arrived.wait(15), "group_message did not reach the client on the other process"
+        assert received[0]["text"] == "across processes"
+        assert received[0]["id"] == ack["id"]
+    finally:
+        sender.disconnect()
+        listener.disconnect()
@@ -0,0 +1,147 @@
+# backend/tests/test_file_serving.py
+"""
+Conditional and ranged responses for stored uploads (file_serving.py),
+streamed by Werkzeug and offloaded to the web server.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+
+import pytest
+from flask import Flask
+
+import file_serving
+
+BODY = bytes(range(256)) * 40  # 10240 bytes
+SHA = hashlib.sha256(BODY).hexdigest()
+ETAG = f'"{SHA}-{len(BODY)}"'
+
+
+@pytest.fixture
+def upload_dir(tmp_path):
+    os.makedirs(tmp_path / "group" / "g1")
+    (tmp_path / "group" / "g1" / "notes v2.pdf").write_bytes(BODY)
+    (tmp_path / "old.bin").write_bytes(BODY)
+    return tmp_path
+
+
+@pytest.fixture
+def client(upload_dir):
+    app = Flask(__name__)
+
+    @app.get("/hashed")
+    def hashed():
+        return file_serving.send_stored(str(upload_dir / "group" / "g1" / "notes v2.pdf"), str(upload_dir),
+                                        "application/pdf", download_name="notes v2.pdf", sha256=SHA)
+
+    @app.get("/legacy")
+    def legacy():
+        return file_serving.send_stored(str(upload_dir / "old.bin"), str(upload_dir),
+                                        "application/octet-stream", as_attachment=True,
+                                        download_name="old.bin")
+
+    return app.test_client()
+
+
+@pytest.fixture
+def offload(monkeypatch):
+    def use(mode):
+        monkeypatch.setattr(file_serving, "FILE_OFFLOAD", mode)
+    return use
+
+
+# ------------------------------- streamed -------------------------------------
+def test_full_response_is_cacheable(client):
+    rv = client.get("/hashed")
+    assert rv.status_code == 200
+    assert rv.data == BODY
+    assert rv.headers["ETag"] == ETAG
+    assert rv.headers["Accept-Ranges"] == "bytes"
+    assert "Last-Modified" in rv.headers and "Expires" not in rv.headers
+    cc = rv.cache_control
+    assert cc.private and not cc.public and not cc.no_cache
+    assert cc.max_age == file_serving.FILE_CACHE_SECONDS and cc.immutable
+
+
+def test_legacy_file_gets_a_werkzeug_tag_and_is_not_immutable(client):
+    rv = client.get("/legacy")
+    assert rv.status_code == 200
+    assert rv.headers["ETag"] not in ("", ETAG)
+    assert not rv.cache_control.immutable
+    assert rv.headers["Content-Disposition"].startswith("attachment")
+
+
+def test_if_none_match_gives_304(client):
+    rv = client.get("/hashed", headers={"If-None-Match": ETAG})
+    assert rv.status_code == 304 and rv.data == b""
+    assert rv.headers["ETag"] == ETAG
+    assert client.get("/hashed", headers={"If-None-Match": '"other"'}).status_code == 200
+
+    tag = client.get("/legacy").headers["ETag"]
+    assert client.get("/legacy", headers={"If-None-Match": tag}).status_code == 304
+
+
+def test_if_modified_since_gives_304(client):
+    last = client.get("/legacy").headers["Last-Modified"]
+    rv = client.get("/legacy", headers={"If-Modified-Since": last})
+    assert rv.status_code == 304
+    rv = client.get("/legacy", headers={"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"})
+    assert rv.status_code == 200
+
+
+def test_range_gives_206(client):
+    rv = client.get("/hashed", headers={"Range": "bytes=100-199"})
+    assert rv.status_code == 206
+    assert rv.data == BODY[100:200]
+    assert rv.headers["Content-Range"] == f"bytes 100-199/{len(BODY)}"
+    assert rv.headers["ETag"] == ETAG
+
+    rv = client.get("/hashed", headers={"Range": "bytes=-16"})
+    assert rv.status_code == 206 and rv.data == BODY[-16:]
+
+
+def test_if_range_with_a_stale_tag_sends_the_whole_file(client):
+    rv = client.get("/hashed", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert rv.status_code == 200 and rv.data == BODY
+    rv = client.get("/hashed", headers={"Range": "bytes=0-9", "If-Range": ETAG})
+    assert rv.status_code == 206 and rv.data == BODY[:10]
+
+
+def test_unsatisfiable_range_gives_416(client):
+    rv = client.get("/hashed", headers={"Range": f"bytes={len(BODY) + 10}-"})
+    assert rv.status_code == 416
+    assert rv.headers["Content-Range"] == f"bytes */{len(BODY)}"
+
+
+# ------------------------------- offloaded ------------------------------------
+def test_x_accel_names_the_internal_location(client, offload):
+    offload("x-accel")
+    rv = client.get("/hashed")
+    assert rv.status_code == 200 and rv.data == b""
+    assert rv.headers["X-Accel-Redirect"] == "/protected-uploads/group/g1/notes%20v2.pdf"
+    assert rv.headers["ETag"] == ETAG
+    assert rv.headers["Content-Type"] == "application/pdf"
+    assert rv.cache_control.immutable and rv.cache_control.private
+
+
+def test_x_sendfile_names_the_absolute_path(client, offload, upload_dir):
+    offload("x-sendfile")
+    rv = client.get("/legacy")
+    assert rv.headers["X-Sendfile"] == os.path.abspath(upload_dir / "old.bin")
+    assert rv.headers["Content-Disposition"].startswith("attachment")
+    assert not rv.cache_control.immutable
+
+
+def test_offload_still_answers_304_itself(client, offload):
+    offload("x-accel")
+    before = dict(file_serving._counts)
+    rv = client.get("/hashed", headers={"If-None-Match": ETAG})
+    assert rv.status_code == 304
+    assert "X-Accel-Redirect" not in rv.headers
+
+    last = client.get("/legacy").headers["Last-Modified"]
+    rv = client.get("/legacy", headers={"If-Modified-Since": last})
+    assert rv.status_code == 304 and "X-Accel-Redirect" not in rv.headers
+    assert file_serving._counts["notModified"] - before["notModified"] == 2
+    assert file_serving._counts["offloaded"] - before["offloaded"] == 1
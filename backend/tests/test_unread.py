@@ -0,0 +1,117 @@
+# backend/tests/test_unread.py
+"""
+Unread counts from counters + read markers (chat_store.py):
+unread = lastSeq - lastReadSeq - own messages after lastReadSeq.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import chat_store
+
+ME, YOU = ObjectId(), ObjectId()
+T0 = datetime(2026, 3, 2, 9, 0)
+
+
+def _send(db, gid, uid) -> int:
+    doc = {"groupId": gid, "from": {"id": uid}, "text": "hi", "createdAt": datetime.utcnow()}
+    chat_store.insert_message(db, doc)
+    return doc["seq"]
+
+
+def _unread(db, uid, *gids):
+    counts = chat_store.unread_counts(db, uid, gids)
+    return [counts[str(g)] for g in gids]
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    """Buffer writes in a WriteBehind that only flushes when the test says so."""
+    w = chat_store.WriteBehind("async")
+    monkeypatch.setattr(w, "_ensure_thread", lambda: None)
+    monkeypatch.setattr(chat_store, "_writer", w)
+    return w
+
+
+def test_own_messages_are_never_unread(db):
+    gid = ObjectId()
+    for uid in (YOU, ME, YOU, ME, ME):
+        _send(db, gid, uid)
+    assert _unread(db, ME, gid) == [2]
+    assert _unread(db, YOU, gid) == [3]
+
+
+def test_messages_before_my_reply_stay_unread(db):
+    """Replying doesn't mark the earlier messages read (no lastReadSeq bump)."""
+    gid = ObjectId()
+    _send(db, gid, YOU)
+    _send(db, gid, YOU)
+    _send(db, gid, ME)
+    assert _unread(db, ME, gid) == [2]
+    assert db.group_reads.find_one({"userId": ME, "groupId": gid})["lastReadSeq"] == 0
+
+
+def test_mark_read_clears_and_prunes_own_seqs(db):
+    gid = ObjectId()
+    for uid in (YOU, ME, YOU):
+        _send(db, gid, uid)
+    chat_store.mark_read(db, ME, gid)
+    assert _unread(db, ME, gid) == [0]
+    assert db.group_reads.find_one({"userId": ME, "groupId": gid})["ownSeqs"] == []
+
+    mine = _send(db, gid, ME)
+    _send(db, gid, YOU)
+    assert _unread(db, ME, gid) == [1]
+    assert db.group_reads.find_one({"userId": ME, "groupId": gid})["ownSeqs"] == [mine]
+
+
+def test_mark_read_never_moves_backwards(db):
+    gid = ObjectId()
+    for _ in range(5):
+        _send(db, gid, YOU)
+    chat_store.mark_read(db, ME, gid, 4)
+    chat_store.mark_read(db, ME, gid, 2)  # a stale tab catching up
+    assert _unread(db, ME, gid) == [1]
+
+
+def test_counts_for_several_groups(db):
+    a, b, quiet = ObjectId(), ObjectId(), ObjectId()
+    for uid in (YOU, YOU, ME):
+        _send(db, a, uid)
+    _send(db, b, YOU)
+    chat_store.mark_read(db, ME, b)
+    assert _unread(db, ME, a, b, quiet) == [2, 0, 0]
+    assert chat_store.unread_counts(db, ME, []) == {}
+
+
+def test_legacy_last_read_at_is_migrated_to_a_seq(db):
+    gid = ObjectId()
+    db.group_messages.insert_many([
+        {"groupId": gid, "from": {"id": YOU}, "text": f"m{i}", "createdAt": T0 + timedelta(minutes=i)}
+        for i in range(1, 6)
+    ])
+    db.group_reads.insert_one({"userId": ME, "groupId": gid, "lastReadAt": T0 + timedelta(minutes=3)})
+    assert _unread(db, ME, gid) == [2]
+    assert db.group_reads.find_one({"userId": ME, "groupId": gid})["lastReadSeq"] == 3
+
+
+def test_write_behind_gives_the_same_counts_after_flush(db, writer):
+    gid = ObjectId()
+    for uid in (YOU, ME, YOU, ME):
+        _send(db, gid, uid)
+    chat_store.mark_read(db, YOU, gid, 1)
+    chat_store.mark_read(db, YOU, gid, 3)  # coalesced with the first
+    assert db.group_reads.count_documents({}) == 0
+    writer.flush()
+    assert _unread(db, ME, gid) == [2]
+    assert _unread(db, YOU, gid) == [1]
+    assert writer.counters["readsCoalesced"] == 1
+
+    chat_store.mark_read(db, ME, gid)
+    _send(db, gid, ME)
+    writer.flush()
+    assert _unread(db, ME, gid) == [0]
+    assert db.group_reads.find_one({"userId": ME, "groupId": gid})["ownSeqs"] == [5]
@@ -0,0 +1,301 @@
+# backend/upload_sessions.py
+"""
+Resumable, chunked uploads (routes in blueprints/uploads.py).
+
+    POST   /api/uploads                 {kind, groupId, filename, size, sha256?, ...}
+                                        → {uploadId, offset: 0, chunkSize}
+    PUT    /api/uploads/<id>            raw bytes, Upload-Offset: <n>   → {offset}
+    GET    /api/uploads/<id>            → {offset, size}  (where to resume)
+    POST   /api/uploads/<id>/finalize   → the resource / chat message
+    DELETE /api/uploads/<id>            abort
+
+Chunks are streamed from the request body straight into a staging file
+UPLOAD_DIR/.staging/<id>.part at their offset (bounded memory, no
+Werkzeug temp file). A chunk only counts once it has been written in full:
+`received` advances with a conditional update, so a connection dropped
+mid-chunk just means re-sending that chunk from the last acknowledged
+offset, and a chunk at any other offset gets 409 + the offset to resume
+from. Finalize hashes the staging file (SHA-256), checks it against the
+checksum the client declared (if any), moves it into the blob store
+(blob_store.py) and only then creates the resources / group_messages record.
+
+Sessions live in the tenant DB (`upload_sessions`) and expire after
+UPLOAD_SESSION_HOURS of inactivity (TTL index); staging files whose
+session is gone are swept by the retention job. A finalize that died
+mid-way (worker crash) leaves the session `finalizing`; once its
+`finalizingAt` is UPLOAD_FINALIZE_STALE_SECONDS old, the next finalize
+takes it over and an abort may delete it. `status` + `finalizingAt` of the
+claimed doc are a fencing token: complete / reopen / abort only act while
+the session is still in the state the caller read, and a finalize renews
+its claim right before it creates the record, so one that was taken over
+stops there instead of creating a second resource or chat message.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+
+from db import register_collection
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(1024 * 1024 * 1024)))  # 1 GiB
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_SESSION_HOURS = float(os.getenv("UPLOAD_SESSION_HOURS", "24"))
+UPLOAD_FINALIZE_STALE_SECONDS = int(os.getenv("UPLOAD_FINALIZE_STALE_SECONDS", "600"))
+
+STAGING_DIR = ".staging"
+KINDS = ("resource", "chat")
+
+_IO_BLOCK = 1024 * 1024
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+register_collection(
+    "upload_sessions",
+    [("userId", ASCENDING), ("createdAt", ASCENDING)],
+    ([("expiresAt", ASCENDING)], {"expireAfterSeconds": 0}),
+)
+
+
+class UploadError(Exception):
+    """A request the session cannot take; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = 400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def _expiry() -> datetime:
+    return datetime.utcnow() + timedelta(hours=UPLOAD_SESSION_HOURS)
+
+
+def staging_path(upload_dir: str, sid) -> str:
+    folder = os.path.join(upload_dir, STAGING_DIR)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{sid}.part")
+
+
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(_IO_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# ------------------------------- sessions -------------------------------------
+def create(db, user_id: str, kind: str, group_id: str, filename: str, size,
+           sha256: Optional[str] = None, mime: Optional[str] = None, meta: Optional[dict] = None) -> dict:
+    if kind not in KINDS:
+        raise UploadError("kind must be resource or chat")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("size must be an integer")
+    if size <= 0:
+        raise UploadError("size must be positive")
+    if size > UPLOAD_MAX_BYTES:
+        raise UploadError(f"file exceeds {UPLOAD_MAX_BYTES} bytes", status=413)
+    sha256 = (sha256 or "").strip().lower() or None
+    if sha256 and not _SHA256.match(sha256):
+        raise UploadError("sha256 must be 64 hex characters")
+    now = datetime.utcnow()
+    doc = {
+        "_id": ObjectId(),
+        "userId": str(user_id),
+        "kind": kind,
+        "groupId": str(group_id),
+        "filename": filename,
+        "size": size,
+        "sha256": sha256,
+        "mime": mime,
+        "meta": meta or {},
+        "received": 0,
+        "status": "open",
+        "createdAt": now,
+        "expiresAt": _expiry(),
+    }
+    db.upload_sessions.insert_one(doc)
+    return doc
+
+
+def get(db, sid, user_id: str) -> dict:
+    """The caller's session, or UploadError(404)."""
+    try:
+        oid = ObjectId(str(sid))
+    except Exception:
+        raise UploadError("upload not found", status=404)
+    doc = db.upload_sessions.find_one({"_id": oid, "userId": str(user_id)})
+    if not doc:
+        raise UploadError("upload not found", status=404)
+    return doc
+
+
+def write_chunk(db, session: dict, upload_dir: str, offset: int, stream, length: Optional[int]) -> int:
+    """
+    Copy one chunk from `stream` to the staging file at `offset`.
+    Returns the new acknowledged offset.
+    """
+    if session["status"] != "open":
+        raise UploadError("upload is already finalized", status=409, offset=session["received"])
+    if offset != session["received"]:
+        raise UploadError("offset mismatch", status=409, offset=session["received"])
+    if length is None:
+        raise UploadError("Content-Length required", status=411)
+    if length <= 0 or offset + length > session["size"]:
+        raise UploadError("chunk runs past the declared size", status=416, offset=session["received"])
+
+    path = staging_path(upload_dir, session["_id"])
+    written = 0
+    with open(path, "r+b" if os.path.exists(path) else "wb") as fh:
+        fh.seek(offset)
+        while written < length:
+            block = stream.read(min(_IO_BLOCK, length - written))
+            if not block:
+                break
+            fh.write(block)
+            written += len(block)
+    if written != length:
+        raise UploadError("chunk truncated", status=400, offset=session["received"])
+
+    res = db.upload_sessions.update_one(
+        {"_id": session["_id"], "status": "open", "received": offset},
+        {"$set": {"received": offset + written, "expiresAt": _expiry()}},
+    )
+    if not res.matched_count:
+        # another request acknowledged this range first; report where it is now
+        cur = db.upload_sessions.find_one({"_id": session["_id"]}, {"received": 1}) or {}
+        raise UploadError("offset mismatch", status=409, offset=cur.get("received", 0))
+    return offset + written
+
+
+def _stale_before() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=UPLOAD_FINALIZE_STALE_SECONDS)
+
+
+def is_stuck(session: dict) -> bool:
+    """A `finalizing` session whose finalize has not finished in time (crashed worker)."""
+    if session.get("status") != "finalizing":
+        return False
+    at = session.get("finalizingAt")
+    return at is None or at <= _stale_before()
+
+
+def claim(db, session: dict) -> dict:
+    """
+    Move a complete session to `finalizing` (once); returns the claimed doc.
+    A session stuck in `finalizing` (see is_stuck) is taken over.
+    """
+    if session["received"] != session["size"]:
+        raise UploadError("upload incomplete", status=409, offset=session["received"])
+    now = datetime.utcnow()
+    doc = db.upload_sessions.find_one_and_update(
+        {"_id": session["_id"], "received": session["size"], "$or": [
+            {"status": "open"},
+            {"status": "finalizing", "finalizingAt": {"$not": {"$gt": _stale_before()}}},  # crashed worker
+        ]},
+        {"$set": {"status": "finalizing", "finalizingAt": now, "expiresAt": _expiry()}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not doc:
+        raise UploadError("upload is being finalized", status=409)
+    return doc
+
+
+def verify(session: dict, upload_dir: str) -> str:
+    """SHA-256 of the staged bytes, checked against the declared one. Returns the hex digest."""
+    path = staging_path(upload_dir, session["_id"])
+    if not os.path.exists(path):
+        raise UploadError("staged file missing", status=410)
+    with open(path, "r+b") as fh:
+        fh.truncate(session["size"])  # drop bytes of a chunk that was cut off earlier
+    digest = sha256_file(path)
+    if session.get("sha256") and digest != session["sha256"]:
+        raise UploadError("checksum mismatch", status=422, sha256=digest)
+    return digest
+
+
+def stored(db, session: dict, digest: str) -> None:
+    """The staged file now lives in the blob store; a retried finalize skips verify()."""
+    db.upload_sessions.update_one({"_id": session["_id"]}, {"$set": {"sha256Verified": digest}})
+
+
+def _fence(session: dict) -> dict:
+    """Matches the session only while it is in the state the caller read (see claim)."""
+    q = {"_id": session["_id"], "status": session["status"]}
+    if session["status"] == "finalizing":
+        q["finalizingAt"] = session.get("finalizingAt")
+    return q
+
+
+def renew(db, session: dict) -> Optional[dict]:
+    """
+    Extend a finalize claim just before the record is created; None if it
+    was taken over meanwhile (the caller must stop). Returns the new claim.
+    """
+    return db.upload_sessions.find_one_and_update(
+        _fence(session),
+        {"$set": {"finalizingAt": datetime.utcnow(), "expiresAt": _expiry()}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def complete(db, session: dict, result: dict) -> bool:
+    """Remember the outcome so a retried finalize returns it instead of 409/404."""
+    return bool(db.upload_sessions.update_one(
+        _fence(session), {"$set": {"status": "done", "result": result, "expiresAt": _expiry()}}
+    ).matched_count)
+
+
+def reopen(db, session: dict) -> bool:
+    return bool(db.upload_sessions.update_one(
+        _fence(session), {"$set": {"status": "open", "finalizingAt": None}}
+    ).matched_count)
+
+
+def abort(db, session: dict, upload_dir: str) -> bool:
+    """Delete the session and its staged bytes; False if it changed hands meanwhile."""
+    if not db.upload_sessions.delete_one(_fence(session)).deleted_count:
+        return False
+    try:
+        os.remove(staging_path(upload_dir, session["_id"]))
+    except OSError:
+        pass
+    return True
+
+
+def status(session: dict) -> dict:
+    return {
+        "uploadId": str(session["_id"]),
+        "offset": session["received"],
+        "size": session["size"],
+        "status": session["status"],
+        "chunkSize": UPLOAD_CHUNK_BYTES,
+    }
+
+
+# -------------------------------- sweeping ------------------------------------
+def sweep_staging(upload_dir: str, max_age_hours: float = UPLOAD_SESSION_HOURS * 2) -> dict:
+    """Delete staging files untouched for max_age_hours (their session has expired)."""
+    out = {"files": 0, "bytes": 0}
+    folder = os.path.join(upload_dir or "", STAGING_DIR)
+    if not upload_dir or not os.path.isdir(folder):
+        return out
+    cutoff = time.time() - max_age_hours * 3600
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            st = os.stat(path)
+            if st.st_mtime < cutoff:
+                os.remove(path)
+                out["files"] += 1
+                out["bytes"] += st.st_size
+        except OSError:
+            pass
+    return out
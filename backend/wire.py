@@ -0,0 +1,238 @@
+# backend/wire.py
+"""
+Per-client MessagePack wire format for Socket.IO.
+
+The stock client (socket.io-client's default parser) keeps getting JSON text
+frames. A client that connects with a msgpack parser
+
+    import msgpackParser from "socket.io-msgpack-parser";
+    io(url, { parser: msgpackParser, ... })
+
+sends every Socket.IO packet as one binary frame; the first one (its CONNECT)
+marks the connection as msgpack and everything sent to it from then on is
+msgpack too. Nothing else to configure: both kinds of clients share the same
+rooms and handlers, and handlers still receive plain dicts.
+
+Hot /ws/chat events (HOT_EVENTS) are also sent to msgpack clients in a
+compact schema: dict keys are shortened through WIRE_KEYS at every level
+(unknown keys pass through) and None values are dropped. The client expands
+them back with the inverse table. Incoming packets are not compacted.
+
+Broadcasts are still encoded once: python-socketio's manager encodes the
+JSON packet once per emit and we transcode it to msgpack once per emit (not
+per socket) the first time a msgpack recipient shows up in the loop.
+
+WireServer overrides private python-socketio methods, so requirements.txt
+pins python-socketio / python-engineio to the versions this was written
+against, and install() checks the hooks (names, signatures, a packet round
+trip) at startup and stays on JSON if anything moved.
+"""
+from __future__ import annotations
+
+import inspect
+import threading
+from typing import Any, Dict, List, Optional
+
+import socketio
+from engineio import packet as eio_packet
+from socketio import packet as sio_packet
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional until a client asks for it
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+WIRE_NAMESPACE = "/ws/chat"
+HOT_EVENTS = frozenset({
+    "group_message", "presence_update", "presence_delta", "notify", "notify_batch", "meeting_updated",
+})
+
+# full key -> wire key; single letters so they cannot clash with real payload keys
+WIRE_KEYS: Dict[str, str] = {
+    "_id": "_", "id": "i", "groupId": "g", "userId": "u", "user": "U", "from": "f",
+    "name": "n", "email": "e", "text": "t", "kind": "k", "createdAt": "c", "at": "a",
+    "seq": "s", "file": "F", "url": "l", "mime": "m", "size": "z",
+    "online": "o", "joined": "j", "left": "x", "typing": "y", "stoppedTyping": "Y",
+    "lastSeen": "L", "type": "T", "message": "M",
+}
+
+
+def compact(value: Any) -> Any:
+    """Shorten keys (WIRE_KEYS) and drop None values, recursively."""
+    if isinstance(value, dict):
+        return {WIRE_KEYS.get(k, k): compact(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [compact(v) for v in value]
+    return value
+
+
+def encode_msgpack(pkt: sio_packet.Packet) -> bytes:
+    """A Socket.IO packet as socket.io-msgpack-parser expects it."""
+    data = pkt.data
+    if (pkt.packet_type == sio_packet.EVENT and pkt.namespace == WIRE_NAMESPACE
+            and isinstance(data, list) and data and data[0] in HOT_EVENTS):
+        data = [data[0]] + [compact(arg) for arg in data[1:]]
+    out = {"type": pkt.packet_type, "data": data, "nsp": pkt.namespace or "/"}
+    if pkt.id is not None:
+        out["id"] = pkt.id
+    return msgpack.packb(out, default=str)
+
+
+class WirePacket(sio_packet.Packet):
+    """JSON packets as usual; binary frames that are not attachments are msgpack packets."""
+
+    def decode(self, encoded_packet):
+        if not isinstance(encoded_packet, (bytes, bytearray)):
+            return super().decode(encoded_packet)
+        decoded = msgpack.unpackb(encoded_packet)
+        self.packet_type = decoded["type"]
+        self.data = decoded.get("data")
+        self.id = decoded.get("id")
+        self.namespace = decoded.get("nsp") or "/"
+        self.attachment_count = 0
+        self.attachments = []
+        return 0
+
+
+class WireServer(socketio.Server):
+    """socketio.Server that remembers each connection's format and encodes for it."""
+
+    def _wire_init(self) -> None:
+        self.packet_class = WirePacket
+        self.wire_formats: Dict[str, str] = {}  # eio_sid -> MSGPACK (JSON is the default)
+        self._wire_last: tuple = (None, None)   # (JSON eio packet, its msgpack twin)
+        self._wire_lock = threading.Lock()
+        self.wire_counters = {"transcoded": 0, "jsonBytes": 0, "msgpackBytes": 0}
+
+    def wire_format(self, eio_sid: str) -> str:
+        return self.wire_formats.get(eio_sid, JSON)
+
+    # --- incoming ---
+    def _handle_eio_message(self, eio_sid, data):
+        if isinstance(data, (bytes, bytearray)) and eio_sid not in self._binary_packet:
+            # a JSON client's binary attachments are claimed above; this is a msgpack packet
+            self.wire_formats[eio_sid] = MSGPACK
+        return super()._handle_eio_message(eio_sid, data)
+
+    def _handle_eio_disconnect(self, eio_sid, *args):
+        try:
+            return super()._handle_eio_disconnect(eio_sid, *args)
+        finally:
+            self.wire_formats.pop(eio_sid, None)
+
+    # --- outgoing ---
+    def _send_packet(self, eio_sid, pkt):
+        if self.wire_formats.get(eio_sid) != MSGPACK:
+            return super()._send_packet(eio_sid, pkt)
+        self.eio.send(eio_sid, encode_msgpack(pkt))
+
+    def _transcode(self, eio_pkt) -> Optional[eio_packet.Packet]:
+        """msgpack twin of a JSON message packet, built once per broadcast."""
+        last_json, last_msgpack = self._wire_last
+        if last_json is eio_pkt:
+            return last_msgpack
+        pkt = sio_packet.Packet(encoded_packet=eio_pkt.data)
+        twin = None
+        if not pkt.attachment_count:  # binary events stay JSON (nothing here emits bytes)
+            body = encode_msgpack(pkt)
+            twin = eio_packet.Packet(eio_packet.MESSAGE, body)
+            with self._wire_lock:
+                c = self.wire_counters
+                c["transcoded"] += 1
+                c["jsonBytes"] += len(eio_pkt.data.encode("utf-8"))
+                c["msgpackBytes"] += len(body)
+        self._wire_last = (eio_pkt, twin)
+        return twin
+
+    def _send_eio_packet(self, eio_sid, eio_pkt):
+        if (self.wire_formats.get(eio_sid) == MSGPACK and eio_pkt.packet_type == eio_packet.MESSAGE
+                and isinstance(eio_pkt.data, str)):
+            eio_pkt = self._transcode(eio_pkt) or eio_pkt
+        return super()._send_eio_packet(eio_sid, eio_pkt)
+
+
+# python-socketio internals WireServer relies on: method -> its parameters
+_HOOKS = {
+    "_handle_eio_message": ["self", "eio_sid", "data"],
+    "_handle_eio_disconnect": ["self", "eio_sid"],  # (+ reason since 5.12)
+    "_send_packet": ["self", "eio_sid", "pkt"],
+    "_send_eio_packet": ["self", "eio_sid", "eio_pkt"],
+}
+
+_server: Optional[WireServer] = None
+
+
+def _version() -> str:
+    try:
+        from importlib.metadata import version
+        return version("python-socketio")
+    except Exception:
+        return "?"
+
+
+def self_check(server) -> List[str]:
+    """What is missing for WireServer in this python-socketio (empty list = fine)."""
+    problems = []
+    for name, params in _HOOKS.items():
+        fn = getattr(socketio.Server, name, None)
+        if not callable(fn):
+            problems.append(f"socketio.Server.{name} is gone")
+            continue
+        got = list(inspect.signature(fn).parameters)
+        if got[:len(params)] != params:
+            problems.append(f"socketio.Server.{name}{tuple(got)} != {tuple(params)}")
+    if not isinstance(getattr(server, "_binary_packet", None), dict):
+        problems.append("server._binary_packet is gone")
+    if not callable(getattr(getattr(server, "eio", None), "send", None)):
+        problems.append("server.eio.send is gone")
+    try:
+        pkt = sio_packet.Packet(sio_packet.EVENT, data=["group_message", {"text": "x"}],
+                                namespace=WIRE_NAMESPACE, id=1)
+        back = WirePacket(encoded_packet=encode_msgpack(pkt))
+        if (back.packet_type, back.namespace, back.id, back.data) != \
+                (sio_packet.EVENT, WIRE_NAMESPACE, 1, ["group_message", {"t": "x"}]):
+            problems.append("msgpack packet round trip differs")
+        json_pkt = sio_packet.Packet(encoded_packet=pkt.encode())
+        if json_pkt.data != pkt.data or json_pkt.attachment_count:
+            problems.append("JSON packet round trip differs")
+    except Exception as e:
+        problems.append(f"packet round trip failed: {e}")
+    return problems
+
+
+def install(sio) -> bool:
+    """
+    Enable per-client msgpack on a Flask-SocketIO instance or a socketio.Server
+    (Flask-SocketIO always builds a plain one, so its class is swapped in place).
+    """
+    global _server
+    if msgpack is None:
+        print("[wire] msgpack is not installed; JSON only")
+        return False
+    server = getattr(sio, "server", sio)
+    if type(server) is not socketio.Server:
+        print(f"[wire] unexpected server class {type(server).__name__}; JSON only")
+        return False
+    problems = self_check(server)
+    if problems:
+        print(f"[wire] python-socketio {_version()} does not match wire.py "
+              f"({'; '.join(problems)}); JSON only")
+        return False
+    server.__class__ = WireServer
+    server._wire_init()
+    _server = server
+    return True
+
+
+def wire_stats() -> dict:
+    if _server is None:
+        return {"enabled": False}
+    formats = list(_server.wire_formats.values())
+    with _server._wire_lock:
+        counters = dict(_server.wire_counters)
+    if counters["jsonBytes"]:
+        counters["msgpackRatio"] = round(counters["msgpackBytes"] / counters["jsonBytes"], 3)
+    return {"enabled": True, "msgpackClients": formats.count(MSGPACK), **counters}
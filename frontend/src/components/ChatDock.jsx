@@ -7,9 +7,11 @@ import {
   joinGroupRoom,
   leaveGroupRoom,
 } from "../lib/socket";
+import { uploadResumable } from "../lib/upload";
 
 const API_BASE = import.meta.env.VITE_API_URL || "http://localhost:5050";
 const ALLOWED_EXTS = ["pdf", "doc", "docx"];
+const PAGE_SIZE = 50; // chat history page (keyset-paginated on the server)
 
 /* ---------- helpers ---------- */
 const fmtTime = (iso) =>
@@ -29,6 +31,7 @@ const normalizeMessage = (m) => ({
   text: m.text || m.message || "",
   file: m.file || null,
   at: m.at || m.createdAt || new Date().toISOString(),
+  seq: Number(m.seq) || 0,
   from: m.from || m.user || m.sender || {},
   groupId: String(
     m.groupId ||
@@ -57,18 +60,6 @@ async function apiPost(path, body) {
   if (!res.ok) throw new Error(await res.text());
   return res.json();
 }
-async function apiUpload(path, file) {
-  const fd = new FormData();
-  fd.append("file", file);
-  const res = await fetch(`${API_BASE}${path}`, {
-    method: "POST",
-    headers: { Authorization: `Bearer ${localStorage.getItem("token") || ""}` },
-    body: fd,
-  });
-  if (!res.ok) throw new Error(await res.text());
-  return res.json();
-}
-
 /** Fetch any file with Authorization header and return an object URL */
 async function fetchBlobUrl(authUrl) {
   const res = await fetch(authUrl, {
@@ -85,6 +76,8 @@ export default function ChatDock({ gid, groupTitle, canChat, myId, me }) {
   const [messages, setMessages] = useState([]);
   const [loadedFor, setLoadedFor] = useState("");
   const [unread, setUnread] = useState(0);
+  const [hasOlder, setHasOlder] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const [uploading, setUploading] = useState(false);
 
   // preview modal state
@@ -96,6 +89,9 @@ export default function ChatDock({ gid, groupTitle, canChat, myId, me }) {
   const joinedRoomRef = useRef("");
   const listRef = useRef(null);
   const fileRef = useRef(null);
+  const oldestIdRef = useRef("");
+  const lastSeqRef = useRef(0); // newest seq shown; sent on reconnect to fetch only the gap
+  const keepScrollRef = useRef(null); // scrollHeight before prepending older messages
 
   const myName = useMemo(
     () => me?.name || me?.fullName || me?.email || "You",
@@ -107,6 +103,7 @@ export default function ChatDock({ gid, groupTitle, canChat, myId, me }) {
     if (m.id && seenIdsRef.current.has(m.id)) return;
     if (m.id) seenIdsRef.current.add(m.id);
     if (m.groupId && gid && String(m.groupId) !== String(gid)) return;
+    if (m.seq > lastSeqRef.current) lastSeqRef.current = m.seq;
 
     setMessages((prev) => [...prev, m]);
 
@@ -117,10 +114,16 @@ export default function ChatDock({ gid, groupTitle, canChat, myId, me }) {
     }
   };
 
-  // autoscroll
+  // autoscroll (but keep position when older messages were prepended)
   useEffect(() => {
     const el = listRef.current;
-    if (el) el.scrollTop = el.scrollHeight;
+    if (!el) return;
+    if (keepScrollRef.current != null) {
+      el.scrollTop = el.scrollHeight - keepScrollRef.current;
+      keepScrollRef.current = null;
+      return;
+    }
+    el.scrollTop = el.scrollHeight;
   }, [messages, open]);
 
   // join group room & listen
@@ -140,8 +143,23 @@ export default function ChatDock({ gid, groupTitle, canChat, myId, me }) {
       if (String(p.groupId || "") !== String(gid)) return;
       pushMsg(p, true);
     };
+    // rooms are lost with the old connection: rejoin and replay only the gap
+    const onReconnect = () => {
+      const lastSeq = lastSeqRef.current;
+      joinGroupRoom(gid, lastSeq ? { lastSeq } : {}, (ack) => {
+        if (ack?.refetch) {
+          setLoadedFor(""); // too far behind: reload history (now, or when opened)
+          return;
+        }
+        (ack?.missed || []).forEach((m) => pushMsg(m, true));
+      });
+    };
     notifySocket.on("group_message", onGroupMessage);
-    return () => notifySocket.off("group_message", onGroupMessage);
+    notifySocket.on("connect", onReconnect);
+    return () => {
+      notifySocket.off("group_message", onGroupMessage);
+      notifySocket.off("connect", onReconnect);
+    };
   }, [gid, canChat, myId, open]);
 
   // initial unread fetch (when closed)
@@ -160,8 +178,11 @@ export default function ChatDock({ gid, groupTitle, canChat, myId, me }) {
         if (loadedFor !== gid) {
           setMessages([]);
           seenIdsRef.current = new Set();
-          const rows = await apiGet(`/api/groups/${gid}/chat`);
-          rows.forEach((m) => pushMsg(m, false));
+          lastSeqRef.current = 0;
+          const page = await apiGet(`/api/groups/${gid}/chat?limit=${PAGE_SIZE}`);
+          (page.items || []).forEach((m) => pushMsg(m, false));
+          oldestIdRef.current = page.before || "";
+          setHasOlder(!!page.hasMoreBefore);
           setLoadedFor(gid);
         }
       } catch {}
@@ -170,6 +191,33 @@ export default function ChatDock({ gid, groupTitle, canChat, myId, me }) {
     })();
   }, [open, gid, canChat, loadedFor]);
 
+  // scroll-back: fetch the page before the oldest loaded message
+  const loadOlder = async () => {
+    if (!hasOlder || loadingOlder || !oldestIdRef.current) return;
+    setLoadingOlder(true);
+    try {
+      const page = await apiGet(
+        `/api/groups/${gid}/chat?before=${oldestIdRef.current}&limit=${PAGE_SIZE}`
+      );
+      const older = (page.items || [])
+        .map(normalizeMessage)
+        .filter((m) => !m.id || !seenIdsRef.current.has(m.id));
+      older.forEach((m) => m.id && seenIdsRef.current.add(m.id));
+      if (listRef.current) keepScrollRef.current = listRef.current.scrollHeight;
+      setMessages((prev) => [...older, ...prev]);
+      oldestIdRef.current = page.before || oldestIdRef.current;
+      setHasOlder(!!page.hasMoreBefore);
+    } catch {
+      toast.error("Could not load older messages");
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
+  const onListScroll = (e) => {
+    if (e.currentTarget.scrollTop < 40) loadOlder();
+  };
+
   const sendMsg = async (e) => {
     e?.preventDefault?.();
     const text = chatInput.trim();
@@ -197,7 +245,7 @@ export default function ChatDock({ gid, groupTitle, canChat, myId, me }) {
     if (!canChat) return toast.info("Join the group to chat.");
     try {
       setUploading(true);
-      await apiUpload(`/api/groups/${gid}/chat/upload`, f);
+      await uploadResumable({ kind: "chat", groupId: gid, file: f });
       // will arrive via socket
     } catch {
       toast.error("Upload failed");
@@ -268,7 +316,12 @@ export default function ChatDock({ gid, groupTitle, canChat, myId, me }) {
           </div>
 
           <div style={panelBody}>
-            <div ref={listRef} style={msgList}>
+            <div ref={listRef} style={msgList} onScroll={onListScroll}>
+              {loadingOlder && (
+                <div style={{ color: "#6b7280", fontSize: 12, textAlign: "center" }}>
+                  Loading earlier messages…
+                </div>
+              )}
               {messages.length === 0 ? (
                 <div style={{ color: "#6b7280", fontSize: 13, textAlign: "center", marginTop: 12 }}>
                   No messages yet. Say hi 👋
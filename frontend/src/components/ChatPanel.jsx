@@ -59,14 +59,35 @@ export default function ChatPanel({ gid, currentUser }) {
       setTypingUsers(withoutMe);
     };
 
+    // coalesced typing changes: { groupId, typing: [{userId, name}], stoppedTyping: [uid] }
+    const onDelta = (payload) => {
+      if (!payload || String(payload.groupId) !== String(gid)) return;
+      const started = (payload.typing || []).filter(
+        (u) => String(u.userId || "") && String(u.userId) !== myId
+      );
+      const stopped = new Set([
+        ...(payload.stoppedTyping || []).map(String),
+        ...(payload.left || []).map(String),
+      ]);
+      if (!started.length && !stopped.size) return;
+      setTypingUsers((prev) => {
+        const byId = new Map(prev.map((u) => [String(u.userId), u]));
+        stopped.forEach((id) => byId.delete(id));
+        started.forEach((u) => byId.set(String(u.userId), u));
+        return Array.from(byId.values());
+      });
+    };
+
     notifySocket.on("group_message", onMsg);
     notifySocket.on("system", onSystem);
     notifySocket.on("group_typing", onTyping);
+    notifySocket.on("presence_delta", onDelta);
 
     return () => {
       notifySocket.off("group_message", onMsg);
       notifySocket.off("system", onSystem);
       notifySocket.off("group_typing", onTyping);
+      notifySocket.off("presence_delta", onDelta);
     };
   }, [gid, myId]);
 
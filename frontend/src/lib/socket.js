@@ -220,6 +220,8 @@ if (!sock) {
   sock = io(`${API_BASE}${NS}`, {
     transports: ["websocket"],
     autoConnect: false,
+    // JWT is checked once at connect; read lazily so reconnects pick up a new login
+    auth: (cb) => cb({ token: localStorage.getItem("token") || "" }),
   });
   if (typeof window !== "undefined") window[SOCKET_KEY] = sock;
 }
@@ -265,7 +267,23 @@ if (typeof window !== "undefined" && !window[BOUND_KEY]) {
     } catch {}
   });
 
+  // Several user-room events queued within one server window arrive as one
+  // notify_batch {events: [{event, data}]}; replay them, in order, to the
+  // normal listeners ("notify", "meeting_updated", ...)
+  notifySocket.on("notify_batch", (batch) => {
+    for (const item of batch?.events || []) {
+      for (const fn of notifySocket.listeners(item.event)) {
+        try {
+          fn(item.data);
+        } catch (e) {
+          console.warn("[socket] notify_batch listener error:", e);
+        }
+      }
+    }
+  });
+
   // 🔴 Real-time group presence (who is online in a group)
+  // presence_update = full list (sent to us on presence_join)
   notifySocket.on("presence_update", (payload) => {
     try {
       console.log("[socket] presence_update:", payload);
@@ -275,6 +293,15 @@ if (typeof window !== "undefined" && !window[BOUND_KEY]) {
     } catch {}
   });
 
+  // presence_delta = coalesced changes {groupId, joined, left, typing, stoppedTyping}
+  notifySocket.on("presence_delta", (payload) => {
+    try {
+      window.dispatchEvent(
+        new CustomEvent("sgh:presence_delta", { detail: payload || {} })
+      );
+    } catch {}
+  });
+
   window[BOUND_KEY] = true;
 }
 
@@ -316,12 +343,15 @@ export function leaveUserRoom(userId) {
 /* -----------------------------------------------------------
    Group chat helpers (required by ChatDock/ChatPanel)
 ----------------------------------------------------------- */
-export function joinGroupRoom(gid) {
+// opts.lastSeq / opts.lastSeenId (on reconnect): the ACK carries what was
+// missed since ({missed, lastSeq}) or {refetch: true} if too far behind
+export function joinGroupRoom(gid, opts = {}, onAck) {
   if (!gid) return console.warn("[socket] joinGroupRoom: no gid");
   ensureConnected();
-  notifySocket.emit("join_group", { groupId: String(gid) }, (ack) =>
-    console.log("[socket] join_group ACK ←", ack)
-  );
+  notifySocket.emit("join_group", { ...opts, groupId: String(gid) }, (ack) => {
+    console.log("[socket] join_group ACK ←", ack);
+    onAck?.(ack);
+  });
 }
 
 export function leaveGroupRoom(gid) {
@@ -338,16 +368,8 @@ export function sendGroupMessage(gid, text) {
 
   ensureConnected();
 
-  const me = getMe();
-  const payload = {
-    groupId: String(gid),
-    text: msg,
-    user: {
-      id: String(me?._id ?? me?.id ?? me?.userId ?? ""),
-      name: me?.fullName || me?.name || me?.email || "Member",
-      email: me?.email,
-    },
-  };
+  // sender identity comes from the authenticated socket session
+  const payload = { groupId: String(gid), text: msg };
 
   notifySocket.emit("group_message", payload, (ack) => {
     if (ack?.ok === false) {
@@ -0,0 +1,99 @@
+// frontend/src/lib/upload.js
+// Resumable chunked uploads (backend: /api/uploads, see upload_sessions.py).
+// The upload id is remembered per file in localStorage, so a retry after a
+// dropped connection or a page reload continues from the last acknowledged
+// offset instead of starting over.
+
+const RAW_API = import.meta.env.VITE_API_URL || "http://localhost:5050";
+const API_BASE = String(RAW_API).replace(/\/$/, "");
+
+const HASH_MAX_BYTES = 64 * 1024 * 1024; // crypto.subtle hashes in memory: only small files
+const RETRIES = 5;
+
+const authHeaders = (extra = {}) => ({
+  Authorization: `Bearer ${localStorage.getItem("token") || ""}`,
+  ...extra,
+});
+
+const sessionKey = (kind, groupId, file) =>
+  `upload:${kind}:${groupId}:${file.name}:${file.size}:${file.lastModified}`;
+
+const sleep = (ms) => new Promise((r) => setTimeout(r, ms));
+
+async function sha256Hex(file) {
+  if (file.size > HASH_MAX_BYTES || !window.crypto?.subtle) return undefined;
+  const digest = await window.crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, "0")).join("");
+}
+
+async function call(method, path, { body, headers } = {}) {
+  const res = await fetch(`${API_BASE}/api/uploads${path}`, { method, headers: authHeaders(headers), body });
+  const data = await res.json().catch(() => ({}));
+  return { res, data };
+}
+
+async function openSession(kind, groupId, file, meta) {
+  const key = sessionKey(kind, groupId, file);
+  const saved = localStorage.getItem(key);
+  if (saved) {
+    const { res, data } = await call("GET", `/${saved}`);
+    if (res.ok && data.status !== "finalizing") return { key, ...data };
+    localStorage.removeItem(key);
+  }
+  const { res, data } = await call("POST", "", {
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({
+      kind,
+      groupId,
+      filename: file.name,
+      size: file.size,
+      mime: file.type || undefined,
+      sha256: await sha256Hex(file),
+      ...meta,
+    }),
+  });
+  if (!res.ok) throw new Error(data.error || "Upload failed");
+  localStorage.setItem(key, data.uploadId);
+  return { key, ...data };
+}
+
+/**
+ * Upload `file` as a group resource (kind "resource") or chat file (kind "chat").
+ * Resolves with what the one-shot endpoint returns (resource id / chat message).
+ */
+export async function uploadResumable({ kind, groupId, file, title, description, onProgress }) {
+  const session = await openSession(kind, groupId, file, { title, description });
+  const id = session.uploadId;
+  let offset = session.offset || 0;
+  let failures = 0;
+
+  while (session.status !== "done" && offset < file.size) {
+    const chunk = file.slice(offset, offset + session.chunkSize);
+    try {
+      const { res, data } = await call("PUT", `/${id}`, {
+        headers: { "Content-Type": "application/octet-stream", "Upload-Offset": String(offset) },
+        body: chunk,
+      });
+      if (res.ok || res.status === 409) {
+        if (typeof data.offset !== "number") throw new Error(data.error || "Upload failed");
+        offset = data.offset; // 409: the server already has more (or less); go from there
+        failures = 0;
+        onProgress?.(offset / file.size);
+        continue;
+      }
+      const err = new Error(data.error || `Upload failed (${res.status})`);
+      err.fatal = res.status < 500; // 4xx: retrying the same chunk won't help
+      throw err;
+    } catch (e) {
+      if (e.fatal) localStorage.removeItem(session.key);
+      if (e.fatal || ++failures > RETRIES) throw e;
+      await sleep(500 * 2 ** failures);
+    }
+  }
+
+  const { res, data } = await call("POST", `/${id}/finalize`);
+  if (res.status !== 409 && res.status < 500) localStorage.removeItem(session.key);
+  if (!res.ok) throw new Error(data.error || "Upload failed");
+  onProgress?.(1);
+  return data;
+}
@@ -346,12 +346,29 @@ export default function GroupDetail() {
       setOnlineMembers(list);
     };
 
+    // coalesced changes after the initial list
+    const deltaHandler = (evt) => {
+      const d = evt.detail || {};
+      if (String(d.groupId || "") !== String(gid)) return;
+      const joined = Array.isArray(d.joined) ? d.joined : [];
+      const left = new Set((d.left || []).map(String));
+      if (!joined.length && !left.size) return;
+      setOnlineMembers((prev) => {
+        const byId = new Map(prev.map((u) => [String(u._id), u]));
+        left.forEach((id) => byId.delete(id));
+        joined.forEach((u) => byId.set(String(u._id), u));
+        return Array.from(byId.values());
+      });
+    };
+
     window.addEventListener("sgh:presence", handler);
+    window.addEventListener("sgh:presence_delta", deltaHandler);
 
     return () => {
       // leave presence when leaving group page
       presenceLeaveGroup(gid, myId);
       window.removeEventListener("sgh:presence", handler);
+      window.removeEventListener("sgh:presence_delta", deltaHandler);
     };
   }, [gid, myId]);
 
@@ -2,6 +2,7 @@
 import { useEffect, useMemo, useState } from "react";
 import { useParams, useNavigate } from "react-router-dom";
 import { toast } from "react-toastify";
+import { uploadResumable } from "../lib/upload";
 
 const API_BASE = import.meta.env.VITE_API_URL || "http://localhost:5050";
 
@@ -132,17 +133,13 @@ export default function GroupResources() {
     if (!fileObj) return toast.info("Select a file first!");
     try {
       setBusyUpload(true);
-      const form = new FormData();
-      form.append("group_id", gid);
-      form.append("file", fileObj);
-      form.append("title", fileTitle);
-      form.append("description", fileDesc);
-      const res = await fetch(`${API_BASE}/api/resources/upload`, {
-        method: "POST",
-        headers: { Authorization: `Bearer ${localStorage.getItem("token") || ""}` },
-        body: form,
+      await uploadResumable({
+        kind: "resource",
+        groupId: gid,
+        file: fileObj,
+        title: fileTitle,
+        description: fileDesc,
       });
-      if (!res.ok) throw new Error(await res.text());
       toast.success("File uploaded!");
       setFileObj(null);
       setFileTitle("");